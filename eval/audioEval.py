@@ -6,21 +6,32 @@
 __author__      = "Roman Machala"
 __date__        = "31.03.2025"
 __version__     = "0.1"         #stable version
-from fastapi import FastAPI, BackgroundTasks, File, UploadFile, Request
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import FastAPI, File, UploadFile, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-import json
 import os
-import pandas as pd
-from modules.plots.analysis import analysis, table, is_valid
+from modules.plots.summary import collect_plots
+from modules.plots.comparison import ComparisonError, get_comparison
 from modules.eval_dataset import eval_dataset
-from modules.handlers.log_handler import log_messages, log_generator
+from modules.jobs import JobManager, JobError
+from modules.handlers.log_handler import log_generator, GLOBAL_CHANNEL
+from modules.handlers.cache_handler import ScoreCache
+from modules.profiling import metrics
+from modules.handlers.job_handler import load_job
+from modules.handlers.dataset_handler import DatasetError, load_dataset, list_datasets, register_dataset, delete_dataset
+from modules.handlers.upload_handler import (UploadError, UploadSizeError, upload_path, copy_file, write_stream,
+                                             register, check_files, complete)
+from starlette.concurrency import run_in_threadpool
 from modules.handlers.samples_handler import load_audios
 from modules.handlers.file_handler import clear_cache
-from modules.constants import UPLOAD_PATH, GRAPHS_PATH, PLOTS_RESULT, SAMPLES_PATH, UPLOAD_DIR
+from modules.handlers.results_handler import read_results, results_files
+from modules.handlers.run_handler import new_run_id, load_run
+from modules.constants import (UPLOAD_PATH, SAMPLES_PATH, UPLOAD_DIR, ALIGNMENT_MODE, UPLOAD_MAX_SIZE, RESULTS_MAX_SIZE,
+                               COMPARISON_RESAMPLES, COMPARISON_KEY, PESQ_WORKERS)
+from modules.alignment import ALIGNERS
+from modules.metrics.registry import MetricSelectionError, select_metrics
 import sys
-import copy
 
 class EvaluationRequest(BaseModel):
     """
@@ -28,13 +39,77 @@ class EvaluationRequest(BaseModel):
         and dataset_path
     """
     meta_file: str
-    root_folder: str
+    root_folder: str | None = None
+    dataset_id: str | None = None
     intrusive: bool
     save_name: str
+    alignment: str = ALIGNMENT_MODE
+    run_id: str | None = None
+    use_cache: bool = True
+    chunk_size: int | None = None
+    segment_length: float | None = None
+    metrics: list[str] | None = None
+    pesq_workers: int = PESQ_WORKERS
+
+class DatasetRequest(BaseModel):
+    """
+        Dataset registration, either a server-local folder (path) or
+        an uploaded folder (upload), existing dataset is refreshed by its ID
+    """
+    name: str | None = None
+    path: str | None = None
+    upload: str | None = None
+    dataset_id: str | None = None
+
+class UploadInfo(BaseModel):
+    """
+        Dataset file to be uploaded, path is relative to the upload folder
+    """
+    path: str
+    size: int
+    sha256: str
+
+class UploadCheckRequest(BaseModel):
+    """
+        Dataset files to be checked before uploading
+    """
+    files: list[UploadInfo]
+
+class UploadCompleteRequest(BaseModel):
+    """
+        Finished chunked upload with expected hash of the file
+    """
+    path: str
+    sha256: str
+
+class ComparisonRequest(BaseModel):
+    """
+        Comparison of uploaded results files, all of them are compared
+        when no files are selected, baseline is the first file by default
+    """
+    files: list[str] | None = None
+    baseline: str | None = None
+    key: str = COMPARISON_KEY
+    resamples: int = COMPARISON_RESAMPLES
 
 #Global variables
 app = FastAPI()
-log_messages = log_messages
+# Evaluation jobs, all of them share one worker pool
+jobs = JobManager()
+
+@app.on_event("startup")
+def start_jobs():
+    """
+        Starts job manager, jobs interrupted by the last shutdown are queued again
+    """
+    jobs.start()
+
+@app.on_event("shutdown")
+def stop_jobs():
+    """
+        Stops job manager, running jobs are resumed after the next start
+    """
+    jobs.shutdown()
 
 @app.get("/")
 async def read_index():
@@ -44,33 +119,193 @@ async def read_index():
     return FileResponse("index.html")
 
 @app.post("/start-evaluation/")
-async def start_evaluation(request: EvaluationRequest, background_tasks: BackgroundTasks):
+async def start_evaluation(request: EvaluationRequest):
     """
         Main function for evaluation starting
-        expects json request containing meta_file and dataset_path
+        expects json request containing meta_file and dataset_path,
+        evaluation is queued as a job
 
         Params:
             request:            dataset_path, meta_file
-            background_tasks:   background tasks
     """
     # Extract parameterrs
-    dataset_path = os.path.join(UPLOAD_DIR, request.root_folder)
+    if request.dataset_id:
+        # registered dataset is evaluated in place
+        dataset = load_dataset(request.dataset_id)
+        if dataset is None:
+            return JSONResponse(content={"message": f"Dataset {request.dataset_id} doesn't exist."}, status_code=404)
+        dataset_path = dataset["path"]
+    elif request.root_folder:
+        dataset_path = os.path.join(UPLOAD_DIR, request.root_folder)
+    else:
+        return JSONResponse(content={"message": "Either uploaded folder or dataset ID has to be selected."}, status_code=400)
     meta_file = os.path.join(dataset_path, request.meta_file)
 
     intrusive = request.intrusive
-    filename = None if len(request.save_name) < 1 else request.save_name + '.json'
-    #TODO handle filename to actually save as desired name
 
     # Checks for existence of parameters
     if not os.path.exists(meta_file):
         return JSONResponse(content={"message": f"Meta file doesn't exists - {request.meta_file}"}, status_code=400)
     if not os.path.exists(dataset_path):
         return JSONResponse(content={"message": "Files were not uploaded correctly."}, status_code=400)
-    # Start evaluation as background task
+    if request.alignment not in ALIGNERS:
+        return JSONResponse(content={"message": f"Unknown alignment mode - {request.alignment}"}, status_code=400)
+    if request.segment_length is not None and request.segment_length <= 0:
+        return JSONResponse(content={"message": "Segment length must be positive."}, status_code=400)
+    if request.pesq_workers < 0:
+        return JSONResponse(content={"message": "Number of PESQ workers can't be negative."}, status_code=400)
+    try:
+        select_metrics(request.metrics, intrusive)
+    except MetricSelectionError as e:
+        return JSONResponse(content={"message": str(e)}, status_code=400)
+    # Same run ID resumes previous evaluation, otherwise a new run is created
+    run_id = request.run_id if request.run_id else new_run_id()
+    resumed = load_run(run_id) is not None
+    # Each job has its own results file
+    filename = request.save_name + '.jsonl' if request.save_name else f"results_{run_id}.jsonl"
     os.makedirs(UPLOAD_PATH, exist_ok=True)
-    background_tasks.add_task(eval_dataset, meta_file, dataset_path, True, intrusive, file_name=filename)
+    params = {
+        "meta": meta_file,
+        "dataset_path": dataset_path,
+        "intrusive": intrusive,
+        "file_name": filename,
+        "alignment": request.alignment,
+        "use_cache": request.use_cache,
+        "chunk_size": request.chunk_size,
+        "segment_length": request.segment_length,
+        "metrics": request.metrics,
+        "pesq_workers": request.pesq_workers,
+    }
+    try:
+        job = jobs.submit(params, job_id=run_id)
+    except JobError as e:
+        return JSONResponse(content={"message": str(e)}, status_code=409)
     # Return response
-    return JSONResponse(content={"message": "Evaluation started"}, status_code=200)
+    return JSONResponse(content={"message": "Evaluation started", "job_id": job["job_id"], "run_id": run_id,
+                                 "status": job["status"], "resumed": resumed}, status_code=200)
+
+@app.get("/datasets/")
+async def get_datasets():
+    """
+        Endpoint listing registered datasets (without file manifests)
+    """
+    return {"datasets": list_datasets()}
+
+@app.get("/datasets/{dataset_id}")
+async def get_dataset(dataset_id: str):
+    """
+        Endpoint for a registered dataset with manifest of its files
+
+        Params:
+            dataset_id:         ID of the dataset
+    """
+    dataset = load_dataset(dataset_id)
+    if dataset is None:
+        return JSONResponse(content={"message": f"Dataset {dataset_id} doesn't exist."}, status_code=404)
+    return dataset
+
+@app.post("/datasets/")
+async def add_dataset(request: DatasetRequest):
+    """
+        Endpoint registering a dataset, files are hashed outside of the event loop
+
+        Params:
+            request:            name and server-local path or uploaded folder
+    """
+    try:
+        # uploaded folder is moved into the registry and tree of a refreshed dataset is replaced
+        folders = [upload_path(request.upload)] if request.upload is not None else list()
+        existing = load_dataset(request.dataset_id) if request.dataset_id and request.upload is not None else None
+        if existing is not None and existing.get("storage") == "content-addressed":
+            folders.append(existing["path"])
+        in_use = [job_id for folder in folders for job_id in jobs.using(folder)]
+        if in_use:
+            return JSONResponse(content={"message": f"Dataset is used by jobs {', '.join(in_use)}."}, status_code=409)
+        dataset = await run_in_threadpool(register_dataset, request.name, request.path, request.upload, request.dataset_id)
+    except (DatasetError, UploadError) as e:
+        return JSONResponse(content={"message": str(e)}, status_code=400)
+    dataset.pop("files")
+    return dataset
+
+@app.delete("/datasets/{dataset_id}")
+async def remove_dataset(dataset_id: str):
+    """
+        Endpoint removing a dataset from the registry, server-local folders are kept
+
+        Params:
+            dataset_id:         ID of the dataset
+    """
+    dataset = load_dataset(dataset_id)
+    if dataset is not None and dataset.get("storage") == "content-addressed":
+        in_use = jobs.using(dataset["path"])
+        if in_use:
+            return JSONResponse(content={"message": f"Dataset is used by jobs {', '.join(in_use)}."}, status_code=409)
+    try:
+        await run_in_threadpool(delete_dataset, dataset_id)
+    except DatasetError as e:
+        return JSONResponse(content={"message": str(e)}, status_code=404)
+    return {"status": "success"}
+
+@app.get("/jobs/")
+async def list_jobs():
+    """
+        Endpoint listing all evaluation jobs with their status
+    """
+    return {"jobs": jobs.list()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+        Endpoint for status, progress and ETA of an evaluation job
+
+        Params:
+            job_id:             ID of the job
+    """
+    try:
+        return jobs.status(job_id)
+    except JobError as e:
+        return JSONResponse(content={"message": str(e)}, status_code=404)
+
+@app.post("/jobs/{job_id}/cancel/")
+async def cancel_job(job_id: str):
+    """
+        Endpoint cancelling an evaluation job, results evaluated so far are kept
+
+        Params:
+            job_id:             ID of the job
+    """
+    try:
+        return jobs.cancel(job_id)
+    except JobError as e:
+        return JSONResponse(content={"message": str(e)}, status_code=400)
+
+def last_event_id(request: Request) -> int:
+    """
+        ID of the last event received by a reconnecting client
+
+        Params:
+            request:            request of the event stream
+
+        Returns:
+            event ID, 0 for a new client
+    """
+    try:
+        return int(request.headers.get("last-event-id", 0))
+    except ValueError:
+        return 0
+
+@app.get("/jobs/{job_id}/events/")
+async def stream_job_events(job_id: str, request: Request):
+    """
+        Endpoint streaming progress events of an evaluation job,
+        a reconnecting client receives events it has missed
+
+        Params:
+            job_id:             ID of the job
+    """
+    if load_job(job_id) is None:
+        return JSONResponse(content={"message": f"Job {job_id} doesn't exist."}, status_code=404)
+    return StreamingResponse(log_generator(job_id, last_event_id(request)), media_type="text/event-stream")
 
 @app.post("/upload/")
 async def upload_files(files: list[UploadFile] = File(...)):
@@ -85,19 +320,18 @@ async def upload_files(files: list[UploadFile] = File(...)):
     # list for valid files
     # For each file in uploaded files
     for file in files:
-        # Read it' content
-        content = await file.read()
-        # Get path of uploaded file
-        file_path = os.path.join(UPLOAD_PATH, file.filename)
-
+        try:
+            # Get path of uploaded file, content is copied in chunks outside of the event loop
+            file_path = upload_path(file.filename, UPLOAD_PATH)
+            await run_in_threadpool(copy_file, file.file, file_path, RESULTS_MAX_SIZE)
+        except Exception:
+            continue # skip invalid or too large file
         try:
             # loads it' content, if it fails, excpetion is raised
-            data = json.loads(content)
-            with open(file_path, 'wb') as f:
-                # creates new file in upload path and dumps it' values into it
-                f.write(content)
+            await run_in_threadpool(read_results, file_path)
             valid_files.append(file.filename)
         except Exception:
+            os.remove(file_path)
             continue # skip invalid file
     # Returns all valid files 
     return {"message": "Upload complete", "valid_files": valid_files}
@@ -107,87 +341,118 @@ async def process_files():
     """
         Endpoint for uploaded file processing 
         - processes uplaoded files, generates graphs and returns
-            graphs paths for vizualization
+            graphs paths for vizualization (see plots/summary.py)
     """
     os.makedirs(exist_ok=True, name=UPLOAD_PATH)
-    os.makedirs(exist_ok=True, name=GRAPHS_PATH)
-    # dict for graphs paths
-    generated_plots = copy.deepcopy(PLOTS_RESULT)
-
-        # Goes through all files in upload path folder
-    for filename in os.listdir(UPLOAD_PATH):
-        file_path = os.path.join(UPLOAD_PATH, filename)
-        try:
-            with open(file_path, 'r') as f:
-                # Gets file content
-                raw_data = json.load(f)
-            # Creates dataframe
-            rows = []
-            for file, metrics in [(i['file'], i['metrics']) for i in raw_data['results']]:
-                metrics['file'] = file
-                rows.append(metrics)
-
-            data = pd.DataFrame(rows)
-            file_name = os.path.splitext(filename)[0]
-            # For each metric that is in column of said dataframe
-            # creates a graph and adds it into the dict
-            for metric in data.columns:
-                if metric != 'file':
-                    if file_name not in generated_plots['tables']['Files']:
-                        generated_plots['tables']['Files'].append(file_name)
-                    plot_path = os.path.join(GRAPHS_PATH, f'{file_name}_{metric}.png')
-                    if is_valid(data, metric):
-                        web_path = plot_path.replace("static" + os.sep, "/static/")
-                        web_path = web_path.replace("\\", "/")
-                        if not os.path.exists(web_path):
-                            analysis(data, metric, plot_path, file_name)
-                        values = table(data, metric)
-                        if metric != 'Mos':
-                            if metric not in generated_plots['tables']['Values']:
-                                generated_plots['tables']['Values'][metric] = list()
-                            generated_plots['tables']['Values'][metric].append(values)
-                        else:
-                            generated_plots['tables']['Values']['ovrl_mos'].append(values[0])
-                            generated_plots['tables']['Values']['sig_mos'].append(values[1])
-                            generated_plots['tables']['Values']['bak_mos'].append(values[2])
-                            generated_plots['tables']['Values']['p808_mos'].append(values[3])
-                    else:
-                        web_path = None
-                        if metric not in generated_plots['tables']['Values']:
-                            generated_plots['tables']['Values'][metric] = list()
-                        generated_plots['tables']['Values'][metric].append([None, None, None, None])
-                    # adds generated graph path to corresponding metric in dict
-                    if metric not in generated_plots['plots']:
-                        generated_plots['plots'][metric] = list()
-                    generated_plots['plots'][metric].append(web_path)
-        except Exception:
-            #TODO better handling, if and exception occurs skips it
-            continue
+    # dict for graphs paths, only new or changed results files are processed
+    # (summaries are cached next to them), graphs are drawn outside of the event loop
+    generated_plots = await run_in_threadpool(collect_plots, UPLOAD_PATH)
     # If there are no generated plots just return error
     if not generated_plots:
         return JSONResponse(status_code=400, content={"error": "No valid file was processed."})
     # Else returns dictionary containing generated graphs paths
     return {"generated_plots": generated_plots}
 
+@app.post('/compare/')
+async def compare_files(request: ComparisonRequest):
+    """
+        Endpoint comparing uploaded results files to a baseline on matching utterances
+        - paired differences, confidence intervals, p-values and win rates (see plots/comparison.py)
+
+        Params:
+            request:            compared files, baseline, join key and number of bootstrap resamples
+    """
+    files = request.files if request.files else results_files(UPLOAD_PATH)
+    if request.baseline and request.baseline not in files:
+        files = [request.baseline] + files
+    if not 1 <= request.resamples <= 100 * COMPARISON_RESAMPLES:
+        return JSONResponse(status_code=400, content={"error": "Invalid number of resamples."})
+    try:
+        paths = [upload_path(file, UPLOAD_PATH) for file in files]
+        baseline = upload_path(request.baseline, UPLOAD_PATH) if request.baseline else None
+        comparison = await run_in_threadpool(get_comparison, paths, baseline, request.key, request.resamples)
+    except (UploadError, ComparisonError) as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return {"comparison": comparison}
+
 @app.post("/upload-files")
 async def upload_files(request: Request):
     """
-        Endpoint for uplaoding files, saves files on server side as temporal files
+        Endpoint for uplaoding files, saves files on server side as temporal files.
+        Files are copied in chunks outside of the event loop and registered
+        with their hash (see /upload-check/).
     """
+    if int(request.headers.get("content-length", 0)) > UPLOAD_MAX_SIZE:
+        return JSONResponse(content={"status": "error", "message": "Upload exceeds maximum size."}, status_code=413)
     form = await request.form()
 
-    for key in form:
-        file = form[key]
-        rel_path = key.replace("\\", "/")
-        save_path = os.path.join(UPLOAD_DIR, rel_path)
-        #creates temp files
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-
-        with open(save_path, "wb") as buffer:
-            buffer.write(await file.read())
+    try:
+        for key in form:
+            file = form[key]
+            #creates temp files
+            save_path = upload_path(key)
+            size, sha256 = await run_in_threadpool(copy_file, file.file, save_path)
+            await run_in_threadpool(register, key, size, sha256)
+    except UploadSizeError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=413)
+    except UploadError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    finally:
+        await form.close()
 
     return JSONResponse(content={"status": "success"})
 
+@app.post("/upload-check/")
+async def upload_check(request: UploadCheckRequest):
+    """
+        Endpoint checking which dataset files have to be uploaded, files with
+        a known hash are not sent again, interrupted uploads continue from their offset
+
+        Params:
+            request:            files with their size and SHA-256 hash
+    """
+    try:
+        files = await run_in_threadpool(check_files, [file.model_dump() for file in request.files])
+    except UploadError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    return {"files": files}
+
+@app.put("/upload-chunk/")
+async def upload_chunk(request: Request, path: str, offset: int = 0):
+    """
+        Endpoint for chunked dataset upload, request body is a chunk of the file
+        starting at offset, it's streamed to disk
+
+        Params:
+            path:               path of the file relative to the upload folder
+            offset:             position of the chunk in the file
+    """
+    try:
+        path = upload_path(path)
+    except UploadError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    try:
+        size = await write_stream(request.stream(), path, offset)
+    except UploadSizeError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=413)
+    except UploadError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=409)
+    return {"offset": size}
+
+@app.post("/upload-complete/")
+async def upload_complete(request: UploadCompleteRequest):
+    """
+        Endpoint finishing chunked upload of a file, hash of the file is verified
+
+        Params:
+            request:            path of the file and its SHA-256 hash
+    """
+    try:
+        size = await run_in_threadpool(complete, request.path, request.sha256)
+    except UploadError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    return {"status": "success", "size": size}
+
 @app.post('/audios/')
 async def get_audios():
     """
@@ -198,11 +463,40 @@ async def get_audios():
     return {"samples": samples}
 
 @app.get("/log-stream/")
-async def stream_logs():
+async def stream_logs(request: Request):
+    """
+        endpoint for log streaming evaluation progress of all jobs to frontend
+    """
+    return StreamingResponse(log_generator(GLOBAL_CHANNEL, last_event_id(request)), media_type="text/event-stream")
+
+def metrics_text() -> str:
+    """
+        Metrics of evaluated results with current load of the job queue and score cache statistics
+    """
+    gauges = jobs.gauges()
+    try:
+        cache = ScoreCache().stats()
+    except Exception:
+        cache = {"hits": None, "misses": None, "entries": None, "size": None}
+    lookups = (cache["hits"] or 0) + (cache["misses"] or 0)
+    return metrics.render([
+        ("audioeval_jobs_queued", "gauge", "Jobs waiting in the queue", gauges["queued"]),
+        ("audioeval_jobs_running", "gauge", "Jobs being evaluated", gauges["running"]),
+        ("audioeval_throughput_lines_per_second", "gauge", "Throughput of running jobs", gauges["throughput"]),
+        ("audioeval_cache_hits_total", "counter", "Scores found in the score cache", cache["hits"]),
+        ("audioeval_cache_misses_total", "counter", "Scores not found in the score cache", cache["misses"]),
+        ("audioeval_cache_hit_ratio", "gauge", "Share of score cache lookups found in the cache",
+         cache["hits"] / lookups if lookups else None),
+        ("audioeval_cache_entries", "gauge", "Scores stored in the score cache", cache["entries"]),
+        ("audioeval_cache_size_bytes", "gauge", "Size of scores stored in the score cache", cache["size"]),
+    ])
+
+@app.get("/metrics")
+async def get_metrics():
     """
-        endpoint for log streaming evaluation progress to frontend
+        Endpoint exposing evaluation metrics in Prometheus text format
     """
-    return StreamingResponse(log_generator(), media_type="text/event-stream")
+    return PlainTextResponse(await run_in_threadpool(metrics_text), media_type="text/plain; version=0.0.4")
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -221,5 +515,10 @@ if __name__ == "__main__":
     #TODO CLI WAY
     from modules.handlers.arg_handler import handle_arguments
     #FOR CLI EVALUATION ONLY 
-    meta, dataset, save, intrusive = handle_arguments(sys.argv)
-    eval_dataset(meta=meta, dataset_path=dataset, web_mode=False, intrusive=True if intrusive == 'true' else False, file_name=save)
+    meta, dataset, save, intrusive, alignment, run_id, cache, workers, chunk_size, segment_length, columnar, pesq_workers, selected_metrics = handle_arguments(sys.argv)
+    eval_dataset(meta=meta, dataset_path=dataset, web_mode=False, intrusive=True if intrusive == 'true' else False, file_name=save,
+                 alignment=alignment if alignment else ALIGNMENT_MODE, run_id=run_id if run_id else None, use_cache=cache != 'false',
+                 max_workers=int(workers) if workers else None, chunk_size=int(chunk_size) if chunk_size else None,
+                 segment_length=float(segment_length) if segment_length else None, columnar=columnar == 'true',
+                 pesq_workers=int(pesq_workers) if pesq_workers else PESQ_WORKERS,
+                 metrics=selected_metrics.split(',') if selected_metrics else None)
@@ -0,0 +1,396 @@
+"""
+    Benchmark suite of the evaluation pipeline. Deterministic speech-like
+    reference and generated audios are synthesized at several lengths, sample
+    rates and sample formats, each stage of the evaluation (loading, resampling,
+    alignment and metrics) is timed separately and end-to-end throughput is
+    measured for several numbers of worker processes. Results are written as
+    a JSON report, reports of two commits can be compared.
+    Runs offline on CPU (DNSMOS models are part of the speechmos package).
+
+    Usage (from the eval folder):
+        python benchmark.py [--quick] [--output report.json] [--baseline old_report.json]
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import argparse
+import concurrent.futures
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from scipy import signal as sp_signal
+from scipy.io import wavfile
+from modules.audio import Audio
+from modules.resampling import resample as resample_signal, POLYPHASE_FILTERS
+from modules.alignment import align
+from modules.metrics.mcd import eval_mcd
+from modules.metrics.pesq import eval_pesq
+from modules.metrics.stoi import eval_stoi, eval_estoi, eval_intelligibility
+from modules.metrics.dnsmos import eval_dnsmos, init_worker
+from modules.eval_dataset import process_chunk
+from modules.scheduler import read_chunks, run_bounded, worker_count
+from modules.handlers.log_handler import convert
+from modules.constants import ALIGNMENT_MODE, CHUNK_SIZE, NON_INTRUSIVE_BATCH, BENCHMARKS_PATH
+
+REPORT_VERSION  = 1
+STAGES          = ["load", "resample", "resample_fast", "resample_medium", "align", "mcd", "pesq", "stoi", "estoi", "intelligibility", "dnsmos"]
+# fixtures of stage benchmark - (duration in seconds, sample rate, sample format)
+FIXTURES        = [(2, 16000, "int16"), (5, 22050, "int16"), (5, 44100, "int32"), (15, 24000, "float32")]
+QUICK_FIXTURES  = [(2, 16000, "int16"), (5, 22050, "float32")]
+WARMUP_FIXTURES = [(1, 16000, "int16"), (1, 22050, "int16")]
+# fixtures of end-to-end benchmark - number of pairs, duration, sample rate
+DATASET         = (32, 3, 22050)
+QUICK_DATASET   = (8, 2, 22050)
+REGRESSION      = 1.2       # stage slower by this factor than in the baseline report is a regression
+
+def speech_like(duration: float, rate: int, seed: int) -> np.ndarray:
+    """
+        Deterministic speech-like signal - glottal pulse train with gliding pitch
+        filtered by changing formants, modulated into syllables separated by pauses
+
+        Params:
+            duration:       length in seconds
+            rate:           sample rate
+            seed:           seed of the random generator
+
+        Returns:
+            float32 signal in range -1 to 1
+    """
+    rng = np.random.default_rng(seed)
+    samples = int(duration * rate)
+    t = np.arange(samples) / rate
+    # pitch contour of 100 - 220 Hz and its pulse train
+    f0 = 160 + 60 * np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, np.pi)) + 5 * rng.standard_normal(samples).cumsum() / np.sqrt(rate)
+    phase = np.cumsum(f0 / rate)
+    source = (np.diff(np.floor(phase), prepend=0) > 0).astype(np.float64) + 0.02 * rng.standard_normal(samples)
+    # formants change every syllable (~ 200 ms)
+    voiced = np.zeros(samples)
+    step = int(0.2 * rate)
+    for start in range(0, samples, step):
+        block = source[max(0, start - 256):start + step]
+        filtered = np.zeros_like(block)
+        for formant, bandwidth in zip(rng.uniform([300, 900, 2200], [900, 2200, 3400]), [80, 120, 160]):
+            formant = min(formant, 0.45 * rate)
+            r = np.exp(-np.pi * bandwidth / rate)
+            filtered += sp_signal.lfilter([1 - r], [1, -2 * r * np.cos(2 * np.pi * formant / rate), r * r], block)
+        voiced[start:start + step] = filtered[min(start, 256):]
+    # syllable envelope with pauses
+    envelope = np.clip(np.sin(2 * np.pi * 2.5 * t) + 0.3, 0, None) * (rng.uniform(0.3, 1.0, samples // step + 1).repeat(step)[:samples])
+    speech = voiced * envelope
+    return (0.8 * speech / (np.abs(speech).max() + 1e-9)).astype(np.float32)
+
+def degrade(reference: np.ndarray, rate: int, seed: int) -> np.ndarray:
+    """
+        Generated counterpart of a reference - slightly slower, delayed and noisy,
+        so alignment and metrics have real work to do
+
+        Params:
+            reference:      reference signal
+            rate:           sample rate
+            seed:           seed of the random generator
+
+        Returns:
+            float32 signal
+    """
+    rng = np.random.default_rng(seed)
+    stretched = np.interp(np.arange(0, len(reference), 0.95), np.arange(len(reference)), reference)
+    delayed = np.concatenate([np.zeros(int(0.05 * rate)), stretched])
+    noisy = delayed + 0.01 * rng.standard_normal(len(delayed))
+    return np.clip(noisy, -1, 1).astype(np.float32)
+
+def write_wav(path: str, audio: np.ndarray, rate: int, sample_format: str):
+    """
+        Writes float signal as WAV in selected sample format
+
+        Params:
+            path:           destination path
+            audio:          float32 signal
+            rate:           sample rate
+            sample_format:  int16, int32 or float32
+    """
+    if sample_format == "int16":
+        audio = (audio * 32767).astype(np.int16)
+    elif sample_format == "int32":
+        audio = (audio.astype(np.float64) * 2147483647).astype(np.int32)
+    wavfile.write(path, rate, audio)
+
+def make_pair(folder: str, name: str, duration: float, rate: int, sample_format: str, seed: int) -> tuple[str, str]:
+    """
+        Writes a reference and generated audio
+
+        Params:
+            folder:         destination folder
+            name:           name of the pair
+            duration:       length of the reference in seconds
+            rate:           sample rate
+            sample_format:  sample format of both files
+            seed:           seed of the pair
+
+        Returns:
+            paths of reference and generated audio relative to the folder
+    """
+    reference = speech_like(duration, rate, seed)
+    paths = (f"ref/{name}.wav", f"gen/{name}.wav")
+    for path, audio in zip(paths, (reference, degrade(reference, rate, seed + 1))):
+        os.makedirs(os.path.join(folder, os.path.dirname(path)), exist_ok=True)
+        write_wav(os.path.join(folder, path), audio, rate, sample_format)
+    return paths
+
+def measure(fn, repeat: int) -> dict:
+    """
+        Times a function
+
+        Params:
+            fn:             function without arguments
+            repeat:         number of runs
+
+        Returns:
+            dict with times in seconds (min, median, mean) and the last returned value
+    """
+    times, value = list(), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "mean": statistics.fmean(times), "runs": repeat, "value": value}
+
+def bench_stages(folder: str, fixtures: list, repeat: int, alignment: str, skip: list[str], verbose: bool = True) -> dict:
+    """
+        Times each stage of intrusive evaluation of one pair per fixture
+
+        Params:
+            folder:         folder of fixtures
+            fixtures:       list of (duration, rate, sample format)
+            repeat:         number of runs of each stage
+            alignment:      alignment mode
+            skip:           stages which aren't measured
+            verbose:        whether to print timings
+
+        Returns:
+            dict of fixture name to stage timings
+    """
+    results = dict()
+    for index, (duration, rate, sample_format) in enumerate(fixtures):
+        name = f"{duration}s_{rate}hz_{sample_format}"
+        ref_path, gen_path = (os.path.join(folder, path) for path in make_pair(folder, name, duration, rate, sample_format, index))
+        # every run starts with new audios, signals of the last run are used by following stages
+        audios = dict()
+        def load():
+            audios["ref"], audios["gen"] = Audio(ref_path), Audio(gen_path)
+            return audios["ref"].normalize(), audios["gen"].normalize()
+        def resample():
+            audios["ref"], audios["gen"] = Audio(ref_path), Audio(gen_path)
+            return audios["ref"].signal(16000), audios["gen"].signal(16000)
+
+        stages = {"load": load, "resample": resample}
+        stage_results = dict()
+        for stage, fn in stages.items():
+            stage_results[stage] = measure(fn, repeat)
+        ref, gen = stage_results["resample"]["value"]
+        # polyphase tiers, the resample stage uses the default tier (RESAMPLE_QUALITY)
+        signal = audios["gen"].normalize()
+        for quality in POLYPHASE_FILTERS:
+            if f"resample_{quality}" not in skip:
+                stage_results[f"resample_{quality}"] = measure(lambda: resample_signal(signal, rate, 16000, quality), repeat)
+        stage_results["align"] = measure(lambda: align(ref, gen, 16000, mode=alignment), repeat)
+        ref_aligned, gen_aligned = stage_results["align"]["value"]
+        metrics = {
+            "mcd": lambda: eval_mcd(ref=ref, gen=gen, rate=16000),
+            "pesq": lambda: eval_pesq(ref_audio=ref_aligned, gen_audio=gen_aligned, rate=16000),
+            "stoi": lambda: eval_stoi(ref_audio=ref_aligned, gen_audio=gen_aligned, rate=16000),
+            "estoi": lambda: eval_estoi(ref_audio=ref_aligned, gen_audio=gen_aligned, rate=16000),
+            # STOI and ESTOI at once, as evaluated by eval_audio
+            "intelligibility": lambda: eval_intelligibility(ref_audio=ref_aligned, gen_audio=gen_aligned, rate=16000),
+            "dnsmos": lambda: eval_dnsmos(gen),
+        }
+        for stage, fn in metrics.items():
+            if stage not in skip:
+                stage_results[stage] = measure(fn, repeat)
+
+        for stage, values in stage_results.items():
+            value = values.pop("value")
+            # real-time factor - seconds of audio processed per second
+            values["realtime"] = duration / values["median"] if values["median"] else None
+            if stage in metrics:
+                values["score"] = value
+        results[name] = {"duration": duration, "rate": rate, "format": sample_format,
+                         "stages": {stage: stage_results[stage] for stage in STAGES if stage in stage_results}}
+        if verbose:
+            print(f"{name}: " + ", ".join(f"{stage} {values['median'] * 1000:.1f} ms" for stage, values in results[name]["stages"].items()))
+    return results
+
+def bench_throughput(folder: str, dataset: tuple, workers: list[int], alignment: str, intrusive: bool) -> dict:
+    """
+        Measures end-to-end throughput of evaluation of a synthetic dataset,
+        the same scheduling as eval_dataset is used (without results files and logging)
+
+        Params:
+            folder:         folder of fixtures
+            dataset:        number of pairs, duration in seconds, sample rate
+            workers:        numbers of worker processes
+            alignment:      alignment mode
+            intrusive:      intrusive or non-intrusive evaluation
+
+        Returns:
+            dict of number of workers to throughput
+    """
+    count, duration, rate = dataset
+    dataset_path = os.path.join(folder, "dataset")
+    meta = os.path.join(folder, "meta.txt")
+    if not os.path.exists(meta):
+        with open(meta, "w") as f:
+            for index in range(count):
+                ref, gen = make_pair(dataset_path, f"utt_{index:04d}", duration, rate, "int16", 1000 + index)
+                f.write(f"{ref} {gen}\n")
+    if not intrusive:
+        with open(meta, "r") as f:
+            generated = [line.split()[1] for line in f]
+        meta = os.path.join(folder, "meta_non_intrusive.txt")
+        with open(meta, "w") as f:
+            f.write("\n".join(generated) + "\n")
+
+    results = dict()
+    for count_of_workers in workers:
+        start = time.perf_counter()
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=count_of_workers, initializer=init_worker)
+        try:
+            # workers are started (and DNSMOS sessions built) before measuring
+            list(executor.map(time.sleep, [0] * count_of_workers))
+            started = time.perf_counter()
+            chunks = read_chunks(meta, CHUNK_SIZE if intrusive else NON_INTRUSIVE_BATCH)
+            evaluated, failed = 0, 0
+            for chunk in run_bounded(executor, process_chunk, chunks, (dataset_path, False, intrusive, alignment, False)):
+                for result in (chunk if isinstance(chunk, list) else [chunk]):
+                    evaluated += 1
+                    failed += isinstance(result, Exception)
+            elapsed = time.perf_counter() - started
+        finally:
+            executor.shutdown()
+        results[str(count_of_workers)] = {
+            "startup": started - start,
+            "seconds": elapsed,
+            "lines": evaluated,
+            "failed": failed,
+            "lines_per_second": evaluated / elapsed,
+            "audio_seconds_per_second": evaluated * duration / elapsed,
+        }
+        print(f"{'intrusive' if intrusive else 'non-intrusive'}, {count_of_workers} workers: "
+              f"{evaluated / elapsed:.2f} lines/s ({failed} failed)")
+    return results
+
+def environment() -> dict:
+    """
+        Description of the machine and code the benchmark ran on
+
+        Returns:
+            dict with commit, python, library versions and cpu count
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    import librosa, pesq, pystoi, onnxruntime
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "libraries": {module.__name__: getattr(module, "__version__", None) for module in (np, librosa, pesq, pystoi, onnxruntime)},
+    }
+
+def compare(report: dict, baseline: dict, threshold: float = REGRESSION) -> list[str]:
+    """
+        Compares median stage times and throughput of two reports
+
+        Params:
+            report:         current report
+            baseline:       report of another commit
+            threshold:      slowdown factor considered a regression
+
+        Returns:
+            list of regressions
+    """
+    regressions = list()
+    print(f"\nComparison with {baseline['environment'].get('commit')}:")
+    for fixture, values in report["stages"].items():
+        for stage, timing in values["stages"].items():
+            previous = baseline.get("stages", dict()).get(fixture, dict()).get("stages", dict()).get(stage)
+            if previous is None:
+                continue
+            ratio = timing["median"] / previous["median"]
+            print(f"  {fixture} {stage}: {previous['median'] * 1000:.1f} -> {timing['median'] * 1000:.1f} ms ({ratio:.2f}x)")
+            if ratio > threshold:
+                regressions.append(f"{fixture} {stage} {ratio:.2f}x slower")
+    for mode, values in report["throughput"].items():
+        for workers, throughput in values.items():
+            previous = baseline.get("throughput", dict()).get(mode, dict()).get(workers)
+            if previous is None:
+                continue
+            ratio = previous["lines_per_second"] / throughput["lines_per_second"]
+            print(f"  {mode} {workers} workers: {previous['lines_per_second']:.2f} -> {throughput['lines_per_second']:.2f} lines/s")
+            if ratio > threshold:
+                regressions.append(f"{mode} throughput with {workers} workers {ratio:.2f}x lower")
+    return regressions
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark of the evaluation pipeline on synthetic audio")
+    parser.add_argument("--quick", action="store_true", help="fewer and shorter fixtures")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs of each stage")
+    parser.add_argument("--workers", type=int, nargs="+", default=None, help="numbers of worker processes of end-to-end benchmark")
+    parser.add_argument("--alignment", default=ALIGNMENT_MODE)
+    parser.add_argument("--skip", nargs="*", default=[], choices=STAGES + ["throughput"], help="parts which aren't measured")
+    parser.add_argument("--output", default=None, help=f"path of the report, {BENCHMARKS_PATH}/<commit>_<time>.json by default")
+    parser.add_argument("--baseline", default=None, help="report of another commit to compare with")
+    parser.add_argument("--threshold", type=float, default=REGRESSION, help="slowdown factor reported as a regression")
+    args = parser.parse_args(argv)
+
+    workers = args.workers or sorted({1, worker_count()})
+    report = {
+        "version": REPORT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "config": {"quick": args.quick, "repeat": args.repeat, "alignment": args.alignment, "workers": workers, "skip": args.skip},
+        "stages": dict(),
+        "throughput": dict(),
+    }
+    folder = tempfile.mkdtemp(prefix="audioeval_benchmark_")
+    try:
+        init_worker()
+        # first calls of libraries (imports, caches, ONNX sessions) aren't measured
+        bench_stages(folder, WARMUP_FIXTURES, 1, args.alignment, args.skip, verbose=False)
+        report["stages"] = bench_stages(folder, QUICK_FIXTURES if args.quick else FIXTURES, args.repeat, args.alignment, args.skip)
+        if "throughput" not in args.skip:
+            dataset = QUICK_DATASET if args.quick else DATASET
+            report["config"]["dataset"] = {"pairs": dataset[0], "duration": dataset[1], "rate": dataset[2]}
+            for intrusive in (True, False):
+                mode = "intrusive" if intrusive else "non_intrusive"
+                report["throughput"][mode] = bench_throughput(folder, dataset, workers, args.alignment, intrusive)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    output = args.output or os.path.join(BENCHMARKS_PATH, f"{report['environment']['commit'] or 'unknown'}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4, default=convert)
+    print(f"Report saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
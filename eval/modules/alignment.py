@@ -0,0 +1,238 @@
+"""
+    This file contains alignment logic for intrusive evaluation.
+    Reference and generated audios are aligned using Dynamic Time Warping
+    either on raw samples (original FastDTW approach) or on frame-level
+    features (MFCC, log-mel) restricted by a Sakoe-Chiba band.
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import numpy as np
+import librosa
+from fastdtw import fastdtw
+from scipy.spatial.distance import euclidean
+from modules.constants import ALIGNMENT_MODE, ALIGNMENT_BAND, ALIGNMENT_HOP
+
+class AlignmentError(Exception):
+    """Selected audios couldn't be aligned"""
+    pass
+
+def mfcc_features(signal: np.ndarray, rate: int, hop: int) -> np.ndarray:
+    """
+        Computes MFCC features used for alignment
+
+        Params:
+            signal:         audio signal
+            rate:           sample rate of the signal
+            hop:            hop length in samples
+
+        Returns:
+            feature matrix of shape (frames, coefficients)
+    """
+    return librosa.feature.mfcc(
+        y=signal.astype(np.float32, copy=False),
+        sr=rate,
+        n_mfcc=20,
+        n_fft=4 * hop,
+        hop_length=hop
+    ).T
+
+def logmel_features(signal: np.ndarray, rate: int, hop: int) -> np.ndarray:
+    """
+        Computes log-mel spectrogram features used for alignment
+
+        Params:
+            signal:         audio signal
+            rate:           sample rate of the signal
+            hop:            hop length in samples
+
+        Returns:
+            feature matrix of shape (frames, mel bands)
+    """
+    mel = librosa.feature.melspectrogram(
+        y=signal.astype(np.float32, copy=False),
+        sr=rate,
+        n_mels=40,
+        n_fft=4 * hop,
+        hop_length=hop
+    )
+    return librosa.power_to_db(mel).T
+
+def banded_dtw(ref: np.ndarray, gen: np.ndarray, band: float = ALIGNMENT_BAND) -> np.ndarray:
+    """
+        Dynamic time warping of two feature sequences restricted by a Sakoe-Chiba band.
+        Each row of the cost matrix is solved at once - within a row the recurrence
+        D[i, j] = c[i, j] + min(D[i-1, j-1], D[i-1, j], D[i, j-1]) is rewritten
+        as a running minimum over a cumulative sum, so only the rows are iterated.
+
+        Params:
+            ref:            reference features (frames, dims)
+            gen:            generated features (frames, dims)
+            band:           band radius as a fraction of the longer sequence
+
+        Returns:
+            warping path as an array of shape (steps, 2)
+    """
+    n, m = len(ref), len(gen)
+    if n == 0 or m == 0:
+        raise AlignmentError("Couldn't align an empty audio.")
+
+    # Band follows the diagonal from (0, 0) to (n-1, m-1), it has to be
+    # wide enough for consecutive rows to overlap
+    radius = max(int(np.ceil(band * max(n, m))), int(np.ceil(m / n)), 1)
+    centers = np.arange(n) * ((m - 1) / max(n - 1, 1))
+    lows = np.clip(np.floor(centers - radius).astype(int), 0, m - 1)
+    highs = np.clip(np.ceil(centers + radius).astype(int), 0, m - 1) + 1
+
+    rows = list()
+    previous = None
+    for i in range(n):
+        lo, hi = lows[i], highs[i]
+        cost = np.linalg.norm(gen[lo:hi] - ref[i], axis=1)
+        # best predecessor from the previous row (diagonal or vertical step)
+        entry = np.full(hi - lo, np.inf)
+        if previous is None:
+            entry[0] = 0.0
+        else:
+            prev_lo, prev_row = previous
+            prev = np.full(hi - lo + 1, np.inf)
+            # prev[k] holds D[i-1, lo - 1 + k]
+            start, stop = max(prev_lo, lo - 1), min(prev_lo + len(prev_row), hi)
+            if start < stop:
+                prev[start - lo + 1:stop - lo + 1] = prev_row[start - prev_lo:stop - prev_lo]
+            entry = np.minimum(prev[:-1], prev[1:])
+        # horizontal steps as running minimum over cumulative cost
+        cumulative = np.cumsum(cost)
+        row = cumulative + np.minimum.accumulate(entry - cumulative + cost)
+        rows.append((lo, row))
+        previous = (lo, row)
+
+    # Backtracking from the last cell
+    def value(i, j):
+        lo, row = rows[i]
+        return row[j - lo] if lo <= j < lo + len(row) else np.inf
+
+    i, j = n - 1, m - 1
+    path = [(i, j)]
+    while i > 0 or j > 0:
+        if i == 0:
+            j -= 1
+        elif j == 0:
+            i -= 1
+        else:
+            steps = ((i - 1, j - 1), (i - 1, j), (i, j - 1))
+            i, j = min(steps, key=lambda s: value(*s))
+        path.append((i, j))
+
+    return np.array(path[::-1], dtype=np.int64)
+
+def expand_path(path: np.ndarray, hop: int, ref_length: int, gen_length: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Maps frame level warping path back to sample indices. Each step
+        of the path covers one hop of samples in both audios.
+
+        Params:
+            path:           frame warping path (steps, 2)
+            hop:            hop length in samples
+            ref_length:     number of reference samples
+            gen_length:     number of generated samples
+
+        Returns:
+            sample indices for reference and generated audio
+    """
+    offsets = np.arange(hop)
+    ref_idx = (path[:, 0, None] * hop + offsets).ravel()
+    gen_idx = (path[:, 1, None] * hop + offsets).ravel()
+    # last frames may exceed the signal length
+    valid = (ref_idx < ref_length) & (gen_idx < gen_length)
+    return ref_idx[valid], gen_idx[valid]
+
+def align_samples(ref: np.ndarray, gen: np.ndarray, rate: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Original sample level alignment using FastDTW on raw signals.
+        Kept available for comparison of scores, considerably slower.
+
+        Params:
+            ref:            reference signal
+            gen:            generated signal
+            rate:           sample rate of both signals
+
+        Returns:
+            aligned reference and generated signals
+    """
+    _, path = fastdtw(ref.reshape(-1, 1), gen.reshape(-1, 1), dist=euclidean)
+    path = np.asarray(path)
+    return ref[path[:, 0]], gen[path[:, 1]]
+
+def align_features(ref: np.ndarray, gen: np.ndarray, rate: int, mode: str, ref_features: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Feature domain alignment, warping path is computed on frames
+        and mapped back to samples
+
+        Params:
+            ref:            reference signal
+            gen:            generated signal
+            rate:           sample rate of both signals
+            mode:           feature mode, one of FEATURES
+            ref_features:   precomputed reference features
+
+        Returns:
+            aligned reference and generated signals
+    """
+    hop = int(rate * ALIGNMENT_HOP)
+    if ref_features is None:
+        ref_features = FEATURES[mode](ref, rate, hop)
+    path = banded_dtw(ref_features, FEATURES[mode](gen, rate, hop))
+    ref_idx, gen_idx = expand_path(path, hop, len(ref), len(gen))
+    return ref[ref_idx], gen[gen_idx]
+
+# Features of feature domain alignment modes
+FEATURES = {
+    "mfcc": mfcc_features,
+    "logmel": logmel_features,
+}
+
+# Available alignment modes, new ones can be registered here
+ALIGNERS = {
+    "sample": align_samples,
+    "mfcc": lambda ref, gen, rate, **kwargs: align_features(ref, gen, rate, "mfcc", **kwargs),
+    "logmel": lambda ref, gen, rate, **kwargs: align_features(ref, gen, rate, "logmel", **kwargs),
+}
+
+def alignment_features(signal: np.ndarray, rate: int, mode: str = ALIGNMENT_MODE) -> np.ndarray | None:
+    """
+        Features used by selected alignment mode, can be precomputed for reference audios
+
+        Params:
+            signal:         audio signal
+            rate:           sample rate of the signal
+            mode:           alignment mode
+
+        Returns:
+            feature matrix or None for modes without features
+    """
+    if mode not in FEATURES:
+        return None
+    return FEATURES[mode](signal, rate, int(rate * ALIGNMENT_HOP))
+
+def align(ref: np.ndarray, gen: np.ndarray, rate: int, mode: str = ALIGNMENT_MODE, ref_features: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Aligns reference and generated signal using selected mode
+
+        Params:
+            ref:            reference signal
+            gen:            generated signal
+            rate:           sample rate of both signals
+            mode:           alignment mode, one of ALIGNERS
+            ref_features:   precomputed reference features (see alignment_features)
+
+        Returns:
+            aligned reference and generated signals of equal length
+    """
+    if mode not in ALIGNERS:
+        raise AlignmentError(f"Unknown alignment mode - {mode}")
+    if ref_features is not None:
+        return ALIGNERS[mode](ref, gen, rate, ref_features=ref_features)
+    return ALIGNERS[mode](ref, gen, rate)
@@ -0,0 +1,245 @@
+"""
+    This file contains audio loading layer used by all metrics.
+    Each file is decoded once, normalized float32 signal and its
+    resampled views are cached and shared by all metrics.
+    Long recordings are memory-mapped and can be read in windows,
+    so incremental metrics work on a bounded working set.
+"""
+import os
+from collections import OrderedDict
+from typing import Iterator
+import numpy as np
+from scipy.io import wavfile
+from modules.resampling import resample, resample_batch, resample_stream
+from modules.constants import REFERENCE_CACHE_SIZE, MMAP_THRESHOLD, AUDIO_WINDOW
+from modules.profiling import stage
+
+class Audio:
+    """
+    A class representing audio
+    """
+    def __init__(self, filename: str, mmap: bool = None):
+        """
+            Params:
+                filename:   path to the audio
+                mmap:       whether to memory-map the file instead of reading it,
+                            None to memory-map files larger than MMAP_THRESHOLD
+        """
+        self.filename = filename
+        if mmap is None:
+            mmap = os.path.getsize(filename) > MMAP_THRESHOLD
+        self.lazy = False
+        with stage("load"):
+            if mmap:
+                try:
+                    self.rate, self.audio = wavfile.read(filename, mmap=True)
+                    self.lazy = True
+                except ValueError:
+                    # some formats (e.g. 24-bit PCM) can't be memory-mapped
+                    pass
+            if not self.lazy:
+                self.rate, self.audio = wavfile.read(filename)
+        # float32 views of the signal, keyed by sample rate
+        self.views = dict()
+        # derived features (spectrograms, alignment features), keyed by name
+        self.features = dict()
+
+    def resample(self, new_sr) -> np.ndarray:
+        """
+        A method for resampling original audio
+        in case some methods explicitly needs a specific sample rate
+
+        Args:
+            new_sr      : new sample rate
+
+        Returns:
+            normalized float32 signal at new sample rate
+        """
+        return self.signal(new_sr)
+
+    @classmethod
+    def from_signal(cls, filename: str, signal: np.ndarray, rate: int) -> "Audio":
+        """
+            Creates audio from an already decoded signal (e.g. a segment of another audio)
+
+            Params:
+                filename:   name of the original audio
+                signal:     normalized float32 signal
+                rate:       sample rate of the signal
+
+            Returns:
+                audio
+        """
+        audio = cls.__new__(cls)
+        audio.filename = filename
+        audio.rate, audio.audio = rate, signal
+        audio.lazy = False
+        audio.views = {rate: signal}
+        audio.features = dict()
+        return audio
+
+    def __len__(self) -> int:
+        return len(self.audio)
+
+    @property
+    def duration(self) -> float:
+        """Duration of the audio in seconds"""
+        return len(self.audio) / self.rate
+
+    def window(self, start: int, stop: int) -> np.ndarray:
+        """
+            Normalized float32 mono samples of selected range at original
+            sample rate, only this range is read from a memory-mapped file
+
+            Params:
+                start:      first sample
+                stop:       sample after the last one
+
+            Returns:
+                normalized np.array
+        """
+        frames = self.audio[start:stop]
+        if self.audio.dtype == np.int16:
+            audio = frames.astype(np.float32) / 32768.0
+        elif self.audio.dtype == np.int32:
+            audio = frames.astype(np.float32) / 2147483648.0
+        elif self.audio.dtype == np.uint8:
+            audio = (frames.astype(np.float32) - 128) / 128.0
+        else:
+            audio = np.array(frames, dtype=np.float32)
+        if audio.ndim > 1:
+            audio = audio.mean(axis=1, dtype=np.float32)
+        return audio
+
+    def normalize(self) -> np.ndarray:
+        """
+            Method for normalization.
+            wavfile reads file as ints or floats, dnsmos
+            expects values in a range from -1 to 1.
+            Multichannel audio is mixed down to mono.
+
+            Returns:
+                normalized np.array
+        """
+        if self.rate not in self.views:
+            with stage("load"):
+                if not self.lazy:
+                    self.views[self.rate] = self.window(0, len(self.audio))
+                else:
+                    # converted window by window, without full length temporaries
+                    audio = np.empty(len(self.audio), dtype=np.float32)
+                    step = AUDIO_WINDOW * self.rate
+                    for start in range(0, len(audio), step):
+                        audio[start:start + step] = self.window(start, start + step)
+                    self.views[self.rate] = audio
+        return self.views[self.rate]
+
+    def signal(self, rate: int = 16000) -> np.ndarray:
+        """
+            Normalized float32 signal at selected sample rate,
+            computed once and shared by all metrics
+
+            Params:
+                rate:       sample rate
+
+            Returns:
+                normalized np.array
+        """
+        if rate not in self.views:
+            # reading of a memory-mapped file is a part of its resampling
+            with stage("resample"):
+                if self.lazy:
+                    self.views[rate] = np.concatenate([np.zeros(0, dtype=np.float32), *self.iter_windows(rate)])
+                else:
+                    self.views[rate] = resample(self.normalize(), self.rate, rate)
+        return self.views[rate]
+
+    def iter_windows(self, rate: int = 16000, window: float = AUDIO_WINDOW) -> Iterator[np.ndarray]:
+        """
+            Normalized float32 signal at selected sample rate in consecutive windows,
+            resampled on demand, so only one window is held in memory
+
+            Params:
+                rate:       sample rate
+                window:     window length in seconds
+
+            Returns:
+                generator of signal windows
+        """
+        if rate in self.views:
+            # already computed signal is only sliced
+            signal = self.views[rate]
+            step = int(window * rate)
+            for start in range(0, len(signal), step):
+                yield signal[start:start + step]
+            return
+        step = int(window * self.rate)
+        stream = resample_stream(self.rate, rate) if rate != self.rate else None
+        for start in range(0, len(self.audio), step):
+            chunk = self.window(start, start + step)
+            last = start + step >= len(self.audio)
+            if stream is not None:
+                chunk = stream.resample_chunk(chunk, last=last)
+            if len(chunk):
+                yield chunk
+
+    def feature(self, name: str, compute) -> np.ndarray:
+        """
+            Derived feature of the audio, computed once
+
+            Params:
+                name:       name of the feature
+                compute:    function computing the feature
+
+            Returns:
+                feature
+        """
+        if name not in self.features:
+            self.features[name] = compute()
+        return self.features[name]
+
+def resample_audios(audios: list["Audio"], rate: int = 16000):
+    """
+        Computes signals of many audios at selected sample rate, audios with
+        the same original sample rate are resampled at once. Memory-mapped
+        audios are left out, they are resampled window by window.
+
+        Params:
+            audios:     audios
+            rate:       sample rate
+    """
+    groups = dict()
+    for audio in audios:
+        if not audio.lazy and rate not in audio.views:
+            groups.setdefault(audio.rate, list()).append(audio)
+    for orig_rate, group in groups.items():
+        signals = [audio.normalize() for audio in group]
+        with stage("resample"):
+            for audio, signal in zip(group, resample_batch(signals, orig_rate, rate)):
+                audio.views[rate] = signal
+
+# Reference audios of current process, least recently used are dropped
+references = OrderedDict()
+
+def load_reference(filename: str) -> Audio:
+    """
+        Loads reference audio, references are memoized per process together
+        with their resampled signals and features, so a reference compared
+        with many generated audios is analyzed only once
+
+        Params:
+            filename:       path to the reference audio
+
+        Returns:
+            reference audio
+    """
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    if key in references:
+        references.move_to_end(key)
+        return references[key]
+    audio = Audio(filename)
+    references[key] = audio
+    if len(references) > REFERENCE_CACHE_SIZE:
+        references.popitem(last=False)
+    return audio
@@ -2,36 +2,110 @@
     this file contains constants used in the aduio evaluation system.
 """
 
-RESULTS_FILE    = "results.json"
+RESULTS_FILE    = "results.jsonl"
+RESULTS_BATCH   = 50         # number of results buffered before writing to the results file
 GRAPHS_PATH     = 'static/graphs'
 UPLOAD_PATH     = 'uploads'
 UPLOAD_DIR      = 'temp_files'
 SAMPLES_PATH    = 'static/samples'
+RUNS_PATH       = 'runs'
+JOBS_PATH       = 'jobs'
+BENCHMARKS_PATH = 'benchmarks'    # reports of benchmark.py
+DATASETS_PATH   = 'datasets'        # registered datasets (see handlers/dataset_handler.py)
+CACHE_PATH      = 'cache/scores.sqlite'
+CACHE_MAX_SIZE  = 256 * 1024 * 1024     # maximum size of cached scores in bytes
 NUM_OF_SAMPLES  = 5
+SUMMARY_SUFFIX  = '.summary.json'       # summary of a results file (tables and graphs) stored next to it
+SUMMARY_VERSION = 2                     # increase when changing how summaries are computed
+COLUMNAR_SUFFIX = '.npz'                # columnar results archive (see handlers/columnar_handler.py)
+
+# Comparison of runs (see plots/comparison.py)
+COMPARISONS_PATH = 'cache/comparisons'  # cached comparisons
+COMPARISON_VERSION = 2                  # increase when changing how comparisons are computed
+COMPARISON_KEY = 'utterance'            # default join key of compared runs (see plots/comparison.py)
+COMPARISON_RESAMPLES = 1000             # number of bootstrap resamples
+COMPARISON_CHUNK = 100                  # number of bootstrap resamples drawn at once
+COMPARISON_FRAMES = 32                  # number of loaded runs kept in memory
+LOWER_IS_BETTER = ["Mcd"]               # metrics where a lower value is better (win rates)
+
+# Uploads (see handlers/upload_handler.py)
+UPLOAD_CHUNK    = 1024 * 1024           # bytes written to disk at once
+UPLOAD_MAX_SIZE = 16 * 1024 ** 3        # maximum size of one uploaded dataset file or request in bytes
+RESULTS_MAX_SIZE = 1024 ** 3            # maximum size of one uploaded results file in bytes
+UPLOAD_INDEX    = '.uploads.json'       # hashes of uploaded files, stored in UPLOAD_DIR
 
 # General structure of response for visualization
-# Automatically adds new metrics based on provided json file
-# If you want to remove any metrics - just remove the function for it's call
-# and finally remove all mentions of this function below to not display empty sections in web
+# Metrics are added based on provided results files (see modules/plots/summary.py),
+# files without a metric have empty values of it, so rows of all tables match "Files"
 PLOTS_RESULT = {
-    "plots":{
-        "Pesq": [],
-        "Stoi": [],
-        "Estoi": [],
-        "Mcd": [],
-        "Mos": []
-    },
+    "plots": {},
     "tables": {
         "Files": [],
-        "Values": {
-            "Pesq": [],
-            "Stoi" : [],
-            "Estoi": [],
-            "Mcd": [],
-            "ovrl_mos": [],
-            "sig_mos" : [],
-            "bak_mos": [],
-            "p808_mos": []
-        }
+        "Values": {}
     },
-}
\ No newline at end of file
+}
+# Scheduling of evaluation
+MAX_WORKERS     = None      # number of worker processes, None for half of cpu count
+CHUNK_SIZE      = 4         # number of meta file lines sent to a worker at once (intrusive mode)
+IN_FLIGHT_PER_WORKER = 2    # maximum number of pending chunks per worker
+REFERENCE_CACHE_SIZE = 16   # number of reference audios (with features) memoized per worker
+MAX_JOBS        = 2         # number of evaluation jobs of the web application running at once (sharing one worker pool)
+PESQ_WORKERS    = 0         # processes of a separate PESQ pool scoring batches of aligned pairs, 0 scores PESQ in evaluation workers
+PESQ_BATCH      = 8         # number of aligned pairs scored in one PESQ task
+
+# Instrumentation of evaluation stages (see modules/profiling.py)
+PROFILE_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]  # upper bounds (seconds) of stage latency histograms
+
+# Evaluation events streamed to the web application (see handlers/log_handler.py)
+EVENT_BUFFER    = 500       # number of last events of a channel kept for reconnecting clients
+EVENT_CHANNELS  = 32        # number of channels (jobs) kept, least recently used are dropped
+EVENT_KEEPALIVE = 15        # seconds without events after which a keepalive comment is sent
+
+# Distributed evaluation through a queue on a shared filesystem (see modules/distributed.py)
+QUEUE_PATH      = 'queue'
+QUEUE_MAX_PENDING = 64      # maximum number of units waiting in the queue of one run
+HEARTBEAT_INTERVAL = 5      # seconds between heartbeats of a worker evaluating a unit
+HEARTBEAT_TIMEOUT = 60      # units of workers without heartbeat for this long (seconds) are queued again
+POLL_INTERVAL   = 1         # seconds between scans of the queue
+
+# Lazy loading of long recordings
+MMAP_THRESHOLD  = 64 * 1024 * 1024  # files larger than this (bytes) are memory-mapped instead of read
+AUDIO_WINDOW    = 30        # length of a window (seconds) when long audio is processed incrementally
+
+# Resampling of signals (see modules/resampling.py)
+# tiers: "fast" and "medium" (polyphase filters), "high" (soxr, same as librosa.resample)
+# the tier is a part of score cache keys
+RESAMPLE_QUALITY = "high"
+POLYPHASE_MAX_FACTOR = 1024 # ratios with larger up/down factors (e.g. 44056 Hz -> 16 kHz) are resampled by soxr
+RESAMPLE_FILTERS = 16       # number of polyphase filters (ratio and tier) kept per process
+
+# Segmented evaluation of long recordings (intrusive mode)
+SEGMENT_LENGTH  = None      # target segment length in seconds, None disables segmented evaluation
+SEGMENT_SEARCH  = 2.0       # cut points are placed into silence within this distance (seconds) from the target
+SEGMENT_HOP     = 0.05      # frame hop in seconds of coarse alignment used to map cut points
+
+# DNSMOS inference, ONNX sessions are created once per worker process
+DNSMOS_INTRA_THREADS = 1    # threads within an operator (workers already run in parallel)
+DNSMOS_INTER_THREADS = 1    # threads between operators
+DNSMOS_BATCH    = 16        # number of 9 s segments scored in one inference call
+NON_INTRUSIVE_BATCH = 32    # number of meta file lines evaluated together in non-intrusive mode
+
+# Alignment of reference and generated audio for intrusive metrics
+# modes: "sample" (FastDTW on raw samples), "mfcc", "logmel"
+ALIGNMENT_MODE  = "mfcc"
+ALIGNMENT_BAND  = 0.2       # Sakoe-Chiba band radius, fraction of the longer sequence
+ALIGNMENT_HOP   = 0.01      # frame hop in seconds for feature alignment
+
+# Versions of metric implementations, cached scores of older versions are not used
+# Increase the version when changing how a metric is computed
+METRIC_VERSIONS = {
+    "Mcd": 2,
+    "Pesq": 2,
+    "Stoi": 3,
+    "Estoi": 3,
+    "Mos": 2
+}
+
+# MCD settings (milliseconds), same as defaults of compare_audio_files
+MCD_N_FFT       = 32
+MCD_HOP         = 8
@@ -0,0 +1,375 @@
+"""
+    This file contains distributed evaluation across several machines.
+    The coordinator shards the meta file into work units and places them
+    into a queue on a shared filesystem, any number of workers (on any machine
+    with access to the queue and the dataset) claim units, evaluate them and
+    store their results back. Units of workers which stopped sending heartbeats
+    are queued again. The coordinator writes the usual results file.
+
+    Queue of a run (QUEUE_PATH/<run_id>/):
+        pending/<unit>.pkl              units waiting for a worker
+        claimed/<unit>.<worker>.pkl     units being evaluated, modification time is the heartbeat
+        done/<unit>.pkl                 results of evaluated units
+
+    Score cache of workers (CACHE_PATH, relative to the working folder) is SQLite
+    in WAL mode and has to stay on a local disk of each machine, workers
+    mustn't be started from a folder on the shared filesystem.
+
+    Usage (from eval folder):
+        python -m modules.distributed coordinator --meta_file meta.txt --dataset_path /data --intrusive
+        python -m modules.distributed worker
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import argparse
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+import pickle
+import shutil
+import socket
+import threading
+import time
+from modules.eval_dataset import eval_dataset
+from modules.metrics.dnsmos import init_worker
+from modules.constants import (QUEUE_PATH, QUEUE_MAX_PENDING, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, POLL_INTERVAL,
+                               ALIGNMENT_MODE, SEGMENT_LENGTH, PESQ_WORKERS)
+from modules.handlers.log_handler import log_event
+from modules.handlers.run_handler import new_run_id
+
+def write_atomic(path: str, obj):
+    """
+        Pickles object into a file, the file appears at once
+
+        Params:
+            path:           path to the file
+            obj:            object to be stored
+    """
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(obj, f)
+    os.replace(path + ".tmp", path)
+
+def read_pickle(path: str):
+    """
+        Loads pickled object
+
+        Params:
+            path:           path to the file
+
+        Returns:
+            stored object
+    """
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+class QueueExecutor(concurrent.futures.Executor):
+    """
+        Executor placing submitted calls into a queue on a shared filesystem,
+        calls are evaluated by workers (see run_worker). Can be passed to eval_dataset.
+    """
+    def __init__(self, path: str, max_pending: int = QUEUE_MAX_PENDING):
+        """
+            Params:
+                path:           queue folder of the run
+                max_pending:    maximum number of units in the queue
+        """
+        self.path = path
+        for folder in ("pending", "claimed", "done"):
+            os.makedirs(os.path.join(path, folder), exist_ok=True)
+        # limit of units in flight used by eval_dataset (see scheduler.in_flight)
+        self.max_pending = max_pending
+        self.futures = dict()
+        self.counter = itertools.count()
+        # time when each claimed unit was first seen, rename of a claimed unit keeps its old modification time
+        self.claims = dict()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.monitor = threading.Thread(target=self.watch, daemon=True)
+        self.monitor.start()
+
+    def submit(self, fn, *args, **kwargs) -> concurrent.futures.Future:
+        """
+            Places a call into the queue
+
+            Params:
+                fn:             module level function evaluated by a worker
+                args, kwargs:   its arguments
+
+            Returns:
+                future of the result
+        """
+        unit = f"{time.time_ns()}-{next(self.counter)}"
+        future = concurrent.futures.Future()
+        with self.lock:
+            self.futures[unit] = future
+        write_atomic(os.path.join(self.path, "pending", f"{unit}.pkl"), (fn, args, kwargs))
+        return future
+
+    def watch(self):
+        """
+            Monitor thread - resolves futures of finished units, queues units
+            of lost workers again and removes cancelled units
+        """
+        while not self.stopped.wait(POLL_INTERVAL):
+            try:
+                self.collect()
+            except OSError as e:
+                log_event(f"Queue scan failed - {e}")
+
+    def collect(self):
+        """
+            One scan of the queue
+        """
+        done_path = os.path.join(self.path, "done")
+        for name in sorted(os.listdir(done_path)):
+            if not name.endswith(".pkl"):
+                continue
+            unit = name[:-len(".pkl")]
+            path = os.path.join(done_path, name)
+            with self.lock:
+                future = self.futures.pop(unit, None)
+            try:
+                if future is not None and not future.cancelled():
+                    kind, value = read_pickle(path)
+                    if kind == "error":
+                        future.set_exception(value)
+                    else:
+                        future.set_result(value)
+            except Exception as e:
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            # results of units evaluated twice (re-queued unit of a slow worker) are dropped
+            for stale in (path, os.path.join(self.path, "pending", name)):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+        now = time.time()
+        claimed_path = os.path.join(self.path, "claimed")
+        claimed = os.listdir(claimed_path)
+        self.claims = {name: self.claims.get(name, now) for name in claimed}
+        for name in claimed:
+            path = os.path.join(claimed_path, name)
+            try:
+                if now - max(os.path.getmtime(path), self.claims[name]) > HEARTBEAT_TIMEOUT:
+                    unit = name.split(".")[0]
+                    os.rename(path, os.path.join(self.path, "pending", f"{unit}.pkl"))
+                    log_event(f"Worker {name.split('.')[1]} was lost, unit {unit} was queued again.")
+            except (FileNotFoundError, IndexError):
+                continue
+
+        with self.lock:
+            cancelled = [unit for unit, future in self.futures.items() if future.cancelled()]
+            for unit in cancelled:
+                del self.futures[unit]
+        for unit in cancelled:
+            try:
+                os.remove(os.path.join(self.path, "pending", f"{unit}.pkl"))
+            except FileNotFoundError:
+                pass
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        """
+            Stops the monitor thread
+
+            Params:
+                wait:           whether to wait for the monitor thread
+                cancel_futures: whether to cancel units not claimed by workers
+        """
+        if cancel_futures:
+            with self.lock:
+                futures = list(self.futures.values())
+            for future in futures:
+                future.cancel()
+            self.collect()
+        self.stopped.set()
+        if wait:
+            self.monitor.join()
+
+def claim(queue_path: str, worker_id: str) -> str | None:
+    """
+        Claims the oldest pending unit of any run in the queue
+
+        Params:
+            queue_path:     queue folder
+            worker_id:      ID of the worker
+
+        Returns:
+            path to the claimed unit or None if there is no pending unit
+    """
+    if not os.path.exists(queue_path):
+        return None
+    for run in sorted(os.listdir(queue_path)):
+        pending = os.path.join(queue_path, run, "pending")
+        if not os.path.isdir(pending):
+            continue
+        for name in sorted(os.listdir(pending)):
+            if not name.endswith(".pkl"):
+                continue
+            claimed = os.path.join(queue_path, run, "claimed", f"{name[:-len('.pkl')]}.{worker_id}.pkl")
+            try:
+                # rename is atomic, only one worker gets the unit
+                os.rename(os.path.join(pending, name), claimed)
+                return claimed
+            except FileNotFoundError:
+                continue
+    return None
+
+def release(path: str):
+    """
+        Finishes a claimed unit, claimed file is removed
+
+        Params:
+            path:           path to the claimed unit
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # unit was queued again in the meantime
+
+def run_worker(queue_path: str = QUEUE_PATH, worker_id: str = None, processes: int = 1, idle: float = None):
+    """
+        Worker loop, claims and evaluates units until stopped. Units are evaluated
+        by child processes, the main process keeps sending heartbeats of claimed units.
+
+        Params:
+            queue_path:     queue folder
+            worker_id:      ID of the worker, host name and process ID by default
+            processes:      number of units evaluated at once
+            idle:           seconds without any pending unit after which the worker stops, None to run forever
+    """
+    worker_id = (worker_id or f"{socket.gethostname()}-{os.getpid()}").replace(".", "-")
+    processes = max(1, processes)
+    context = multiprocessing.get_context("spawn")
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=init_worker, mp_context=context)
+    running = dict()
+    log_event(f"Worker {worker_id} started.")
+    last_unit = time.time()
+    while True:
+        # Claims units for free processes
+        while len(running) < processes:
+            path = claim(queue_path, worker_id)
+            if path is None:
+                break
+            try:
+                fn, args, kwargs = read_pickle(path)
+            except FileNotFoundError:
+                continue  # unit was queued again
+            running[pool.submit(fn, *args, **kwargs)] = path
+
+        if not running:
+            if idle is not None and time.time() - last_unit > idle:
+                break
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        done, _ = concurrent.futures.wait(running, timeout=HEARTBEAT_INTERVAL, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future, path in running.items():
+            if future not in done:
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+        broken = False
+        for future in done:
+            path = running.pop(future)
+            try:
+                result = ("result", future.result())
+            except concurrent.futures.process.BrokenProcessPool:
+                broken = True
+                running[future] = path
+                break
+            except Exception as e:
+                result = ("error", e)
+            run_path = os.path.dirname(os.path.dirname(path))
+            unit = os.path.basename(path).split(".")[0]
+            try:
+                write_atomic(os.path.join(run_path, "done", f"{unit}.pkl"), result)
+            except FileNotFoundError:
+                pass  # run already finished
+            release(path)
+            last_unit = time.time()
+        if broken:
+            # a process crashed, all units of the pool are given back to the queue
+            for path in running.values():
+                unit = os.path.basename(path).split(".")[0]
+                try:
+                    os.rename(path, os.path.join(os.path.dirname(os.path.dirname(path)), "pending", f"{unit}.pkl"))
+                except FileNotFoundError:
+                    pass
+            running.clear()
+            pool.shutdown(wait=False)
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=init_worker, mp_context=context)
+    pool.shutdown()
+    log_event(f"Worker {worker_id} stopped.")
+
+def coordinate(meta: str, dataset_path: str = None, intrusive: bool = False, file_name: str = None, alignment: str = ALIGNMENT_MODE,
+               run_id: str = None, use_cache: bool = True, chunk_size: int = None, segment_length: float = SEGMENT_LENGTH,
+               queue_path: str = QUEUE_PATH, pesq_workers: int = PESQ_WORKERS, metrics: list[str] = None) -> str:
+    """
+        Evaluates a dataset using workers connected to the queue,
+        results are merged into the results file as in local evaluation
+
+        Params:
+            meta:           meta file path
+            dataset_path:   dataset path, must be accessible by all workers
+            intrusive:      whether to assess audios using intrusive methods
+            file_name:      results file name
+            alignment:      alignment mode used for intrusive metrics
+            run_id:         ID of the run, an existing run is resumed
+            use_cache:      whether workers reuse cached scores
+            chunk_size:     number of lines in one unit
+            segment_length: target segment length in seconds for segmented evaluation
+            queue_path:     queue folder shared with the workers
+            pesq_workers:   processes of a local PESQ pool scoring pairs aligned by the workers, 0 to score PESQ by the workers
+            metrics:        names of evaluated metrics, None for all metrics of the evaluation mode
+
+        Returns:
+            final status of the run
+    """
+    run_id = run_id if run_id else new_run_id()
+    # workers may run in other folders
+    dataset_path = os.path.abspath(dataset_path) if dataset_path else None
+    executor = QueueExecutor(os.path.join(queue_path, run_id))
+    try:
+        return eval_dataset(meta, dataset_path, web_mode=False, intrusive=intrusive, file_name=file_name, alignment=alignment,
+                            run_id=run_id, use_cache=use_cache, chunk_size=chunk_size, segment_length=segment_length,
+                            executor=executor, cleanup=False, pesq_workers=pesq_workers, metrics=metrics)
+    finally:
+        executor.shutdown(cancel_futures=True)
+        shutil.rmtree(executor.path, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed evaluation using a queue on a shared filesystem")
+    parser.add_argument("--queue", default=QUEUE_PATH, help="queue folder shared by the coordinator and workers")
+    roles = parser.add_subparsers(dest="role", required=True)
+
+    coordinator = roles.add_parser("coordinator", help="shards the meta file and merges results")
+    coordinator.add_argument("--meta_file", required=True)
+    coordinator.add_argument("--dataset_path", default=None)
+    coordinator.add_argument("--save_path", default=None)
+    coordinator.add_argument("--intrusive", action="store_true")
+    coordinator.add_argument("--alignment", default=ALIGNMENT_MODE)
+    coordinator.add_argument("--run_id", default=None)
+    coordinator.add_argument("--no_cache", action="store_true")
+    coordinator.add_argument("--chunk_size", type=int, default=None)
+    coordinator.add_argument("--segment_length", type=float, default=SEGMENT_LENGTH)
+    coordinator.add_argument("--pesq_workers", type=int, default=PESQ_WORKERS, help="processes of the PESQ pool of the coordinator")
+    coordinator.add_argument("--metrics", nargs="+", default=None, help="evaluated metrics, all metrics of the evaluation mode by default")
+
+    worker = roles.add_parser("worker", help="evaluates units of the queue")
+    worker.add_argument("--worker_id", default=None)
+    worker.add_argument("--processes", type=int, default=1, help="number of units evaluated at once")
+    worker.add_argument("--idle", type=float, default=None, help="stop after this many seconds without work")
+
+    args = parser.parse_args()
+    if args.role == "coordinator":
+        coordinate(args.meta_file, args.dataset_path, args.intrusive, args.save_path, args.alignment, args.run_id,
+                   not args.no_cache, args.chunk_size, args.segment_length, args.queue, args.pesq_workers, args.metrics)
+    else:
+        run_worker(args.queue, args.worker_id, args.processes, args.idle)
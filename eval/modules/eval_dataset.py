@@ -8,20 +8,28 @@ __author__      = "Roman Machala"
 __date__        = "14.12.2024"
 __version__     = "0.1"
 
-import numpy as np
-from scipy.io import wavfile
-import librosa
-from fastdtw import fastdtw
-from scipy.spatial.distance import euclidean
 import os
-from modules.metrics.pesq import eval_pesq, PesqEvaluationError
-from modules.metrics.stoi import eval_stoi, eval_estoi, StoiEvaluationError
-from modules.metrics.mcd import eval_mcd
-from speechmos import dnsmos
-from modules.constants import RESULTS_FILE, UPLOAD_PATH, SAMPLES_PATH
+import numpy as np
+from modules.metrics.pesq import eval_pesq_batch, PesqPair
+from modules.metrics.dnsmos import eval_dnsmos_batch, init_worker
+from modules.metrics.registry import METRICS, GENERATED, ALIGNED, Inputs, eval_mos, select_metrics, plan_cost
+from modules.audio import Audio, load_reference, resample_audios
+from modules.segmentation import split
+from modules.scheduler import worker_count, read_chunks, count_lines, run_bounded, in_flight
+from modules import profiling
+from modules.profiling import Profile, RunProfile, profiled, stage, merge_profiles
+from modules.constants import (RESULTS_FILE, UPLOAD_PATH, SAMPLES_PATH, ALIGNMENT_MODE, ALIGNMENT_BAND, ALIGNMENT_HOP,
+                               NON_INTRUSIVE_BATCH, MAX_WORKERS, CHUNK_SIZE, SEGMENT_LENGTH, PESQ_WORKERS, PESQ_BATCH,
+                               IN_FLIGHT_PER_WORKER, RESAMPLE_QUALITY)
 import concurrent.futures
-from speechmos import dnsmos
-from modules.handlers.log_handler import log_event, save_results, convert
+import threading
+import time
+from typing import Callable, Iterator
+from modules.handlers.log_handler import log_event, progress_info
+from modules.handlers.results_handler import ResultsWriter
+from modules.handlers.columnar_handler import convert_results
+from modules.handlers.cache_handler import ScoreCache, get_cache, file_hash, score_key
+from modules.handlers.run_handler import new_run_id, load_run, save_run, line_hash, completed_lines
 from modules.handlers.file_handler import delete_temp_files
 from modules.handlers.samples_handler import load_audios
 
@@ -41,46 +49,6 @@ class MGCCalculationError(Exception):
     """An error has occured during MGC calculation"""
     pass
 
-class Audio:
-    """
-    A class representing audio
-    """
-    def __init__(self, filename: str):
-        self.filename = filename
-        self.rate, self.audio = wavfile.read(filename)
-
-    def resample(self, new_sr) -> np.ndarray:
-        """
-        A method for resampling original audio 
-        in case some methods explicitly needs a specific sample rate
-
-        Args:
-            new_sr      : new sample rate
-        """
-        return librosa.resample(
-            y=self.audio.astype(np.float64),
-            orig_sr=self.rate,
-            target_sr=new_sr
-        )
-    
-    def normalize(self) -> np.ndarray:
-        """
-            Method for normalization.
-            wavfile reads file as ints or floats, dnsmos
-            expects values in a range from -1 to 1.
-
-            Returns:
-                normalized np.array
-        """
-        if self.audio.dtype == np.int16:
-            return self.audio.astype(np.float32) / 32768.0
-        elif self.audio.dtype == np.int32:
-            return self.audio.astype(np.float32) / 2147483648.0
-        elif self.audio.dtype == np.uint8:
-            return (self.audio.astype(np.float32) - 128) / 128.0
-        else:
-            return self.audio.astype(np.float32)
-
 def get_audios(line: str, dataset_path: str) -> list[Audio]:
     """
     Function to get reference and gen audio from meta file line
@@ -98,75 +66,130 @@ def get_audios(line: str, dataset_path: str) -> list[Audio]:
         raise InvalidMetaFileValue("Invalid line in meta file - couldn't load both: reference and generated sample.")
     
     if dataset_path:
-        return [Audio(os.path.join(
-                    dataset_path,
-                    file_paths[0]
-                )),
-                Audio(os.path.join(
-                    dataset_path,
-                    file_paths[1]
-                ))
-                ]
-    
-    # Returns audios as correct paths
-    return [Audio(file_paths[0], Audio(file_paths[1]))]
+        file_paths = [os.path.join(dataset_path, path) for path in file_paths]
+
+    # Returns audios as correct paths, references are memoized with their features
+    return [load_reference(file_paths[0]), Audio(file_paths[1])]
+
+def expand_line(line: str) -> list[str]:
+    """
+    Expands multi-system meta file line (one reference, several generated audios)
+    into lines of reference and generated pairs, lines of the same reference
+    stay together so its features are computed only once
+
+    Params:
+        line            : one line from meta file
+
+    Returns:
+        list of lines
+    """
+    file_paths = line.strip().split()
+    if len(file_paths) <= 2:
+        return [line]
+    return [f"{file_paths[0]} {generated}\n" for generated in file_paths[1:]]
 
-def eval_audio(ref_audio: Audio, gen_audio: Audio):
+def cached_score(cache: ScoreCache, key: str, compute):
     """
-    Evaluates audios using predetermined set of evaluation metrics
+    Returns score from the cache, missing score is computed and stored
 
     Params:
-        ref_audio       : reference audio
+        cache           : score cache or None when caching is disabled
+        key             : cache key of the score
+        compute         : function computing the score
+
+    Returns:
+        score
+    """
+    if cache is not None:
+        value = cache.get(key)
+        if value is not None:
+            return value
+    value = compute()
+    # Failed evaluations and deferred scores (see pesq_stage) aren't cached
+    if cache is not None and value is not None and value != "NaN" and not isinstance(value, PesqPair):
+        cache.put(key, value)
+    return value
+
+def eval_audio(ref_audio: Audio | None, gen_audio: Audio, alignment: str = ALIGNMENT_MODE, cache: ScoreCache = None,
+               defer_pesq: bool = False, metrics: list[str] = None) -> dict:
+    """
+    Evaluates audios using selected metrics (see modules/metrics/registry.py),
+    only stages needed by these metrics are computed
+
+    Params:
+        ref_audio       : reference audio, None in non-intrusive evaluation
         gen_audio       : generated audio
-    
+        alignment       : alignment mode (see modules/alignment.py)
+        cache           : score cache, cached scores aren't recomputed
+        defer_pesq      : PESQ isn't scored, aligned audios are returned as PesqPair
+                          to be scored in a batch by the PESQ pool (see pesq_stage)
+        metrics         : names of metrics, None for all metrics of the evaluation mode
+
     Returns: 
-        a set of values
+        dict of metric name to its value
     """
-    if ref_audio.rate != 16000:
-        temp_ref = ref_audio.resample(16000)
-    else:
-        temp_ref = ref_audio.audio
-    if gen_audio.rate != 16000:
-        temp_gen = gen_audio.resample(16000)
+    if metrics is None:
+        metrics = select_metrics(None, intrusive=ref_audio is not None)
+    hashes = [file_hash(ref_audio.filename) if ref_audio is not None else None, file_hash(gen_audio.filename)] \
+        if cache is not None else None
+    # all scores depend on the resampling tier, scores of aligned signals also on the alignment
+    resampling = {"resample": RESAMPLE_QUALITY}
+    settings = {**resampling, "alignment": alignment, "band": ALIGNMENT_BAND, "hop": ALIGNMENT_HOP}
+    inputs = Inputs(ref_audio, gen_audio, alignment, deferred=("Pesq",) if defer_pesq else ())
+
+    scores = dict()
+    for name in metrics:
+        metric = METRICS[name]
+        key = None
+        if hashes:
+            # generated-only scores depend only on the generated audio
+            key = score_key(name, hashes[1:], resampling) if metric.inputs == GENERATED else \
+                score_key(name, hashes, settings if metric.inputs == ALIGNED else resampling)
+        def compute():
+            try:
+                return metric.evaluate(inputs)
+            except metric.errors as e:
+                return "NaN"
+        scores[name] = cached_score(cache, key, compute)
+        if isinstance(scores[name], PesqPair):
+            scores[name].key = key
+    return scores
+
+def get_generated_audio(line: str, dataset_path: str) -> Audio:
+    """
+    Function to get generated audio from meta file line (non-intrusive evaluation)
+
+    Params:
+        line            : one line from meta file
+        dataset_path    : in case paths in meta file are relative
+
+    Returns:
+        generated audio
+    """
+    if " " in line:
+        audio_path = line.strip().split(" ")[1]
     else:
-        temp_gen = gen_audio.audio
-    # FOR PESQ, STOI and ESTOI evaluation
-    ref_audio_2d = temp_ref.reshape(-1, 1)
-    gen_audio_2d = temp_gen.reshape(-1, 1)
+        audio_path = line.strip()
+    return Audio(audio_path if dataset_path is None else os.path.join(dataset_path, audio_path))
 
-    # Dynamic time warping on raw audios
-    distance, path = fastdtw(ref_audio_2d, gen_audio_2d, dist=euclidean)
-    ref_1d = np.array([temp_ref[p[0]] for p in path])
-    gen_1d = np.array([temp_gen[p[1]] for p in path])
+def make_result(line: str, scores: dict) -> dict:
+    """
+        Creates result record of one meta file line
 
-    #ref, gen contains alligned audios
-    
-    # Alligned MGC are used for MCD evaluation
-    try:
-        mcd = eval_mcd(ref=ref_audio.filename, gen=gen_audio.filename)
-    except Exception as e:
-        mcd = "NaN"
-    # Raw signals alligned are used for PESQ, STOI and ESTOI evaluation
-    try:
-        pesq = eval_pesq(ref_audio=ref_1d, gen_audio=gen_1d, rate=16000)
-    except PesqEvaluationError as e:
-        pesq = "NaN"
-    try:
-        stoi = eval_stoi(ref_audio=ref_1d, gen_audio=gen_1d, rate=ref_audio.rate)
-    except StoiEvaluationError as e:
-        stoi = "NaN"
-    try:
-        estoi = eval_estoi(ref_audio=ref_1d, gen_audio=gen_1d, rate=ref_audio.rate)
-    except StoiEvaluationError as e:
-        estoi = "NaN"
-    try:
-        mos = dnsmos.run(gen_audio.normalize(), 16000)
-    except Exception as e:
-        mos = "NaN"
+        Params:
+            line:           line from meta file
+            scores:         evaluated values of metrics
 
-    return mcd, pesq, stoi, estoi, mos
+        Returns:
+            result record
+    """
+    return {
+        "file": line.strip(),
+        "metrics": {name: value if value else None for name, value in scores.items()},
+    }
 
-def process_line(line: str, dataset_path: str, web_mode: bool, intrusive: bool = False):
+def process_line(line: str, dataset_path: str, web_mode: bool, intrusive: bool = False, alignment: str = ALIGNMENT_MODE,
+                 use_cache: bool = True, defer_pesq: bool = False, metrics: list[str] = None):
     """
         Function to evaluate audios specificated by line in meta file
 
@@ -175,45 +198,392 @@ def process_line(line: str, dataset_path: str, web_mode: bool, intrusive: bool =
             dataset_path:   path to dataset
             web_mode:       logging mode
             intrusive:      whether to assess audios using intrusive methods
+            alignment:      alignment mode used for intrusive metrics
+            use_cache:      whether to use score cache of current process
+            defer_pesq:     whether PESQ is scored later in a batch (see pesq_stage)
+            metrics:        names of evaluated metrics, None for all metrics of the evaluation mode
 
         Returns:
             results of evaluation
     """
+    cache = get_cache() if use_cache else None
     try:
-        # Gets reference and generated audio
-        if intrusive:
-            try:
-                ref_audio, gen_audio = get_audios(line=line, dataset_path=dataset_path)
-            except InvalidMetaFileValue as e:
-                raise e
-            # Gets evaluation
-            mcd, pesq, stoi, estoi, mos = eval_audio(ref_audio=ref_audio, gen_audio=gen_audio)
-        else:
-            if " " in line:
-                audio_path = line.strip().split(" ")[1]
+        # stages of the line are recorded into its profile
+        with profiled() as profile:
+            # Gets reference and generated audio
+            if intrusive:
+                try:
+                    ref_audio, gen_audio = get_audios(line=line, dataset_path=dataset_path)
+                except InvalidMetaFileValue as e:
+                    raise e
+                # Gets evaluation
+                scores = eval_audio(ref_audio=ref_audio, gen_audio=gen_audio, alignment=alignment, cache=cache,
+                                    defer_pesq=defer_pesq, metrics=metrics)
             else:
-                audio_path = line.strip()
-            gen_audio = Audio(audio_path if dataset_path is None else os.path.join(dataset_path, audio_path))
-            mos = dnsmos.run(gen_audio.normalize(), 16000)
-            mcd, pesq, stoi, estoi = None, None, None, None
+                gen_audio = get_generated_audio(line, dataset_path)
+                scores = eval_audio(ref_audio=None, gen_audio=gen_audio, cache=cache, metrics=metrics)
         # result handling
-        result = {
-            "file": line.strip(),
-            "metrics": {
-                "Mcd": mcd if mcd else None,
-                "Pesq": pesq if pesq else None,
-                "Stoi": stoi if stoi else None,
-                "Estoi": estoi if estoi else None,
-                "Mos": mos
-            },
-        }
+        result = make_result(line, scores)
+        result["profile"] = profile.to_dict()
         return result
 
     except Exception as e:
         # In case of an error
         raise e
-    
-def eval_dataset(meta: str, dataset_path: str = None, web_mode: bool=False, intrusive: bool=False, file_name: str=None):
+
+def process_batch(lines: list[str], dataset_path: str, web_mode: bool, use_cache: bool = True, metrics: list[str] = None) -> list:
+    """
+        Non-intrusive evaluation of many meta file lines,
+        all generated audios are scored by DNSMOS in one batched call,
+        other selected metrics are evaluated line by line
+
+        Params:
+            lines:          lines from meta file
+            dataset_path:   path to dataset
+            web_mode:       logging mode
+            use_cache:      whether to use score cache of current process
+            metrics:        names of evaluated metrics, None for all non-intrusive metrics
+
+        Returns:
+            list of results, an exception for lines which couldn't be evaluated
+    """
+    metrics = metrics if metrics is not None else select_metrics(None, intrusive=False)
+    others = [name for name in metrics if name != "Mos"]
+    cache = get_cache() if use_cache else None
+    results = [None] * len(lines)
+    scores = [dict() for _ in lines]
+    profiles = [Profile() for _ in lines]
+    pending = list()
+    for index, line in enumerate(lines):
+        try:
+            with profiled(profiles[index]):
+                gen_audio = get_generated_audio(line, dataset_path)
+                scores[index].update(eval_audio(ref_audio=None, gen_audio=gen_audio, cache=cache, metrics=others))
+                if "Mos" not in metrics:
+                    continue
+                key = score_key("Mos", [file_hash(gen_audio.filename)], {"resample": RESAMPLE_QUALITY}) if cache is not None else None
+                mos = cache.get(key) if cache is not None else None
+                if mos is None and gen_audio.lazy:
+                    # long recordings are scored incrementally, not held in the batch
+                    try:
+                        mos = eval_mos(gen_audio)
+                        if cache is not None:
+                            cache.put(key, mos)
+                    except Exception:
+                        mos = "NaN"
+                elif mos is None:
+                    pending.append((index, key, gen_audio))
+                scores[index]["Mos"] = mos
+        except Exception as e:
+            results[index] = e
+
+    batch_scores = list()
+    with profiled() as batch:
+        if pending:
+            # audios with the same sample rate are resampled at once
+            resample_audios([audio for _, _, audio in pending], 16000)
+            signals = [audio.signal(16000) for _, _, audio in pending]
+            with stage("dnsmos"):
+                batch_scores = eval_dnsmos_batch(signals)
+    for (index, key, _), mos in zip(pending, batch_scores):
+        if cache is not None and mos != "NaN":
+            cache.put(key, mos)
+        scores[index]["Mos"] = mos
+        # time of batched stages is split evenly between its audios
+        for name in batch.wall:
+            profiles[index].add(name, batch.wall[name] / len(pending), batch.cpu[name] / len(pending))
+    for index, line in enumerate(lines):
+        if results[index] is None:
+            # metrics in order of the selection
+            results[index] = make_result(line, {name: scores[index].get(name) for name in metrics})
+            results[index]["profile"] = profiles[index].to_dict()
+    return results
+
+def process_chunk(lines: list[str], dataset_path: str, web_mode: bool, intrusive: bool = False, alignment: str = ALIGNMENT_MODE,
+                  use_cache: bool = True, defer_pesq: bool = False, metrics: list[str] = None) -> list:
+    """
+        Evaluates a chunk of meta file lines in one worker call
+
+        Params:
+            lines:          lines from meta file
+            dataset_path:   path to dataset
+            web_mode:       logging mode
+            intrusive:      whether to assess audios using intrusive methods
+            alignment:      alignment mode used for intrusive metrics
+            use_cache:      whether to use score cache of current process
+            defer_pesq:     whether PESQ is scored later in a batch (see pesq_stage)
+            metrics:        names of evaluated metrics, None for all metrics of the evaluation mode
+
+        Returns:
+            list of results, an exception for lines which couldn't be evaluated
+    """
+    if not intrusive:
+        return process_batch(lines, dataset_path, web_mode, use_cache, metrics)
+    results = list()
+    for line in lines:
+        try:
+            results.append(process_line(line, dataset_path, web_mode, intrusive, alignment, use_cache, defer_pesq, metrics))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def plan_chunk(lines: list[str], dataset_path: str, segment_length: float) -> list:
+    """
+        Splits reference and generated audios of meta file lines into aligned segments
+
+        Params:
+            lines:          lines from meta file
+            dataset_path:   path to dataset
+            segment_length: target segment length in seconds
+
+        Returns:
+            list of segment lists (one for each line), an exception for lines which couldn't be split
+    """
+    results = list()
+    for line in lines:
+        try:
+            ref_audio, gen_audio = get_audios(line=line, dataset_path=dataset_path)
+            bounds = split(ref_audio.signal(16000), gen_audio.signal(16000), 16000, segment_length)
+            results.append([
+                {"line": line, "index": index, "count": len(bounds), "ref": (ref_start, ref_stop), "gen": (gen_start, gen_stop)}
+                for index, (ref_start, ref_stop, gen_start, gen_stop) in enumerate(bounds)
+            ])
+        except Exception as e:
+            results.append(e)
+    return results
+
+def process_segments(segments: list[dict], dataset_path: str, alignment: str = ALIGNMENT_MODE, metrics: list[str] = None) -> list[dict]:
+    """
+        Evaluates segments of reference and generated audios
+
+        Params:
+            segments:       segments created by plan_chunk
+            dataset_path:   path to dataset
+            alignment:      alignment mode used for intrusive metrics
+            metrics:        names of evaluated metrics, None for all metrics
+
+        Returns:
+            list of segment results
+    """
+    results = list()
+    for segment in segments:
+        (ref_start, ref_stop), (gen_start, gen_stop) = segment["ref"], segment["gen"]
+        result = {
+            "line": segment["line"],
+            "index": segment["index"],
+            "count": segment["count"],
+            "start": ref_start / 16000,
+            "stop": ref_stop / 16000,
+            "gen_start": gen_start / 16000,
+            "gen_stop": gen_stop / 16000,
+        }
+        try:
+            # segments of one line are mostly in the same chunk, both audios are memoized
+            file_paths = segment["line"].strip().split()
+            if dataset_path:
+                file_paths = [os.path.join(dataset_path, path) for path in file_paths]
+            with profiled() as profile:
+                ref_audio, gen_audio = load_reference(file_paths[0]), load_reference(file_paths[1])
+                ref_part = Audio.from_signal(ref_audio.filename, ref_audio.signal(16000)[ref_start:ref_stop], 16000)
+                gen_part = Audio.from_signal(gen_audio.filename, gen_audio.signal(16000)[gen_start:gen_stop], 16000)
+                # scores of segments aren't cached, cache keys address whole files
+                result["metrics"] = make_result(segment["line"], eval_audio(ref_part, gen_part, alignment, metrics=metrics))["metrics"]
+            result["profile"] = profile.to_dict()
+        except Exception as e:
+            result["error"] = str(e)
+        results.append(result)
+    return results
+
+def aggregate(values: list, weights: list):
+    """
+        Weighted mean of segment scores, segments which couldn't be evaluated are skipped
+
+        Params:
+            values:         scores of segments (numbers, MOS dicts, None or "NaN")
+            weights:        durations of segments
+
+        Returns:
+            aggregated score
+    """
+    pairs = [(value, weight) for value, weight in zip(values, weights) if value is not None and value != "NaN"]
+    if not pairs:
+        return "NaN" if any(value == "NaN" for value in values) else None
+    if isinstance(pairs[0][0], dict):
+        return {key: aggregate([value[key] for value, _ in pairs], [weight for _, weight in pairs]) for key in pairs[0][0]}
+    return float(np.average([value for value, _ in pairs], weights=[weight for _, weight in pairs]))
+
+def segmented_result(segments: list[dict]) -> dict:
+    """
+        Creates result record of a line evaluated in segments,
+        metrics are aggregated as means weighted by segment duration
+
+        Params:
+            segments:       results of all segments of one line
+
+        Returns:
+            result record with per segment results
+    """
+    segments = sorted(segments, key=lambda segment: segment["index"])
+    evaluated = [segment for segment in segments if "metrics" in segment]
+    weights = [segment["stop"] - segment["start"] for segment in evaluated]
+    names = dict.fromkeys(metric for segment in evaluated for metric in segment["metrics"])
+    metrics = {metric: aggregate([segment["metrics"][metric] for segment in evaluated], weights) for metric in names}
+    return {
+        "file": segments[0]["line"].strip(),
+        "metrics": metrics,
+        "profile": merge_profiles([segment["profile"] for segment in segments if "profile" in segment]),
+        "segments": [
+            {key: segment[key] for key in ("start", "stop", "gen_start", "gen_stop", "metrics", "error") if key in segment}
+            for segment in segments
+        ],
+    }
+
+def eval_segmented(executor: concurrent.futures.Executor, chunks, dataset_path: str, alignment: str,
+                   segment_length: float, chunk_size: int, metrics: list[str] = None):
+    """
+        Segmented evaluation, lines are split into segments by the workers, segments
+        are then scored in parallel and collected back into one record per line
+
+        Params:
+            executor:       worker pool
+            chunks:         chunks of meta file lines
+            dataset_path:   path to dataset
+            alignment:      alignment mode used for intrusive metrics
+            segment_length: target segment length in seconds
+            chunk_size:     number of segments sent to a worker at once
+            metrics:        names of evaluated metrics, None for all metrics
+
+        Returns:
+            generator of result records, an exception for lines which couldn't be evaluated
+    """
+    errors = list()
+    def segment_chunks():
+        """Chunks of segments, filled as soon as lines are split"""
+        chunk = list()
+        for results in run_bounded(executor, plan_chunk, chunks, (dataset_path, segment_length)):
+            for result in results if isinstance(results, list) else [results]:
+                if isinstance(result, Exception):
+                    errors.append(result)
+                    continue
+                chunk.extend(result)
+                while len(chunk) >= chunk_size:
+                    yield chunk[:chunk_size]
+                    chunk = chunk[chunk_size:]
+        if chunk:
+            yield chunk
+
+    collected = dict()
+    for results in run_bounded(executor, process_segments, segment_chunks(), (dataset_path, alignment, metrics)):
+        while errors:
+            yield errors.pop(0)
+        if isinstance(results, Exception):
+            yield results
+            continue
+        for segment in results:
+            line = segment["line"]
+            collected.setdefault(line, list()).append(segment)
+            # line is completed once all its segments are scored
+            if len(collected[line]) == segment["count"]:
+                yield segmented_result(collected.pop(line))
+    yield from errors
+    for line in collected:
+        yield InvalidMetaFileValue(f"Some segments of {line.strip()} couldn't be evaluated.")
+
+def score_pesq_batch(pairs: list[tuple[np.ndarray, np.ndarray, int]]) -> tuple[list, list[dict]]:
+    """
+        Task of the PESQ pool, scores a batch of pairs (see eval_pesq_batch) and profiles each of them
+
+        Params:
+            pairs:          list of (reference, generated, sample rate)
+
+        Returns:
+            list of scores (or errors), list of profiles of pairs
+    """
+    scores, profiles = list(), list()
+    for pair in pairs:
+        with profiled() as profile:
+            with stage("pesq"):
+                scores.extend(eval_pesq_batch([pair]))
+        profiles.append(profile.to_dict())
+    return scores, profiles
+
+def pesq_stage(results: Iterator, executor: concurrent.futures.Executor, batch_size: int = PESQ_BATCH,
+               use_cache: bool = True, max_pending: int = None) -> Iterator:
+    """
+        PESQ stage of the evaluation, deferred PESQ pairs of results are collected into
+        batches scored by the PESQ pool while workers evaluate other lines. Results
+        without a deferred pair are passed through. A pair which couldn't be scored
+        gets "NaN" and its error is stored in the result ("errors").
+
+        Params:
+            results:        results of evaluation workers
+            executor:       PESQ pool
+            batch_size:     number of pairs scored in one task
+            use_cache:      whether to store computed scores into the score cache
+            max_pending:    maximum number of pending batches, by default based on the size of the pool
+
+        Returns:
+            generator of result records, in order of completion
+    """
+    cache = get_cache() if use_cache else None
+    batch, pending = list(), dict()
+    max_pending = max_pending if max_pending else in_flight(executor)
+
+    def submit():
+        if batch:
+            pairs = [(pair.ref_audio, pair.gen_audio, pair.rate) for pair in (result["metrics"]["Pesq"] for result in batch)]
+            pending[executor.submit(score_pesq_batch, pairs)] = list(batch)
+            batch.clear()
+
+    def finished(block: bool):
+        # a full window of batches waits for the first one
+        done, _ = concurrent.futures.wait(pending, timeout=None if block else 0,
+                                          return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            records = pending.pop(future)
+            try:
+                scores, profiles = future.result()
+            except Exception as e:
+                scores, profiles = [e] * len(records), [dict()] * len(records)
+            for record, score, profile in zip(records, scores, profiles):
+                pair = record["metrics"]["Pesq"]
+                # time of PESQ pool is a part of the line profile
+                record["profile"] = merge_profiles([record.get("profile", dict()), profile])
+                if isinstance(score, Exception):
+                    record["metrics"]["Pesq"] = "NaN"
+                    record.setdefault("errors", dict())["Pesq"] = str(score) or type(score).__name__
+                else:
+                    record["metrics"]["Pesq"] = score
+                    if cache is not None and pair.key:
+                        cache.put(pair.key, score)
+                yield record
+
+    try:
+        for result in results:
+            if isinstance(result, dict) and isinstance(result["metrics"].get("Pesq"), PesqPair):
+                batch.append(result)
+                if len(batch) >= batch_size:
+                    submit()
+            else:
+                yield result
+            if pending:
+                yield from finished(block=len(pending) >= max_pending)
+        submit()
+        while pending:
+            yield from finished(block=True)
+    finally:
+        for future in pending:
+            future.cancel()
+        if hasattr(results, "close"):
+            # pending chunks of evaluation workers are dropped as well
+            results.close()
+
+def eval_dataset(meta: str, dataset_path: str = None, web_mode: bool=False, intrusive: bool=False, file_name: str=None, alignment: str = ALIGNMENT_MODE,
+                 run_id: str = None, use_cache: bool = True, max_workers: int = MAX_WORKERS, chunk_size: int = None,
+                 segment_length: float = SEGMENT_LENGTH, executor: concurrent.futures.Executor = None,
+                 progress: Callable[[int, int], None] = None, cancel: threading.Event = None, cleanup: bool = True,
+                 columnar: bool = False, pesq_workers: int = PESQ_WORKERS, profile: RunProfile = None, metrics: list[str] = None,
+                 pesq_executor: concurrent.futures.Executor = None):
     """
         Main function responsible for evaluation
         goes through every line in meta file and gets audio names
@@ -223,47 +593,179 @@ def eval_dataset(meta: str, dataset_path: str = None, web_mode: bool=False, intr
             meta:           meta file path, containing meta data
             dataset_path:   dataset path containing audios
             web_mode:       flag, responsible for logging into CLI console or to the web application
+            alignment:      alignment mode used for intrusive metrics
+            run_id:         ID of the run, an existing run is resumed with its original parameters
+            use_cache:      whether to reuse cached scores of unchanged audios
+            max_workers:    number of worker processes, None for half of cpu count
+            chunk_size:     number of lines sent to a worker at once
+            segment_length: target segment length in seconds, long audios are evaluated in segments (intrusive mode only)
+            executor:       shared worker pool, a new one is created when not given
+            progress:       function called as progress(done, total) after each result
+            cancel:         event stopping the evaluation when set
+            cleanup:        whether to delete the uploaded dataset after the evaluation
+            columnar:       whether to convert results of a completed evaluation into a columnar archive
+            pesq_workers:   number of processes of a separate PESQ pool scoring batches of aligned pairs,
+                            0 scores PESQ within evaluation workers (intrusive mode without segments only)
+            profile:        profile of the run aggregating stage times of results, a new one when not given
+            metrics:        names of evaluated metrics (see modules/metrics/registry.py), None for all metrics of the evaluation mode,
+                            metrics needing reference audio are skipped in non-intrusive evaluation
+            pesq_executor:  shared PESQ pool used when pesq_workers is set, the run keeps at most IN_FLIGHT_PER_WORKER
+                            batches per PESQ worker pending in it, a new pool is created when not given
+
+        Returns:
+            final status of the run, "completed" or "cancelled"
     """
-    log_event("Evaluation started.", web_mode)
-    if not file_name:
-        file_name = os.path.join(UPLOAD_PATH, RESULTS_FILE)
+    run = load_run(run_id) if run_id else None
+    resumed = run is not None
+    if resumed:
+        # Resuming existing run, parameters of the run are used
+        meta, dataset_path = run["meta"], run["dataset_path"]
+        intrusive, alignment, file_name = run["intrusive"], run["alignment"], run["results_file"]
+        segment_length, metrics = run.get("segment_length"), run.get("metrics")
+        log_event(f"Resuming evaluation {run_id}.", web_mode, channel=run_id)
     else:
-        file_name = os.path.join(UPLOAD_PATH, file_name)
-    # Get all lines in meta file
-    with open(meta, "r") as f:
-        lines = f.readlines()
+        if not file_name:
+            file_name = os.path.join(UPLOAD_PATH, RESULTS_FILE)
+        else:
+            file_name = os.path.join(UPLOAD_PATH, file_name)
+        run = {
+            "run_id": run_id if run_id else new_run_id(),
+            "meta": meta,
+            "dataset_path": dataset_path,
+            "intrusive": intrusive,
+            "alignment": alignment,
+            "segment_length": segment_length,
+            "results_file": file_name,
+        }
+    # unknown metrics fail before the run is saved
+    selected = run["metrics"] = select_metrics(metrics, intrusive)
+    # events of the run are published into its own channel (web mode)
+    channel = run["run_id"]
+    if not resumed:
+        log_event("Evaluation started.", web_mode, channel=channel)
+    log_event(f"Run ID: {channel}", web_mode, channel=channel)
+    skipped = [name for name in (metrics or []) if name.strip().lower() not in {name.lower() for name in selected}]
+    if skipped:
+        log_event(f"Metrics {', '.join(skipped)} need reference audios, they aren't evaluated in non-intrusive evaluation.",
+                  web_mode, channel=channel)
+    log_event(f"Metrics: {', '.join(selected)} (about {plan_cost(selected):.0f} s of one core per minute of audio).",
+              web_mode, channel=channel)
+    run["status"] = "running"
+    save_run(run)
+
+    # Meta file is read lazily, skips lines evaluated in previous attempts
+    done = completed_lines(file_name) if resumed else set()
+    if not chunk_size:
+        chunk_size = CHUNK_SIZE if intrusive else NON_INTRUSIVE_BATCH
+    chunks = read_chunks(meta, chunk_size, skip=lambda line: line_hash(line) in done, expand=expand_line)
+    if done:
+        log_event(f"Skipping {len(done)} already evaluated lines.", web_mode, channel=channel)
 
-    # json output result
-    results_data = {
+    # results header, results are appended line by line
+    header = {
         "status": "running",
+        "run_id": run["run_id"],
         "path": dataset_path,
         "intrusive": intrusive,
-        "results": []
+        "alignment": alignment if intrusive else None,
+        "segment_length": segment_length if intrusive else None,
+        "metrics": selected,
     }
-    save_results(results_data, file_name)
+    os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+    writer = ResultsWriter(file_name, header, append=resumed)
+    cache_stats = ScoreCache().stats() if use_cache else None
 
-    max_workers = max(1, os.cpu_count() // 2)
-    #Max workers is set to half of cpu count, can be upped
+    total = count_lines(meta, skip=lambda line: line_hash(line) in done, expand=expand_line) if progress or web_mode else None
+    evaluated = 0
+    status = "completed"
+    started = time.time()
+    profile = profile if profile is not None else RunProfile()
+    if progress:
+        progress(evaluated, total)
+    if web_mode:
+        log_event(progress_info(evaluated, total, started), web_mode, channel=channel, event="progress")
 
-    # Parallelisation of evaluation
-    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(process_line, line, dataset_path, web_mode, intrusive) for line in lines]
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                result = future.result()
-                results_data["results"].append(result)
-                save_results(results_data, file_name)
-                log_event(result, web_mode=web_mode)
-            except Exception as e:
-                log_event(e, web_mode=web_mode)
-                log_event("Please check your meta file, audio files or selected mode of evaluation.", web_mode=web_mode)
-                continue
+    # Parallelisation of evaluation, DNSMOS sessions are created once per worker
+    # only a bounded number of chunks is submitted at once
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=worker_count(max_workers), initializer=init_worker)
+    # PESQ is a stage of its own, scored in batches by a separate pool
+    pesq_stage_used = bool(pesq_workers) and intrusive and not segment_length and "Pesq" in selected
+    own_pesq_executor = pesq_stage_used and pesq_executor is None
+    if own_pesq_executor:
+        pesq_executor = concurrent.futures.ProcessPoolExecutor(max_workers=pesq_workers)
+    elif not pesq_stage_used:
+        pesq_executor = None
+    try:
+        if intrusive and segment_length:
+            # long audios are split into segments scored by all workers
+            results = eval_segmented(executor, chunks, dataset_path, alignment, segment_length, CHUNK_SIZE, selected)
+        else:
+            results = (result for results in run_bounded(executor, process_chunk, chunks,
+                                                         (dataset_path, web_mode, intrusive, alignment, use_cache,
+                                                          pesq_executor is not None, selected))
+                       for result in (results if isinstance(results, list) else [results]))
+            if pesq_executor is not None:
+                results = pesq_stage(results, pesq_executor, use_cache=use_cache,
+                                     max_pending=IN_FLIGHT_PER_WORKER * pesq_workers)
+        for result in results:
+            evaluated += 1
+            profile.add(result)
+            profiling.metrics.observe(result)
+            if progress:
+                progress(evaluated, total)
+            if isinstance(result, Exception):
+                log_event(result, web_mode=web_mode, channel=channel)
+                log_event("Please check your meta file, audio files or selected mode of evaluation.", web_mode=web_mode, channel=channel)
+            else:
+                writer.append(result)
+                for metric, error in result.get("errors", dict()).items():
+                    log_event(f"{metric} of {result['file']} couldn't be evaluated - {error}", web_mode=web_mode, channel=channel)
+            if web_mode:
+                # structured progress instead of the raw result, browser renders the result itself
+                event = progress_info(evaluated, total, started)
+                if not isinstance(result, Exception):
+                    event["result"] = result
+                log_event(event, web_mode, channel=channel, event="progress")
+            elif not isinstance(result, Exception):
+                # stage times are summarized at the end of the run
+                log_event({key: value for key, value in result.items() if key != "profile"})
+            if cancel is not None and cancel.is_set():
+                # pending chunks are dropped when the generator is closed
+                results.close()
+                status = "cancelled"
+                break
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+        if own_pesq_executor:
+            pesq_executor.shutdown(cancel_futures=True)
 
     #End of an evaluation
-    results_data["status"] = "completed"
     #Flag for completed evaluation
-    save_results(results_data, file_name)
+    summary = dict()
+    if use_cache:
+        # Counters are shared by all processes using the cache
+        current = ScoreCache().stats()
+        summary["cache"] = {"hits": current["hits"] - cache_stats["hits"], "misses": current["misses"] - cache_stats["misses"]}
+        log_event(f"Score cache: {summary['cache']['hits']} hits, {summary['cache']['misses']} misses.", web_mode, channel=channel)
+    summary["profile"] = profile.summary()
+    writer.finalize(status, **summary)
+    run["status"] = status
+    save_run(run)
+    if columnar and status == "completed":
+        # analysis reads the archive instead of the results file
+        log_event(f"Columnar results saved to {convert_results(file_name)}.", web_mode, channel=channel)
 
-    log_event("Evaluation completed.", web_mode)
+    if not web_mode:
+        log_event(profile.format())
+    if status == "cancelled":
+        log_event("Evaluation cancelled.", web_mode, channel=channel)
+    else:
+        log_event("Evaluation completed.", web_mode, channel=channel)
     log_event(load_audios(UPLOAD_PATH, SAMPLES_PATH))
-    delete_temp_files()
+    if cleanup:
+        # only an uploaded dataset of this evaluation is deleted
+        delete_temp_files(dataset_path)
+    return status
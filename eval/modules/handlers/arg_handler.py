@@ -1,9 +1,21 @@
+import sys
+from modules.alignment import ALIGNERS
+
 def handle_arguments(argums: str) -> list[str]:
     args = argums[1].split(' ')
     META_FILE=''
     SAVE_PATH=''
     DATASET_PATH=''
     INTRUSIVE_EVAL=''
+    ALIGNMENT=''
+    RUN_ID=''
+    CACHE=''
+    WORKERS=''
+    CHUNK_SIZE=''
+    SEGMENT_LENGTH=''
+    COLUMNAR=''
+    PESQ_WORKERS=''
+    METRICS=''
     for index in range(0, len(args)):
         arg = args[index]
         match arg:
@@ -15,7 +27,29 @@ def handle_arguments(argums: str) -> list[str]:
                 SAVE_PATH = args[index + 1]
             case '--intrusive_eval':
                 INTRUSIVE_EVAL = args[index + 1]
+            case '--alignment':
+                ALIGNMENT = args[index + 1]
+            case '--run_id':
+                RUN_ID = args[index + 1]
+            case '--cache':
+                CACHE = args[index + 1]
+            case '--workers':
+                WORKERS = args[index + 1]
+            case '--chunk_size':
+                CHUNK_SIZE = args[index + 1]
+            case '--segment_length':
+                SEGMENT_LENGTH = args[index + 1]
+            case '--columnar':
+                COLUMNAR = args[index + 1]
+            case '--pesq_workers':
+                PESQ_WORKERS = args[index + 1]
+            case '--metrics':
+                METRICS = args[index + 1]
             case _:
                 continue
 
-    return META_FILE, DATASET_PATH, SAVE_PATH, INTRUSIVE_EVAL
\ No newline at end of file
+    # invalid alignment mode is reported before the evaluation starts
+    if ALIGNMENT and ALIGNMENT not in ALIGNERS:
+        sys.exit(f"Unknown alignment mode - {ALIGNMENT}, available modes are {', '.join(ALIGNERS)}.")
+
+    return META_FILE, DATASET_PATH, SAVE_PATH, INTRUSIVE_EVAL, ALIGNMENT, RUN_ID, CACHE, WORKERS, CHUNK_SIZE, SEGMENT_LENGTH, COLUMNAR, PESQ_WORKERS, METRICS
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""
+    This file contains on-disk cache for metric scores.
+    Scores are stored in SQLite database, keyed by the hash of audio file
+    contents, metric name, metric version and alignment settings. Least recently
+    used entries are evicted when the cache exceeds its maximum size.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from modules.constants import CACHE_PATH, CACHE_MAX_SIZE, METRIC_VERSIONS
+from modules.handlers.log_handler import convert
+
+# Memoized file hashes, keyed by path, size and modification time
+file_hashes = dict()
+
+def file_hash(path: str) -> str:
+    """
+        Hash of file contents, computed once per file version
+
+        Params:
+            path:           path to the file
+
+        Returns:
+            sha1 hash of file contents
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in file_hashes:
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        file_hashes[key] = digest.hexdigest()
+    return file_hashes[key]
+
+def score_key(metric: str, hashes: list[str], settings: dict = None) -> str:
+    """
+        Cache key of a metric score
+
+        Params:
+            metric:         name of the metric
+            hashes:         hashes of audio files the score depends on
+            settings:       settings affecting the score (e.g. alignment)
+
+        Returns:
+            cache key
+    """
+    content = json.dumps([metric, METRIC_VERSIONS.get(metric, 0), hashes, settings or {}], sort_keys=True)
+    return hashlib.sha1(content.encode()).hexdigest()
+
+class ScoreCache:
+    """
+        SQLite score cache with size based eviction and hit/miss counters
+    """
+    # Eviction is checked only after this many insertions
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, path: str = CACHE_PATH, max_size: int = CACHE_MAX_SIZE):
+        """
+            Params:
+                path:           path to the database file
+                max_size:       maximum size of stored values in bytes
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_size = max_size
+        self.inserted = 0
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, value TEXT, size INTEGER, accessed REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS scores_accessed ON scores (accessed)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+        self.db.execute("INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0)")
+        self.db.commit()
+
+    def get(self, key: str):
+        """
+            Returns cached score
+
+            Params:
+                key:            cache key
+
+            Returns:
+                cached value or None when not cached
+        """
+        row = self.db.execute("SELECT value FROM scores WHERE key = ?", (key,)).fetchone()
+        with self.db:
+            if row is None:
+                self.db.execute("UPDATE stats SET value = value + 1 WHERE name = 'misses'")
+                return None
+            self.db.execute("UPDATE scores SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.db.execute("UPDATE stats SET value = value + 1 WHERE name = 'hits'")
+        return json.loads(row[0])
+
+    def put(self, key: str, value):
+        """
+            Stores score in the cache
+
+            Params:
+                key:            cache key
+                value:          JSON serializable value
+        """
+        content = json.dumps(value, default=convert)
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)", (key, content, len(content), time.time()))
+        self.inserted += 1
+        if self.inserted % self.EVICTION_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        """
+            Removes least recently used entries until the cache fits into 90 % of its size
+        """
+        size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM scores").fetchone()[0]
+        if size <= self.max_size:
+            return
+        excess = size - int(self.max_size * 0.9)
+        with self.db:
+            self.db.execute("""
+                DELETE FROM scores WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY accessed ROWS UNBOUNDED PRECEDING) - size AS removed FROM scores
+                    ) WHERE removed < ?
+                )""", (excess,))
+
+    def stats(self) -> dict:
+        """
+            Returns cache statistics
+
+            Returns:
+                dict with hits, misses, number of entries and size in bytes
+        """
+        stats = dict(self.db.execute("SELECT name, value FROM stats").fetchall())
+        entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM scores").fetchone()
+        return {"hits": stats["hits"], "misses": stats["misses"], "entries": entries, "size": size}
+
+# Cache instance of current process
+cache = None
+
+def get_cache() -> ScoreCache:
+    """
+        Returns score cache of current process (connections aren't shared between processes)
+
+        Returns:
+            score cache
+    """
+    global cache
+    if cache is None:
+        cache = ScoreCache()
+    return cache
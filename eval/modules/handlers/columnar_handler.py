@@ -0,0 +1,247 @@
+"""
+    This file contains columnar storage of evaluation results.
+    Results are stored as a NumPy archive (.npz) with one typed column per metric
+    (MOS is split into its sub-scores), a column of meta file lines and
+    the header as JSON. Columns are loaded lazily, only when they are accessed,
+    so analysis of large evaluations doesn't parse every result.
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import argparse
+import json
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+from modules.constants import COLUMNAR_SUFFIX
+
+# Sub-scores of MOS metric, stored as separate columns
+MOS_COLUMNS = ["ovrl_mos", "sig_mos", "bak_mos", "p808_mos"]
+# Key of the header in the archive
+HEADER_KEY = "__header__"
+# Archives start with a zip local file header
+ZIP_MAGIC = b"PK\x03\x04"
+
+def number_column(values: list) -> np.ndarray:
+    """
+        Converts values of one column to floats, values which aren't numbers become NaN
+
+        Params:
+            values:         list of values
+
+        Returns:
+            float64 array
+    """
+    try:
+        # None and "NaN" are converted directly
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+
+def results_columns(results: list[dict]) -> tuple[dict, list[str]]:
+    """
+        Flattens evaluated results into columns, MOS dict is split into
+        its sub-scores and values which aren't numbers (e.g. "NaN") become NaN
+
+        Params:
+            results:        list of results ({"file", "metrics"})
+
+        Returns:
+            dict of column name to values (list of files, float arrays), names of metrics
+    """
+    rows = [result["metrics"] for result in results]
+    metrics = list(dict.fromkeys(name for row in rows for name in row))
+    columns = {"file": [result["file"] for result in results]}
+    for metric in metrics:
+        values = [row.get(metric) for row in rows]
+        if metric == "Mos":
+            values = [value if isinstance(value, dict) else {} for value in values]
+            for column in MOS_COLUMNS:
+                columns[column] = number_column([value.get(column) for value in values])
+        else:
+            columns[metric] = number_column(values)
+    return columns, metrics
+
+def is_columnar(file_name: str) -> bool:
+    """
+        Checks whether a results file is stored in columnar format
+
+        Params:
+            file_name:      path of the results file
+
+        Returns:
+            true for a columnar archive
+    """
+    with open(file_name, "rb") as f:
+        return f.read(len(ZIP_MAGIC)) == ZIP_MAGIC
+
+def write_columnar(data: dict, file_name: str):
+    """
+        Writes results into a columnar archive, the file is replaced atomically.
+        Per segment details of segmented evaluation aren't stored.
+
+        Params:
+            data:           dict with header values and list of results (see read_results)
+            file_name:      path of the archive
+    """
+    columns, metrics = results_columns(data["results"])
+    header = {key: value for key, value in data.items() if key != "results"}
+    header.update(metrics=metrics, count=len(data["results"]))
+    arrays = {name: np.asarray(values, dtype=np.str_ if name == "file" else np.float64) for name, values in columns.items()}
+    arrays[HEADER_KEY] = np.array(json.dumps(header))
+    os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+    # same layout as numpy.savez (which reserves the "file" keyword), stored uncompressed
+    # so columns are read without decompression
+    with zipfile.ZipFile(file_name + ".tmp", "w", zipfile.ZIP_STORED) as archive:
+        for name, array in arrays.items():
+            with archive.open(name + ".npy", "w", force_zip64=True) as member:
+                np.lib.format.write_array(member, array, allow_pickle=False)
+    os.replace(file_name + ".tmp", file_name)
+
+class ColumnarResults:
+    """
+        Results stored in a columnar archive, columns are read on first access
+    """
+    def __init__(self, file_name: str):
+        """
+            Params:
+                file_name:      path of the archive
+        """
+        self.file_name = file_name
+        self.archive = np.load(file_name, allow_pickle=False)
+        self.header = json.loads(self.archive[HEADER_KEY].item())
+        self.metrics = self.header.get("metrics", list())
+        self.columns = [name for name in self.archive.files if name != HEADER_KEY]
+        self.loaded = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.header.get("count", 0)
+
+    def close(self):
+        """
+            Closes the archive
+        """
+        self.archive.close()
+
+    def column(self, name: str) -> np.ndarray:
+        """
+            Values of one column, the column is read once
+
+            Params:
+                name:           name of the column
+
+            Returns:
+                array of values
+        """
+        if name not in self.loaded:
+            if name not in self.columns:
+                raise KeyError(f"Results file doesn't contain column {name}.")
+            self.loaded[name] = self.archive[name]
+        return self.loaded[name]
+
+    def between(self, name: str, low: float = None, high: float = None) -> np.ndarray:
+        """
+            Mask of results whose value of a column is within the range, NaNs are excluded
+
+            Params:
+                name:           name of the column
+                low:            minimum value (inclusive), None for no limit
+                high:           maximum value (inclusive), None for no limit
+
+            Returns:
+                boolean array
+        """
+        values = self.column(name)
+        mask = ~np.isnan(values)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return mask
+
+    def frame(self, columns: list[str] = None, mask: np.ndarray = None) -> pd.DataFrame:
+        """
+            Dataframe of selected columns, only these columns are read
+
+            Params:
+                columns:        names of columns, None for all of them
+                mask:           boolean array selecting results (see between)
+
+            Returns:
+                dataframe
+        """
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({name: self.column(name) if mask is None else self.column(name)[mask] for name in columns})
+
+    def to_dict(self) -> dict:
+        """
+            Results in the same structure as read from a JSON results file
+
+            Returns:
+                dict with header values and list of results
+        """
+        data = {key: value for key, value in self.header.items() if key not in ("metrics", "count")}
+        files = self.column("file").tolist() if "file" in self.columns else [None] * len(self)
+        values = {name: [value if value == value else None for value in self.column(name).tolist()]
+                  for name in self.columns if name != "file"}
+        results = list()
+        for i, file in enumerate(files):
+            metrics = dict()
+            for metric in self.metrics:
+                if metric == "Mos":
+                    metrics[metric] = {column: values[column][i] for column in MOS_COLUMNS}
+                else:
+                    metrics[metric] = values[metric][i]
+            results.append({"file": file, "metrics": metrics})
+        data["results"] = results
+        return data
+
+def columnar_path(file_name: str) -> str:
+    """
+        Default path of the columnar archive of a results file
+
+        Params:
+            file_name:      path of the results file
+
+        Returns:
+            path of the archive
+    """
+    return os.path.splitext(file_name)[0] + COLUMNAR_SUFFIX
+
+def convert_results(file_name: str, output: str = None) -> str:
+    """
+        Converts a JSON (or JSON lines) results file into a columnar archive
+
+        Params:
+            file_name:      path of the results file
+            output:         path of the archive, next to the results file by default
+
+        Returns:
+            path of the archive
+    """
+    # results handler reads archives as well, imported here to avoid a cycle
+    from modules.handlers.results_handler import read_results
+    output = output or columnar_path(file_name)
+    if os.path.abspath(output) == os.path.abspath(file_name):
+        raise ValueError("Columnar archive would overwrite the results file.")
+    write_columnar(read_results(file_name), output)
+    return output
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converts results files into columnar archives")
+    parser.add_argument("results", nargs="+", help="JSON or JSON lines results files")
+    parser.add_argument("--output", default=None, help="path of the archive (single results file only)")
+    args = parser.parse_args()
+    if args.output and len(args.results) > 1:
+        parser.error("--output can be used with a single results file only")
+    for results in args.results:
+        print(convert_results(results, args.output))
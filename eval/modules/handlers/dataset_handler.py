@@ -0,0 +1,253 @@
+"""
+    This file contains registry of datasets kept on the server.
+    A dataset is either a server-local folder referenced in place or an uploaded
+    folder moved into content-addressed storage (each file stored once by its hash,
+    datasets are trees of hard links). Each dataset has a manifest of its files
+    with hashes, durations and sample rates, so it can be evaluated repeatedly
+    without being uploaded again.
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import Counter
+import soundfile
+from modules.constants import DATASETS_PATH
+from modules.handlers.upload_handler import file_sha256, upload_path
+
+class DatasetError(Exception):
+    """Dataset doesn't exist or couldn't be registered"""
+    pass
+
+def record_path(dataset_id: str) -> str:
+    """
+        Path of the dataset record
+
+        Params:
+            dataset_id:     ID of the dataset
+
+        Returns:
+            path to the record
+    """
+    return os.path.join(DATASETS_PATH, f"{os.path.basename(dataset_id)}.json")
+
+def load_dataset(dataset_id: str) -> dict | None:
+    """
+        Loads dataset record
+
+        Params:
+            dataset_id:     ID of the dataset
+
+        Returns:
+            dataset record or None if dataset doesn't exist
+    """
+    path = record_path(dataset_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_dataset(dataset: dict):
+    """
+        Saves dataset record, the file is replaced atomically
+
+        Params:
+            dataset:        dataset record, must contain dataset_id
+    """
+    os.makedirs(DATASETS_PATH, exist_ok=True)
+    path = record_path(dataset["dataset_id"])
+    with open(path + ".tmp", "w") as f:
+        json.dump(dataset, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+def list_datasets() -> list[dict]:
+    """
+        Loads all dataset records without their file manifests
+
+        Returns:
+            list of dataset summaries ordered by creation time
+    """
+    if not os.path.exists(DATASETS_PATH):
+        return list()
+    datasets = list()
+    for filename in os.listdir(DATASETS_PATH):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(DATASETS_PATH, filename), "r") as f:
+                dataset = json.load(f)
+        except (OSError, ValueError):
+            continue # skip record being written
+        dataset.pop("files", None)
+        datasets.append(dataset)
+    return sorted(datasets, key=lambda dataset: dataset.get("created", 0))
+
+def file_info(path: str, previous: dict = None) -> dict:
+    """
+        Manifest entry of a file, hash of an unchanged file is reused from previous manifest
+
+        Params:
+            path:           path of the file
+            previous:       entry of the file in previous manifest
+
+        Returns:
+            dict with sha256, size, mtime and for audio files rate, duration and channels
+    """
+    stat = os.stat(path)
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime") == stat.st_mtime_ns:
+        return previous
+    info = {"sha256": file_sha256(path), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+    try:
+        audio = soundfile.info(path)
+        info.update(rate=audio.samplerate, duration=audio.duration, channels=audio.channels)
+    except Exception:
+        pass # not an audio file (e.g. meta file)
+    return info
+
+def build_manifest(root: str, previous: dict = None) -> dict:
+    """
+        Manifest of all files of a dataset folder
+
+        Params:
+            root:           dataset folder
+            previous:       previous manifest, hashes of unchanged files are reused
+
+        Returns:
+            dict of relative path to file entry
+    """
+    previous = previous or dict()
+    manifest = dict()
+    for folder, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(folder, filename)
+            rel_path = os.path.relpath(path, root).replace(os.sep, "/")
+            manifest[rel_path] = file_info(path, previous.get(rel_path))
+    return manifest
+
+def summary(dataset: dict) -> dict:
+    """
+        Totals of a dataset manifest
+
+        Params:
+            dataset:        dataset record
+
+        Returns:
+            dict with number of files, number of audios, total duration and sample rates
+    """
+    files = dataset.get("files", dict()).values()
+    audios = [f for f in files if "rate" in f]
+    return {
+        "file_count": len(files),
+        "audio_count": len(audios),
+        "duration": sum(f["duration"] for f in audios),
+        "rates": sorted({f["rate"] for f in audios}),
+    }
+
+def store(root: str, manifest: dict, tree: str):
+    """
+        Moves files of an uploaded folder into content-addressed storage,
+        the dataset folder is recreated from hard links to stored objects
+
+        Params:
+            root:           uploaded folder
+            manifest:       manifest of the folder
+            tree:           folder of the dataset
+    """
+    objects = os.path.join(DATASETS_PATH, "objects")
+    for rel_path, info in manifest.items():
+        obj = os.path.join(objects, info["sha256"][:2], info["sha256"])
+        source = os.path.join(root, rel_path)
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        if not os.path.exists(obj):
+            os.replace(source, obj)
+        target = os.path.join(tree, rel_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(obj, target)
+        except OSError:
+            shutil.copyfile(obj, target)
+        # object keeps its own mtime, manifest follows the linked file
+        info["mtime"] = os.stat(target).st_mtime_ns
+    shutil.rmtree(root, ignore_errors=True)
+
+def register_dataset(name: str, path: str = None, upload: str = None, dataset_id: str = None) -> dict:
+    """
+        Registers a dataset, or refreshes manifest of an existing one
+
+        Params:
+            name:           name of the dataset
+            path:           server-local folder of the dataset, referenced in place
+            upload:         uploaded folder (relative to UPLOAD_DIR), moved into the registry
+            dataset_id:     ID of an existing dataset to be refreshed
+
+        Returns:
+            dataset record
+    """
+    existing = load_dataset(dataset_id) if dataset_id else None
+    if dataset_id and existing is None:
+        raise DatasetError(f"Dataset {dataset_id} doesn't exist.")
+    if (path is None) == (upload is None) and existing is None:
+        raise DatasetError("Either a server-local path or an uploaded folder has to be selected.")
+
+    dataset = existing or {"dataset_id": uuid.uuid4().hex[:12], "created": time.time()}
+    dataset["name"] = name or dataset.get("name")
+    if upload is not None:
+        source = upload_path(upload)
+        if not os.path.isdir(source):
+            raise DatasetError(f"Uploaded folder {upload} doesn't exist.")
+        tree = os.path.join(DATASETS_PATH, "trees", dataset["dataset_id"])
+        if os.path.exists(tree):
+            remove_tree(tree, dataset.get("files", dict()))
+        manifest = build_manifest(source)
+        store(source, manifest, tree)
+        dataset.update(path=os.path.abspath(tree), storage="content-addressed", files=manifest)
+    else:
+        if path is not None:
+            dataset.update(path=os.path.abspath(path), storage="local")
+        if not os.path.isdir(dataset["path"]):
+            raise DatasetError(f"Dataset folder {dataset['path']} doesn't exist.")
+        dataset["files"] = build_manifest(dataset["path"], dataset.get("files"))
+    dataset["updated"] = time.time()
+    dataset.update(summary(dataset))
+    save_dataset(dataset)
+    return dataset
+
+def remove_tree(tree: str, manifest: dict):
+    """
+        Removes dataset folder of content-addressed storage together with
+        stored objects no other dataset links to
+
+        Params:
+            tree:           folder of the dataset
+            manifest:       manifest of the dataset
+    """
+    # number of links of each object within this dataset
+    links = Counter(info["sha256"] for info in manifest.values())
+    for rel_path, info in manifest.items():
+        obj = os.path.join(DATASETS_PATH, "objects", info["sha256"][:2], info["sha256"])
+        target = os.path.join(tree, rel_path)
+        # no other dataset links to the object
+        if os.path.exists(obj) and os.path.exists(target) and os.path.samefile(obj, target) \
+                and os.stat(obj).st_nlink <= 1 + links[info["sha256"]]:
+            os.remove(obj)
+    shutil.rmtree(tree, ignore_errors=True)
+
+def delete_dataset(dataset_id: str):
+    """
+        Removes dataset from the registry, files of a server-local dataset are kept
+
+        Params:
+            dataset_id:     ID of the dataset
+    """
+    dataset = load_dataset(dataset_id)
+    if dataset is None:
+        raise DatasetError(f"Dataset {dataset_id} doesn't exist.")
+    if dataset.get("storage") == "content-addressed":
+        remove_tree(dataset["path"], dataset["files"])
+    os.remove(record_path(dataset_id))
@@ -3,14 +3,35 @@
 """
 import shutil
 import os
-from modules.constants import UPLOAD_DIR, UPLOAD_PATH, SAMPLES_PATH, GRAPHS_PATH
+from modules.constants import UPLOAD_DIR, UPLOAD_PATH, SAMPLES_PATH, GRAPHS_PATH, COMPARISONS_PATH
 
-def delete_temp_files():
+def uploaded_folder(dataset_path: str) -> bool:
+    """
+        Whether the dataset folder was uploaded for evaluation (it's inside UPLOAD_DIR),
+        registered datasets and server-local folders are never deleted
+
+        Params:
+            dataset_path:   dataset folder
+
+        Returns:
+            True for uploaded folders
+    """
+    root = os.path.abspath(UPLOAD_DIR)
+    path = os.path.abspath(dataset_path)
+    return path != root and os.path.commonpath([path, root]) == root
+
+def delete_temp_files(dataset_path: str = None):
     """
         Deletes uploaded audio samples after evalaution.
+
+        Params:
+            dataset_path:   uploaded dataset folder to be deleted, None for all uploaded files
     """
-    if os.path.exists(UPLOAD_DIR):
-        shutil.rmtree(UPLOAD_DIR)
+    if dataset_path is None:
+        if os.path.exists(UPLOAD_DIR):
+            shutil.rmtree(UPLOAD_DIR)
+    elif uploaded_folder(dataset_path) and os.path.exists(dataset_path):
+        shutil.rmtree(dataset_path)
 
 def clear_cache():
     """
@@ -23,4 +44,7 @@ def clear_cache():
         shutil.rmtree(SAMPLES_PATH)
 
     if os.path.exists(GRAPHS_PATH):
-        shutil.rmtree(GRAPHS_PATH)
\ No newline at end of file
+        shutil.rmtree(GRAPHS_PATH)
+
+    if os.path.exists(COMPARISONS_PATH):
+        shutil.rmtree(COMPARISONS_PATH)
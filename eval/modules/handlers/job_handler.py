@@ -0,0 +1,69 @@
+"""
+    This file contains persistence of evaluation jobs of the web application.
+    Each job has a record with its request parameters and status stored in JOBS_PATH,
+    so queued and interrupted jobs survive a restart of the server.
+"""
+import json
+import os
+from modules.constants import JOBS_PATH
+
+def job_path(job_id: str) -> str:
+    """
+        Path of the job record
+
+        Params:
+            job_id:         ID of the job
+
+        Returns:
+            path to the record
+    """
+    return os.path.join(JOBS_PATH, f"{os.path.basename(job_id)}.json")
+
+def load_job(job_id: str) -> dict | None:
+    """
+        Loads job record
+
+        Params:
+            job_id:         ID of the job
+
+        Returns:
+            job record or None if job doesn't exist
+    """
+    path = job_path(job_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_job(job: dict):
+    """
+        Saves job record, the file is replaced atomically
+
+        Params:
+            job:            job record, must contain job_id
+    """
+    os.makedirs(JOBS_PATH, exist_ok=True)
+    path = job_path(job["job_id"])
+    with open(path + ".tmp", "w") as f:
+        json.dump(job, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+def list_jobs() -> list[dict]:
+    """
+        Loads all job records
+
+        Returns:
+            list of job records ordered by creation time
+    """
+    if not os.path.exists(JOBS_PATH):
+        return list()
+    jobs = list()
+    for filename in os.listdir(JOBS_PATH):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(JOBS_PATH, filename), "r") as f:
+                jobs.append(json.load(f))
+        except (OSError, ValueError):
+            continue # skip record being written
+    return sorted(jobs, key=lambda job: job.get("created", 0))
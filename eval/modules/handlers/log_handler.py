@@ -1,73 +1,239 @@
 """
     This file contains logging logic for displaying progress of evaluation.
+    Events are published into channels (one per job and a global one) of an event bus,
+    each channel keeps a bounded ring buffer of its last events. Subscribers follow
+    the buffer with their own cursor and are woken as soon as a new event is published,
+    a reconnecting client continues after the last event it received.
 """
 import asyncio
 import sys
 import json
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator
 import numpy as np
+from modules.constants import EVENT_BUFFER, EVENT_CHANNELS, EVENT_KEEPALIVE
 
-log_messages = list()
-last_log_index = 0
+# Channel receiving events of all jobs
+GLOBAL_CHANNEL = "*"
 
-async def log_generator():
+class Channel:
     """
-        Returns logs to be displayed. Checks every 5 sec.
+        Events of one channel, ring buffer of (id, event, data) tuples
     """
-    global last_log_index
-    while True:
-        current_length = len(log_messages)
-        if last_log_index > current_length:
-            last_log_index = 0
-        if last_log_index < current_length:
-            for log in log_messages[last_log_index:]:
-                yield f"data: {convert(log)}\n\n"
-            last_log_index = len(log_messages)
-
-        await asyncio.sleep(2)
-
-def log_event(message:str, web_mode: bool=False):
+    def __init__(self, size: int):
+        self.events = deque(maxlen=size)
+        self.last_id = 0
+        # asyncio events of connected subscribers
+        self.waiters = set()
+
+class EventBus:
+    """
+        Event bus delivering evaluation events to server-sent event streams,
+        events can be published from any thread
+    """
+    def __init__(self, size: int = EVENT_BUFFER, max_channels: int = EVENT_CHANNELS):
+        self.size = size
+        self.max_channels = max_channels
+        self.channels = OrderedDict()
+        self.lock = threading.Lock()
+        # event loop of the subscribers
+        self.loop = None
+
+    def channel(self, name: str) -> Channel:
+        """
+            Returns channel, creates it if it doesn't exist. Expects the lock to be held.
+
+            Params:
+                name:       name of the channel
+
+            Returns:
+                channel
+        """
+        if name in self.channels:
+            self.channels.move_to_end(name)
+            return self.channels[name]
+        channel = self.channels[name] = Channel(self.size)
+        # least recently used channels without subscribers are dropped, never the new one
+        if len(self.channels) > self.max_channels:
+            for old in list(self.channels):
+                if old not in (GLOBAL_CHANNEL, name) and not self.channels[old].waiters:
+                    del self.channels[old]
+                    break
+        return channel
+
+    def publish(self, name: str, event: str, data):
+        """
+            Publishes an event, subscribers of the channel are woken
+
+            Params:
+                name:       name of the channel
+                event:      type of the event (log, progress, status)
+                data:       json serializable data of the event
+        """
+        with self.lock:
+            channel = self.channel(name)
+            channel.last_id += 1
+            channel.events.append((channel.last_id, event, data))
+            waiters = list(channel.waiters)
+        if self.loop is not None:
+            for waiter in waiters:
+                try:
+                    self.loop.call_soon_threadsafe(waiter.set)
+                except RuntimeError:
+                    # event loop was already closed
+                    pass
+        if name != GLOBAL_CHANNEL:
+            self.publish(GLOBAL_CHANNEL, event, data)
+
+    def since(self, name: str, cursor: int) -> list[tuple]:
+        """
+            Buffered events of a channel after selected event
+
+            Params:
+                name:       name of the channel
+                cursor:     ID of the last received event
+
+            Returns:
+                list of (id, event, data) tuples
+        """
+        with self.lock:
+            channel = self.channel(name)
+            # IDs restarted (e.g. server restart), whole buffer is replayed
+            if cursor > channel.last_id:
+                cursor = 0
+            return [e for e in channel.events if e[0] > cursor]
+
+    async def subscribe(self, name: str, last_id: int = 0, keepalive: float = EVENT_KEEPALIVE) -> AsyncIterator[tuple | None]:
+        """
+            Follows a channel, buffered events after last_id are replayed first
+
+            Params:
+                name:       name of the channel
+                last_id:    ID of the last event received before reconnecting
+                keepalive:  seconds without events after which None is yielded
+
+            Returns:
+                generator of (id, event, data) tuples
+        """
+        self.loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        with self.lock:
+            self.channel(name).waiters.add(wake)
+        cursor = last_id
+        try:
+            while True:
+                # cleared before reading, events published meanwhile wake us again
+                wake.clear()
+                events = self.since(name, cursor)
+                for event in events:
+                    cursor = event[0]
+                    yield event
+                if not events:
+                    try:
+                        await asyncio.wait_for(wake.wait(), keepalive)
+                    except asyncio.TimeoutError:
+                        yield None
+        finally:
+            with self.lock:
+                if name in self.channels:
+                    self.channels[name].waiters.discard(wake)
+
+# Event bus of the web application
+bus = EventBus()
+
+async def log_generator(channel: str = GLOBAL_CHANNEL, last_id: int = 0):
+    """
+        Returns events of a channel formatted as server-sent events
+
+        Params:
+            channel:        name of the channel, job ID or GLOBAL_CHANNEL
+            last_id:        ID of the last event received by the client (Last-Event-ID header)
+    """
+    async for event in bus.subscribe(channel, last_id):
+        if event is None:
+            # comment keeps the connection open
+            yield ": keepalive\n\n"
+            continue
+        event_id, name, data = event
+        yield f"id: {event_id}\nevent: {name}\ndata: {json.dumps(data)}\n\n"
+
+def progress_info(done: int, total: int | None, started: float) -> dict:
+    """
+        Progress of an evaluation with its throughput and estimated time to finish
+
+        Params:
+            done:           number of evaluated lines
+            total:          number of lines to be evaluated, None if unknown
+            started:        start time of the evaluation
+
+        Returns:
+            dict with done, total, throughput (lines per second) and eta (seconds)
+    """
+    elapsed = time.time() - started
+    throughput = done / elapsed if elapsed > 0 else 0.0
+    return {
+        "done": done,
+        "total": total,
+        "throughput": throughput,
+        "eta": (total - done) / throughput if throughput and total is not None else None,
+    }
+
+def log_event(message, web_mode: bool=False, channel: str = GLOBAL_CHANNEL, event: str = "log"):
     """
         Simple fucntion for logging logic
 
         Params:
             message:        message to be logged
             web_mode:       flag whether to log into CLI or send to client
+            channel:        channel of the event bus (job ID), web mode only
+            event:          type of the event, web mode only
     """
     if web_mode:
-        global log_messages
-        if len(log_messages) > 100:
-            log_messages = list()
-        log_messages.append(message)
+        if not isinstance(message, (dict, list)):
+            message = str(message)
+        bus.publish(channel, event, finite(convert(message)))
 
     else:
         print(message)
         sys.stdout.flush()
 
-def save_results(data, file_name:str):
-    """
-        Simple function that saves current data to the output json file
-
-        Params:
-            data:       data to be saved
-            file_name:  name of the file
-    """
-    with open(file_name, "w") as f:
-        # opens file and dumps content
-        json.dump(data, f, indent=4, default=convert)
-
 def convert(obj):
     """
         Help function to convert np.float values to json friendly values
 
         Params:
             obj:        object to be converted
-        
+
         Returns:
             converted object
     """
     if isinstance(obj, dict):
         return {k: convert(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [convert(v) for v in obj]
     elif isinstance(obj, np.generic):
         return obj.item()
     else:
-        return obj
\ No newline at end of file
+        return obj
+
+def finite(obj):
+    """
+        Replaces NaN and infinite floats by None, they are not valid JSON for the browser
+
+        Params:
+            obj:        converted object
+
+        Returns:
+            object with finite floats only
+    """
+    if isinstance(obj, dict):
+        return {k: finite(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [finite(v) for v in obj]
+    elif isinstance(obj, float) and not math.isfinite(obj):
+        return None
+    else:
+        return obj
@@ -0,0 +1,151 @@
+"""
+    This file contains logic for writing and reading evaluation results.
+    Results are stored as JSON lines - first line is a header (status, path, ...),
+    then one line per evaluated utterance. Status lines may be appended later,
+    the last one wins. A crash during evaluation leaves a readable partial file.
+    Results converted into columnar archives (see columnar_handler.py) are read as well.
+"""
+import json
+import os
+from modules.handlers.log_handler import convert
+from modules.handlers.columnar_handler import ColumnarResults, is_columnar
+from modules.constants import RESULTS_BATCH, SUMMARY_SUFFIX, COLUMNAR_SUFFIX
+
+class ResultsFileError(Exception):
+    """Results file couldn't be read"""
+    pass
+
+class ResultsWriter:
+    """
+        Append-only results sink, records are buffered and written in batches
+    """
+    def __init__(self, file_name: str, header: dict, batch_size: int = RESULTS_BATCH, append: bool = False):
+        """
+            Params:
+                file_name:      path of the results file
+                header:         status/metadata of the evaluation (without results)
+                batch_size:     number of records buffered before writing
+                append:         continue in an existing file instead of creating a new one
+        """
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.buffer = list()
+        self.count = 0
+        mode = "a" if append and os.path.exists(file_name) else "w"
+        with open(file_name, mode) as f:
+            if mode == "a" and f.tell() > 0:
+                # previous run could end with a partially written line
+                f.write("\n")
+            f.write(json.dumps(header, default=convert) + "\n")
+
+    def append(self, record: dict):
+        """
+            Adds one evaluated record, writes buffer when full
+
+            Params:
+                record:         result of one utterance
+        """
+        self.buffer.append(json.dumps(record, default=convert))
+        self.count += 1
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+            Writes buffered records to the file
+        """
+        if not self.buffer:
+            return
+        with open(self.file_name, "a") as f:
+            f.write("\n".join(self.buffer) + "\n")
+        self.buffer = list()
+
+    def finalize(self, status: str = "completed", **summary):
+        """
+            Writes remaining records and the final status line
+
+            Params:
+                status:         final status of the evaluation
+                summary:        additional values stored with the status
+        """
+        self.flush()
+        with open(self.file_name, "a") as f:
+            f.write(json.dumps({"status": status, "count": self.count, **summary}, default=convert) + "\n")
+
+def read_results(file_name: str) -> dict:
+    """
+        Reads results file, JSON lines, the original JSON document
+        and columnar archives are supported
+
+        Params:
+            file_name:      path of the results file
+
+        Returns:
+            dict with header values and list of results
+    """
+    if is_columnar(file_name):
+        try:
+            with ColumnarResults(file_name) as results:
+                return results.to_dict()
+        except Exception as e:
+            raise ResultsFileError(f"Invalid columnar results file - {e}")
+    with open(file_name, "r") as f:
+        return parse_results(f.read())
+
+def parse_results(content: str) -> dict:
+    """
+        Parses content of a results file
+
+        Params:
+            content:        content of the results file
+
+        Returns:
+            dict with header values and list of results
+    """
+    try:
+        data = json.loads(content)
+        if isinstance(data, dict) and "results" in data:
+            # original format, single JSON document
+            return data
+    except json.JSONDecodeError:
+        pass
+
+    data = {"results": list()}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            # partially written line after a crash
+            continue
+        if not isinstance(record, dict):
+            continue
+        if "file" in record:
+            data["results"].append(record)
+        else:
+            data.update(record)
+
+    if "status" not in data:
+        raise ResultsFileError("Invalid results file - missing status.")
+    return data
+
+def results_files(upload_path: str) -> list[str]:
+    """
+        Names of results files in a folder, summaries and temporary files are skipped,
+        a results file converted into a columnar archive is replaced by the archive
+
+        Params:
+            upload_path:    folder containing results files
+
+        Returns:
+            list of file names
+    """
+    if not os.path.exists(upload_path):
+        return list()
+    filenames = [filename for filename in sorted(os.listdir(upload_path))
+                 if not filename.endswith((SUMMARY_SUFFIX, ".tmp", ".part"))
+                 and os.path.isfile(os.path.join(upload_path, filename))]
+    archives = {os.path.splitext(filename)[0] for filename in filenames if filename.endswith(COLUMNAR_SUFFIX)}
+    return [filename for filename in filenames
+            if filename.endswith(COLUMNAR_SUFFIX) or os.path.splitext(filename)[0] not in archives]
@@ -0,0 +1,92 @@
+"""
+    This file contains logic for persistent evaluation runs.
+    Each run has an ID and a manifest with its parameters stored in RUNS_PATH.
+    Finished meta file lines are identified by content hash, which allows
+    an interrupted run to be resumed and to skip already evaluated lines.
+"""
+import hashlib
+import json
+import os
+import uuid
+from modules.constants import RUNS_PATH
+from modules.handlers.results_handler import read_results
+
+def new_run_id() -> str:
+    """
+        Generates a new run ID
+
+        Returns:
+            run ID
+    """
+    return uuid.uuid4().hex[:12]
+
+def run_path(run_id: str) -> str:
+    """
+        Path of the run manifest
+
+        Params:
+            run_id:         ID of the run
+
+        Returns:
+            path to the manifest
+    """
+    return os.path.join(RUNS_PATH, f"{os.path.basename(run_id)}.json")
+
+def load_run(run_id: str) -> dict | None:
+    """
+        Loads run manifest
+
+        Params:
+            run_id:         ID of the run
+
+        Returns:
+            run manifest or None if run doesn't exist
+    """
+    path = run_path(run_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_run(run: dict):
+    """
+        Saves run manifest, the file is replaced atomically
+
+        Params:
+            run:            run manifest, must contain run_id
+    """
+    os.makedirs(RUNS_PATH, exist_ok=True)
+    path = run_path(run["run_id"])
+    with open(path + ".tmp", "w") as f:
+        json.dump(run, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+def line_hash(line: str) -> str:
+    """
+        Content hash of a meta file line
+
+        Params:
+            line:           line from meta file
+
+        Returns:
+            hash of the stripped line
+    """
+    return hashlib.sha1(line.strip().encode()).hexdigest()
+
+def completed_lines(file_name: str) -> set[str]:
+    """
+        Checkpoint of a run - hashes of lines that already have results
+
+        Params:
+            file_name:      results file of the run
+
+        Returns:
+            set of line hashes
+    """
+    if not os.path.exists(file_name):
+        return set()
+    try:
+        data = read_results(file_name)
+    except Exception:
+        return set()
+    return {line_hash(result["file"]) for result in data["results"]}
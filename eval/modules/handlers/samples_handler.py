@@ -2,10 +2,12 @@
     Script to handle samples loading
 """
 import os
-import json
 import shutil
 import pandas as pd
 from modules.constants import NUM_OF_SAMPLES
+from modules.handlers.results_handler import read_results, results_files
+from modules.handlers.columnar_handler import ColumnarResults, is_columnar
+from modules.handlers.log_handler import log_event
 
 
 def handle_filename(line: str, datasetpath: str, intrusive: bool) -> tuple[str, str]:
@@ -96,18 +98,24 @@ def load_audios(upload_path: str, sample_path:str):
 
     }
     # for each uplaoded file
-    for file in os.listdir(upload_path):
+    for file in results_files(upload_path):
             file_path = os.path.join(upload_path, file)
-            with open(file_path, 'r') as f:
-                try:
-                    data = json.load(f) 
+            try:
+                if is_columnar(file_path):
+                    # only the column of meta file lines is read
+                    with ColumnarResults(file_path) as results:
+                        dataset_path = results.header["path"]
+                        intrusive = results.header["intrusive"]
+                        audios = results.column("file").tolist()
+                else:
+                    data = read_results(file_path)
                     dataset_path = data["path"]
                     intrusive = data["intrusive"]
                     raw_data = pd.DataFrame(data['results']) 
                     audios = raw_data['file'].tolist()
-                except Exception as e:
-                    print(e)
-                    continue    # skip current file with invalid values
+            except Exception as e:
+                log_event(f"Samples of {file} couldn't be loaded - {type(e).__name__}: {e}")
+                continue    # skip current file with invalid values
             
 
             i = 0
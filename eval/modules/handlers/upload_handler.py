@@ -0,0 +1,281 @@
+"""
+    This file contains upload logic of datasets and results files.
+    Uploaded files are written to disk in chunks outside of the event loop,
+    their size is limited. Dataset files can be uploaded in chunks (an interrupted
+    upload continues from its last chunk) and are identified by SHA-256 hash,
+    files already present on the server are not sent again.
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import AsyncIterator, BinaryIO
+from starlette.concurrency import run_in_threadpool
+from modules.constants import UPLOAD_DIR, UPLOAD_CHUNK, UPLOAD_MAX_SIZE, UPLOAD_INDEX
+
+class UploadError(Exception):
+    """Uploaded file is invalid or exceeds allowed size"""
+    pass
+
+class UploadSizeError(UploadError):
+    """Uploaded file exceeds allowed size"""
+    pass
+
+# Index of uploaded files is shared by all requests
+index_lock = threading.Lock()
+
+def upload_path(rel_path: str, root: str = UPLOAD_DIR) -> str:
+    """
+        Path of an uploaded file, relative path must stay inside of the root folder
+
+        Params:
+            rel_path:       path of the file relative to the root folder
+            root:           upload folder
+
+        Returns:
+            path of the file
+    """
+    rel_path = rel_path.replace("\\", "/").lstrip("/")
+    path = os.path.normpath(os.path.join(root, rel_path))
+    if not rel_path or os.path.basename(path) == UPLOAD_INDEX or \
+            os.path.commonpath([os.path.abspath(path), os.path.abspath(root)]) != os.path.abspath(root):
+        raise UploadError(f"Invalid file path - {rel_path}")
+    return path
+
+def file_sha256(path: str, chunk_size: int = UPLOAD_CHUNK) -> str:
+    """
+        SHA-256 hash of a file, file is read in chunks
+
+        Params:
+            path:           path of the file
+            chunk_size:     number of bytes read at once
+
+        Returns:
+            hex digest
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def copy_file(src: BinaryIO, path: str, max_size: int = UPLOAD_MAX_SIZE, chunk_size: int = UPLOAD_CHUNK) -> tuple[int, str]:
+    """
+        Copies file object to disk in chunks, blocking (run in a thread pool)
+
+        Params:
+            src:            opened file object
+            path:           destination path
+            max_size:       maximum size of the file in bytes
+            chunk_size:     number of bytes copied at once
+
+        Returns:
+            size and SHA-256 hash of the file
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    sha, size = hashlib.sha256(), 0
+    try:
+        with open(path + ".part", "wb") as dst:
+            while chunk := src.read(chunk_size):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadSizeError(f"File exceeds maximum size of {max_size} bytes.")
+                sha.update(chunk)
+                dst.write(chunk)
+        os.replace(path + ".part", path)
+    except Exception:
+        if os.path.exists(path + ".part"):
+            os.remove(path + ".part")
+        raise
+    return size, sha.hexdigest()
+
+async def write_stream(stream: AsyncIterator[bytes], path: str, offset: int = 0, max_size: int = UPLOAD_MAX_SIZE,
+                       chunk_size: int = UPLOAD_CHUNK) -> int:
+    """
+        Writes a chunk of an uploaded file (request body) to its partial file,
+        data are buffered and written in a thread pool, so the event loop isn't blocked
+
+        Params:
+            stream:         request body stream
+            path:           destination path, data are written to path + ".part"
+            offset:         position of the chunk in the file, must match size of the partial file
+            max_size:       maximum size of the file in bytes
+            chunk_size:     number of bytes written at once
+
+        Returns:
+            size of the partial file
+    """
+    part = path + ".part"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    current = os.path.getsize(part) if os.path.exists(part) else 0
+    if offset != current and offset != 0:
+        raise UploadError(f"Chunk offset {offset} doesn't match uploaded size {current}.")
+    f = await run_in_threadpool(open, part, "r+b" if offset else "wb")
+    try:
+        await run_in_threadpool(f.truncate, offset)
+        await run_in_threadpool(f.seek, offset)
+        size, buffer = offset, bytearray()
+        async for data in stream:
+            size += len(data)
+            if size > max_size:
+                raise UploadSizeError(f"File exceeds maximum size of {max_size} bytes.")
+            buffer += data
+            if len(buffer) >= chunk_size:
+                await run_in_threadpool(f.write, bytes(buffer))
+                buffer = bytearray()
+        if buffer:
+            await run_in_threadpool(f.write, bytes(buffer))
+    finally:
+        await run_in_threadpool(f.close)
+    return size
+
+def load_index(root: str = UPLOAD_DIR) -> dict:
+    """
+        Loads index of uploaded files, expects index_lock to be held
+
+        Params:
+            root:           upload folder
+
+        Returns:
+            dict of relative path to {"sha256", "size"}
+    """
+    path = os.path.join(root, UPLOAD_INDEX)
+    if not os.path.exists(path):
+        return dict()
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+def save_index(index: dict, root: str = UPLOAD_DIR):
+    """
+        Saves index of uploaded files atomically, expects index_lock to be held
+
+        Params:
+            index:          index of uploaded files
+            root:           upload folder
+    """
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, UPLOAD_INDEX)
+    with open(path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(path + ".tmp", path)
+
+def register(rel_path: str, size: int, sha256: str, root: str = UPLOAD_DIR):
+    """
+        Adds an uploaded file into the index
+
+        Params:
+            rel_path:       path of the file relative to the upload folder
+            size:           size of the file in bytes
+            sha256:         SHA-256 hash of the file
+            root:           upload folder
+    """
+    path = upload_path(rel_path, root)
+    with index_lock:
+        index = load_index(root)
+        index[os.path.relpath(path, root)] = {"sha256": sha256, "size": size, "mtime": os.stat(path).st_mtime_ns}
+        save_index(index, root)
+
+def indexed(index: dict, rel_path: str, root: str = UPLOAD_DIR) -> dict | None:
+    """
+        Index entry of a file which still exists unchanged (same size and modification time)
+
+        Params:
+            index:          index of uploaded files
+            rel_path:       normalized path relative to the upload folder
+            root:           upload folder
+
+        Returns:
+            index entry or None
+    """
+    entry = index.get(rel_path)
+    path = os.path.join(root, rel_path)
+    if entry is None or not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    # file rewritten in place keeps its size
+    if stat.st_size != entry["size"] or stat.st_mtime_ns != entry.get("mtime"):
+        return None
+    return entry
+
+def check_files(files: list[dict], root: str = UPLOAD_DIR) -> list[dict]:
+    """
+        Checks which files have to be uploaded. A file with the same hash already
+        uploaded under another path is linked (or copied) instead of being sent again.
+
+        Params:
+            files:          list of {"path", "size", "sha256"} of files to be uploaded
+            root:           upload folder
+
+        Returns:
+            list of {"path", "status", "offset"}, status is "exists", "deduplicated",
+            "partial" (upload continues from offset) or "missing"
+    """
+    with index_lock:
+        index = load_index(root)
+        by_hash = dict()
+        for rel_path in list(index):
+            entry = indexed(index, rel_path, root)
+            if entry is None:
+                del index[rel_path]
+            else:
+                by_hash[entry["sha256"]] = rel_path
+
+        checked = list()
+        for file in files:
+            path = upload_path(file["path"], root)
+            rel_path = os.path.relpath(path, root)
+            result = {"path": file["path"], "status": "missing", "offset": 0}
+            entry = index.get(rel_path)
+            if entry is not None and entry["sha256"] == file["sha256"]:
+                result["status"] = "exists"
+            elif file["sha256"] in by_hash and index[by_hash[file["sha256"]]]["size"] == file["size"]:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if os.path.exists(path):
+                    os.remove(path)
+                source = os.path.join(root, by_hash[file["sha256"]])
+                try:
+                    os.link(source, path)
+                except OSError:
+                    shutil.copyfile(source, path)
+                index[rel_path] = {"sha256": file["sha256"], "size": file["size"], "mtime": os.stat(path).st_mtime_ns}
+                result["status"] = "deduplicated"
+            elif os.path.exists(path + ".part"):
+                result["status"] = "partial"
+                result["offset"] = min(os.path.getsize(path + ".part"), file["size"])
+            checked.append(result)
+        save_index(index, root)
+    return checked
+
+def complete(rel_path: str, sha256: str, root: str = UPLOAD_DIR) -> int:
+    """
+        Finishes chunked upload of a file, hash of the uploaded data is verified,
+        a damaged upload is removed. Blocking (run in a thread pool).
+
+        Params:
+            rel_path:       path of the file relative to the upload folder
+            sha256:         expected SHA-256 hash of the file
+            root:           upload folder
+
+        Returns:
+            size of the file
+    """
+    path = upload_path(rel_path, root)
+    part = path + ".part"
+    if not os.path.exists(part):
+        raise UploadError(f"No upload of {rel_path} in progress.")
+    if file_sha256(part) != sha256:
+        os.remove(part)
+        raise UploadError(f"Uploaded file {rel_path} is damaged (hash mismatch).")
+    os.replace(part, path)
+    size = os.path.getsize(path)
+    register(rel_path, size, sha256, root)
+    return size
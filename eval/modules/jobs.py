@@ -0,0 +1,266 @@
+"""
+    This file contains evaluation job manager of the web application.
+    Jobs are queued persistently (see job_handler), a limited number of them
+    is evaluated at once and all of them share one pool of worker processes
+    and one pool of PESQ processes (created when a job enables the PESQ stage).
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import concurrent.futures
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from modules.eval_dataset import eval_dataset
+from modules.profiling import RunProfile
+from modules.metrics.dnsmos import init_worker
+from modules.scheduler import worker_count
+from modules.constants import MAX_JOBS, MAX_WORKERS
+from modules.handlers.job_handler import load_job, save_job, list_jobs
+from modules.handlers.run_handler import new_run_id
+from modules.handlers.log_handler import log_event, progress_info
+from modules.handlers.file_handler import delete_temp_files
+
+class JobError(Exception):
+    """Selected job doesn't exist or can't be changed"""
+    pass
+
+class JobManager:
+    """
+        Queue of evaluation jobs, jobs are evaluated by a fixed number
+        of threads submitting their work to one shared worker pool
+    """
+    def __init__(self, max_jobs: int = MAX_JOBS, max_workers: int = MAX_WORKERS):
+        self.max_jobs = max(1, max_jobs)
+        self.max_workers = max_workers
+        self.queue = queue.Queue()
+        # progress of running jobs, keyed by job ID
+        self.active = dict()
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pesq_executor = None
+        self.threads = list()
+
+    def start(self):
+        """
+            Starts the worker pool and job threads, jobs queued or interrupted
+            before the last shutdown are queued again (evaluated lines are skipped)
+        """
+        if self.executor is not None:
+            return
+        # workers are spawned, forking a server with running threads could deadlock them
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=worker_count(self.max_workers), initializer=init_worker,
+                                                               mp_context=multiprocessing.get_context("spawn"))
+        for _ in range(self.max_jobs):
+            thread = threading.Thread(target=self.work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        for job in list_jobs():
+            if job["status"] in ("queued", "running"):
+                job["status"] = "queued"
+                save_job(job)
+                self.queue.put(job["job_id"])
+
+    def shutdown(self):
+        """
+            Stops job threads and the worker pool, running jobs are cancelled
+            and stay queued for the next start
+        """
+        with self.lock:
+            for state in self.active.values():
+                state["cancel"].set()
+                state["shutdown"] = True
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = list()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+        if self.pesq_executor is not None:
+            self.pesq_executor.shutdown(cancel_futures=True)
+            self.pesq_executor = None
+
+    def pesq_pool(self) -> concurrent.futures.Executor:
+        """
+            PESQ pool shared by jobs scoring PESQ as a stage of its own (see pesq_stage),
+            it has as many processes as the worker pool and is created on first use
+
+            Returns:
+                PESQ pool
+        """
+        with self.lock:
+            if self.pesq_executor is None:
+                self.pesq_executor = concurrent.futures.ProcessPoolExecutor(max_workers=worker_count(self.max_workers),
+                                                                            mp_context=multiprocessing.get_context("spawn"))
+            return self.pesq_executor
+
+    def submit(self, params: dict, job_id: str = None) -> dict:
+        """
+            Queues a new job
+
+            Params:
+                params:     parameters of eval_dataset
+                job_id:     ID of the job (run ID of the evaluation), an existing run is resumed
+
+            Returns:
+                job record
+        """
+        job_id = job_id if job_id else new_run_id()
+        # concurrent submits of the same run are checked and saved one at a time
+        with self.lock:
+            existing = load_job(job_id)
+            if existing is not None and existing["status"] in ("queued", "running"):
+                raise JobError(f"Job {job_id} is already {existing['status']}.")
+            job = {
+                "job_id": job_id,
+                "status": "queued",
+                "created": time.time(),
+                "params": params,
+            }
+            save_job(job)
+        log_event({"status": "queued"}, web_mode=True, channel=job_id, event="status")
+        self.queue.put(job_id)
+        return job
+
+    def work(self):
+        """
+            Job thread, evaluates queued jobs one by one
+        """
+        while True:
+            job_id = self.queue.get()
+            if job_id is None:
+                return
+            with self.lock:
+                job = load_job(job_id)
+                # jobs cancelled while queued are skipped
+                if job is None or job["status"] != "queued":
+                    continue
+                state = {"cancel": threading.Event(), "done": 0, "total": None, "started": time.time(), "shutdown": False,
+                         "profile": RunProfile()}
+                self.active[job_id] = state
+                job.update(status="running", started=state["started"])
+                save_job(job)
+            log_event({"status": "running"}, web_mode=True, channel=job_id, event="status")
+
+            def progress(done, total):
+                state["done"], state["total"] = done, total
+            try:
+                # a job uses as much of the shared PESQ pool as its pesq_workers (see eval_dataset)
+                pesq_executor = self.pesq_pool() if job["params"].get("pesq_workers") else None
+                job["status"] = eval_dataset(**job["params"], run_id=job_id, web_mode=True, executor=self.executor,
+                                             progress=progress, cancel=state["cancel"], cleanup=False, profile=state["profile"],
+                                             pesq_executor=pesq_executor)
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+                log_event(f"Evaluation {job_id} failed - {e}", web_mode=True, channel=job_id)
+            if state["shutdown"]:
+                # interrupted by the server shutdown, resumed after the next start
+                job["status"] = "queued"
+            job.update(finished=time.time(), done=state["done"], total=state["total"], profile=state["profile"].summary())
+            save_job(job)
+            log_event({"status": job["status"], **{k: job[k] for k in ("done", "total", "error") if k in job}},
+                      web_mode=True, channel=job_id, event="status")
+            with self.lock:
+                del self.active[job_id]
+                # uploaded dataset of the job is removed once no other job needs it
+                dataset_path = job["params"].get("dataset_path")
+                needed = any(other["params"].get("dataset_path") == dataset_path for other in list_jobs()
+                             if other["job_id"] != job_id and other["status"] in ("queued", "running"))
+            if dataset_path and not needed and not state["shutdown"]:
+                delete_temp_files(dataset_path)
+
+    def using(self, path: str) -> list[str]:
+        """
+            Queued and running jobs evaluating a folder, a folder inside of it or its parent folder
+
+            Params:
+                path:       dataset folder
+
+            Returns:
+                IDs of the jobs
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            jobs = [job for job in list_jobs() if job["status"] in ("queued", "running")]
+        using = list()
+        for job in jobs:
+            dataset_path = job["params"].get("dataset_path")
+            if dataset_path and os.path.commonpath([path, os.path.abspath(dataset_path)]) in (path, os.path.abspath(dataset_path)):
+                using.append(job["job_id"])
+        return using
+
+    def status(self, job_id: str) -> dict:
+        """
+            Status of a job with its progress and estimated time to finish
+
+            Params:
+                job_id:     ID of the job
+
+            Returns:
+                job record extended by progress
+        """
+        job = load_job(job_id)
+        if job is None:
+            raise JobError(f"Job {job_id} doesn't exist.")
+        with self.lock:
+            state = self.active.get(job_id)
+        if state is not None and job["status"] == "running":
+            job["progress"] = progress_info(state["done"], state["total"], state["started"])
+            job["progress"]["cancelling"] = state["cancel"].is_set()
+            job["profile"] = state["profile"].summary()
+        return job
+
+    def list(self) -> list[dict]:
+        """
+            Status of all jobs
+
+            Returns:
+                list of jobs ordered by creation time
+        """
+        return [self.status(job["job_id"]) for job in list_jobs()]
+
+    def gauges(self) -> dict:
+        """
+            Current load of the job queue
+
+            Returns:
+                dict with numbers of queued and running jobs and throughput (lines per second) of running jobs
+        """
+        with self.lock:
+            states = list(self.active.values())
+        queued = sum(job["status"] == "queued" for job in list_jobs())
+        throughput = sum(progress_info(state["done"], state["total"], state["started"])["throughput"] for state in states)
+        return {"queued": queued, "running": len(states), "throughput": throughput}
+
+    def cancel(self, job_id: str) -> dict:
+        """
+            Cancels a job, queued job is not started, running job stops
+            after its current results and keeps results evaluated so far
+
+            Params:
+                job_id:     ID of the job
+
+            Returns:
+                job record
+        """
+        with self.lock:
+            job = load_job(job_id)
+            if job is None:
+                raise JobError(f"Job {job_id} doesn't exist.")
+            state = self.active.get(job_id)
+            if state is None:
+                if job["status"] != "queued":
+                    raise JobError(f"Job {job_id} has already finished.")
+                job["status"] = "cancelled"
+                save_job(job)
+                log_event({"status": "cancelled"}, web_mode=True, channel=job_id, event="status")
+                return job
+            state["cancel"].set()
+        return self.status(job_id)
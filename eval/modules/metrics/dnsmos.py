@@ -0,0 +1,257 @@
+"""
+File containing DNSMOS (non-intrusive MOS predictor) evaluation
+https://pypi.org/project/speechmos/
+
+ONNX sessions are created once per process (see init_worker) and
+many clips can be scored in a single batched inference call.
+Long clips can be scored from a stream of windows (see eval_dnsmos_stream).
+"""
+import os
+from typing import Iterable
+import numpy as np
+import librosa
+import onnxruntime as ort
+from speechmos import dnsmos
+from modules.constants import DNSMOS_INTRA_THREADS, DNSMOS_INTER_THREADS, DNSMOS_BATCH
+
+class DnsmosEvaluationError(Exception):
+    """An error has occured during DNSMOS evaluation"""
+    pass
+
+class Dnsmos(dnsmos.DNSMOS):
+    """
+        DNSMOS model with explicit ONNX runtime thread settings
+    """
+    def __init__(self, primary_model_path: str, p808_model_path: str, intra_threads: int, inter_threads: int):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_threads
+        options.inter_op_num_threads = inter_threads
+        self.primary_model_path = primary_model_path
+        self.onnx_sess = ort.InferenceSession(primary_model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.p808_onnx_sess = ort.InferenceSession(p808_model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+# Model of current process
+model = None
+
+def init_worker(intra_threads: int = DNSMOS_INTRA_THREADS, inter_threads: int = DNSMOS_INTER_THREADS):
+    """
+        Worker initializer, builds DNSMOS ONNX sessions once per process
+
+        Params:
+            intra_threads:      number of threads used within an operator
+            inter_threads:      number of threads used between operators
+    """
+    global model
+    models_path = os.path.join(os.path.dirname(os.path.abspath(dnsmos.__file__)), "dnsmos_models")
+    model = Dnsmos(
+        os.path.join(models_path, "sig_bak_ovr.onnx"),
+        os.path.join(models_path, "model_v8.onnx"),
+        intra_threads,
+        inter_threads
+    )
+
+def get_model() -> Dnsmos:
+    """
+        Returns DNSMOS model of current process, creates it if the process wasn't initialized
+
+        Returns:
+            DNSMOS model
+    """
+    if model is None:
+        init_worker()
+    return model
+
+def segment_starts(samples: int) -> np.ndarray:
+    """
+        Start samples of DNSMOS input segments (9.01 s, hop 1 s) of an audio,
+        segments shortened by rounding of their end are skipped, as in speechmos
+
+        Params:
+            samples:        number of samples of the audio
+
+        Returns:
+            array of start samples
+    """
+    length = int(dnsmos.INPUT_LENGTH * dnsmos.SR)
+    hops = int(np.floor(samples / dnsmos.SR) - dnsmos.INPUT_LENGTH) + 1
+    idx = np.arange(max(hops, 0))
+    starts = idx * dnsmos.SR
+    ends = ((idx + dnsmos.INPUT_LENGTH) * dnsmos.SR).astype(int)
+    return starts[(np.minimum(ends, samples) - starts) >= length]
+
+def segments(audio: np.ndarray) -> np.ndarray:
+    """
+        Splits audio into DNSMOS input segments (9.01 s, hop 1 s),
+        short audios are repeated to the input length
+
+        Params:
+            audio:          16 kHz signal in range from -1 to 1
+
+        Returns:
+            segments as 2D array (segments, samples)
+    """
+    if len(audio) == 0:
+        raise DnsmosEvaluationError("Audio is empty.")
+    if np.abs(audio).max() > 1:
+        raise DnsmosEvaluationError("Audio values must be between -1 and 1.")
+    length = int(dnsmos.INPUT_LENGTH * dnsmos.SR)
+    while len(audio) < length:
+        audio = np.concatenate((audio, audio))
+    starts = segment_starts(len(audio))
+    return np.lib.stride_tricks.sliding_window_view(audio.astype(np.float32, copy=False), length)[starts]
+
+def melspec(segments: np.ndarray) -> np.ndarray:
+    """
+        P.808 model features for a batch of segments,
+        matches DNSMOS.audio_melspec applied on each segment
+
+        Params:
+            segments:       2D array of segments
+
+        Returns:
+            features of shape (segments, frames, mels)
+    """
+    mel = librosa.feature.melspectrogram(y=segments[:, :-160], sr=dnsmos.SR, n_fft=321, hop_length=160, n_mels=120)
+    # power_to_db with ref=np.max, computed for each segment
+    mel = 10.0 * np.log10(np.maximum(mel, 1e-10))
+    mel = np.maximum(mel - mel.max(axis=(1, 2), keepdims=True), -80.0)
+    return ((mel + 40) / 40).transpose(0, 2, 1).astype(np.float32)
+
+def infer(sessions: Dnsmos, segments: np.ndarray, batch_size: int = DNSMOS_BATCH) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Runs both DNSMOS models on segments in batches
+
+        Params:
+            sessions:       DNSMOS model
+            segments:       2D array of segments
+            batch_size:     number of segments in one inference call
+
+        Returns:
+            raw sig, bak, ovr predictions (segments, 3) and P.808 predictions (segments)
+    """
+    raw, p808 = list(), list()
+    for start in range(0, len(segments), batch_size):
+        batch = segments[start:start + batch_size]
+        raw.append(sessions.onnx_sess.run(None, {"input_1": batch})[0])
+        p808.append(sessions.p808_onnx_sess.run(None, {"input_1": melspec(batch)})[0][:, 0])
+    return np.concatenate(raw), np.concatenate(p808)
+
+def scores(sessions: Dnsmos, raw: np.ndarray, p808: np.ndarray) -> dict:
+    """
+        Averages segment predictions of one clip
+
+        Params:
+            sessions:       DNSMOS model
+            raw:            raw predictions of clip segments (segments, 3)
+            p808:           P.808 predictions of clip segments
+
+        Returns:
+            dict with ovrl_mos, sig_mos, bak_mos and p808_mos
+    """
+    sig, bak, ovr = sessions.get_polyfit_val(raw[:, 0], raw[:, 1], raw[:, 2], False)
+    return {
+        "ovrl_mos": float(np.mean(ovr)),
+        "sig_mos": float(np.mean(sig)),
+        "bak_mos": float(np.mean(bak)),
+        "p808_mos": float(np.mean(p808))
+    }
+
+def eval_dnsmos_batch(audios: list[np.ndarray], batch_size: int = DNSMOS_BATCH) -> list:
+    """
+        Evaluates many clips using DNSMOS, segments of all clips are
+        scored together in batches
+
+        Params:
+            audios:         list of 16 kHz signals in range from -1 to 1
+            batch_size:     number of segments in one inference call
+
+        Returns:
+            list of MOS dicts, "NaN" for clips which couldn't be evaluated
+    """
+    sessions = get_model()
+    clip_segments = list()
+    for audio in audios:
+        try:
+            clip_segments.append(segments(audio))
+        except Exception:
+            clip_segments.append(None)
+
+    valid = [s for s in clip_segments if s is not None]
+    if not valid:
+        return ["NaN"] * len(audios)
+    raw, p808 = infer(sessions, np.concatenate(valid), batch_size)
+
+    results = list()
+    offset = 0
+    for s in clip_segments:
+        if s is None:
+            results.append("NaN")
+            continue
+        part = slice(offset, offset + len(s))
+        offset += len(s)
+        results.append(scores(sessions, raw[part], p808[part]))
+    return results
+
+def eval_dnsmos_stream(windows: Iterable[np.ndarray], batch_size: int = DNSMOS_BATCH) -> dict:
+    """
+        Evaluates single clip using DNSMOS from consecutive windows of the signal.
+        Segments are scored as soon as they are complete, only the samples
+        of segments not scored yet are kept in memory.
+
+        Params:
+            windows:        consecutive windows of 16 kHz signal in range from -1 to 1
+            batch_size:     number of segments in one inference call
+
+        Returns:
+            dict with ovrl_mos, sig_mos, bak_mos and p808_mos
+    """
+    sessions = get_model()
+    length = int(dnsmos.INPUT_LENGTH * dnsmos.SR)
+    buffer = np.zeros(0, dtype=np.float32)
+    offset, received, scored = 0, 0, 0
+    pending, raw, p808 = list(), list(), list()
+
+    def flush():
+        if pending:
+            r, p = infer(sessions, np.stack(pending), batch_size)
+            raw.append(r)
+            p808.append(p)
+            pending.clear()
+
+    for window in windows:
+        if len(window) and np.abs(window).max() > 1:
+            raise DnsmosEvaluationError("Audio values must be between -1 and 1.")
+        buffer = np.concatenate((buffer, window.astype(np.float32, copy=False)))
+        received += len(window)
+        # segment set only grows with the length of the audio
+        for start in segment_starts(received)[scored:]:
+            pending.append(buffer[start - offset:start - offset + length].copy())
+            scored += 1
+            if len(pending) >= batch_size:
+                flush()
+        # samples before any possible future segment are dropped
+        drop = max(0, (received // dnsmos.SR - int(dnsmos.INPUT_LENGTH) - 2) * dnsmos.SR) - offset
+        if drop > 0 and received >= length:
+            buffer = buffer[drop:]
+            offset += drop
+
+    if received < length:
+        # short audio is held whole, it is repeated to the input length
+        return eval_dnsmos(buffer)
+    flush()
+    return scores(sessions, np.concatenate(raw), np.concatenate(p808))
+
+def eval_dnsmos(audio: np.ndarray) -> dict:
+    """
+        Evaluates single clip using DNSMOS
+
+        Params:
+            audio:          16 kHz signal in range from -1 to 1
+
+        Returns:
+            dict with ovrl_mos, sig_mos, bak_mos and p808_mos
+    """
+    result = eval_dnsmos_batch([audio])[0]
+    if result == "NaN":
+        raise DnsmosEvaluationError
+    return result
@@ -1,21 +1,55 @@
 """
     Mel-Cepstral Distortion metric
-    Original work: 
+    Original work:
     https://github.com/jasminsternkopf/mel_cepstral_distance
 """
-from mel_cepstral_distance import compare_audio_files
+import numpy as np
+from mel_cepstral_distance import compare_amplitude_spectrograms
+from mel_cepstral_distance.computation import get_X_km
+from mel_cepstral_distance.helper import ms_to_samples, norm_audio_signal
+from modules.constants import MCD_N_FFT, MCD_HOP
 
-def eval_mcd(ref: str, gen: str) -> float:
+class McdEvaluationError(Exception):
+    """An error has occured during MCD evaluation"""
+    pass
+
+def spectrogram(signal: np.ndarray, rate: int) -> np.ndarray:
+    """
+        Amplitude spectrogram used for MCD evaluation,
+        same settings as compare_audio_files
+
+        Params:
+            signal:         audio signal
+            rate:           sample rate of the signal
+
+        Returns:
+            complex spectrogram (frames, bins)
+    """
+    n_fft = ms_to_samples(MCD_N_FFT, rate)
+    hop = ms_to_samples(MCD_HOP, rate)
+    return get_X_km(norm_audio_signal(signal.astype(np.float64)), n_fft, n_fft, hop, "hanning")
+
+def eval_mcd(ref: np.ndarray, gen: np.ndarray, rate: int, ref_spectrogram: np.ndarray = None) -> float:
     """
         Evaluates audios using mel-cepstral-distortion metric
 
         Params:
-            ref:            reference audio path
-            gen:            generated audio path
+            ref:                reference signal
+            gen:                generated signal
+            rate:               sample rate of both signals
+            ref_spectrogram:    precomputed spectrogram of the reference signal
 
         Returns:
             MCD value in dB
     """
-    mcd, _ = compare_audio_files(ref, gen)
+    if len(ref) == 0 or len(gen) == 0:
+        raise McdEvaluationError("Audio is empty.")
+    mcd, _ = compare_amplitude_spectrograms(
+        ref_spectrogram if ref_spectrogram is not None else spectrogram(ref, rate),
+        spectrogram(gen, rate),
+        rate,
+        MCD_N_FFT,
+        align_target="mel"
+    )
 
-    return mcd
\ No newline at end of file
+    return mcd
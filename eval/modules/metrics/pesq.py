@@ -1,6 +1,9 @@
 """
 File containing implementation of PESQ evaluation metric
 https://pypi.org/project/pesq/
+
+PESQ can be scored in batches by its own pool of processes (see eval_pesq_batch),
+evaluation workers then only align audios and defer the pairs (see PesqPair).
 """
 from pesq import pesq
 import numpy as np
@@ -8,6 +11,23 @@ import numpy as np
 class PesqEvaluationError(Exception):
     """An error has occured during PESQ evaluation"""
 
+class PesqPair:
+    """
+    Aligned reference and generated signal waiting to be scored in a batch
+    """
+    def __init__(self, ref_audio: np.ndarray, gen_audio: np.ndarray, rate: int, key: str = None):
+        """
+            Params:
+                ref_audio:      aligned reference signal
+                gen_audio:      aligned generated signal
+                rate:           sample rate of both signals
+                key:            cache key of the score
+        """
+        self.ref_audio = ref_audio
+        self.gen_audio = gen_audio
+        self.rate = rate
+        self.key = key
+
 def eval_pesq(ref_audio: np.array, gen_audio: np.array, rate: int) -> float:
     """
     Evaluates audios using PESQ method.
@@ -18,7 +38,27 @@ def eval_pesq(ref_audio: np.array, gen_audio: np.array, rate: int) -> float:
     rate            : sample rate of both audios
     """
     try:
-        # Either pesq or pesq_batch (pesq_batch uses multiple cores)
+        # pesq_batch needs pairs of equal length, batches are scored by eval_pesq_batch
         return pesq(fs=rate, ref=ref_audio, deg=gen_audio, mode='wb')
     except Exception as e:
-        raise PesqEvaluationError
\ No newline at end of file
+        raise PesqEvaluationError(f"{type(e).__name__}: {e}") from e
+
+def eval_pesq_batch(pairs: list[tuple[np.ndarray, np.ndarray, int]]) -> list:
+    """
+    Evaluates a batch of pairs using PESQ method, run by a worker of the PESQ pool.
+    Errors are returned per pair, one invalid pair doesn't fail the batch.
+
+    Params:
+    pairs           : list of (reference, generated, sample rate)
+
+    Returns:
+        list of scores, PesqEvaluationError for pairs which couldn't be evaluated
+    """
+    scores = list()
+    for ref_audio, gen_audio, rate in pairs:
+        try:
+            scores.append(eval_pesq(ref_audio, gen_audio, rate))
+        except PesqEvaluationError as e:
+            # exception is returned, its cause (library error) isn't sent between processes
+            scores.append(PesqEvaluationError(str(e)))
+    return scores
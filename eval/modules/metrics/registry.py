@@ -0,0 +1,193 @@
+"""
+Registry of evaluation metrics
+Each metric declares inputs it needs and its cost. Evaluation computes only the
+shared stages (resampling, alignment) needed by selected metrics, e.g. audios
+aren't aligned when no metric of aligned signals is selected.
+A new metric is added by registering it in METRICS.
+"""
+import numpy as np
+from modules.audio import Audio
+from modules.alignment import align, alignment_features
+from modules.profiling import stage
+from modules.metrics.pesq import eval_pesq, PesqEvaluationError, PesqPair
+from modules.metrics.stoi import eval_intelligibility, StoiEvaluationError
+from modules.metrics.mcd import eval_mcd, spectrogram as mcd_spectrogram
+from modules.metrics.dnsmos import eval_dnsmos, eval_dnsmos_stream
+from modules.constants import ALIGNMENT_MODE
+
+# Inputs of metrics
+GENERATED   = "generated"   # generated audio only (non-intrusive)
+SIGNALS     = "signals"     # reference and generated signals at 16 kHz
+ALIGNED     = "aligned"     # reference and generated signals at 16 kHz aligned by DTW
+
+# Cost of shared stages (see cost of Metric)
+INPUT_COSTS = {GENERATED: 0.0, SIGNALS: 0.5, ALIGNED: 1.5}
+
+class MetricSelectionError(Exception):
+    """Selected metrics can't be evaluated"""
+    pass
+
+class Metric:
+    """
+    Evaluation metric with inputs it needs
+    """
+    def __init__(self, name: str, inputs: str, cost: float, evaluate, errors: tuple = (Exception,)):
+        """
+            Params:
+                name:       name of the metric in results
+                inputs:     inputs of the metric (GENERATED, SIGNALS or ALIGNED)
+                cost:       approximate seconds of one core to evaluate a minute of audio (see benchmark.py),
+                            without shared stages
+                evaluate:   function evaluating the metric from Inputs
+                errors:     exceptions of a failed evaluation, the score is "NaN"
+        """
+        self.name = name
+        self.inputs = inputs
+        self.cost = cost
+        self.evaluate = evaluate
+        self.errors = errors
+
+class Inputs:
+    """
+    Inputs of metrics of one pair of audios, shared stages are computed once and only when needed
+    """
+    def __init__(self, ref_audio: Audio | None, gen_audio: Audio, alignment: str = ALIGNMENT_MODE, deferred: tuple = ()):
+        """
+            Params:
+                ref_audio:  reference audio, None in non-intrusive evaluation
+                gen_audio:  generated audio
+                alignment:  alignment mode (see modules/alignment.py)
+                deferred:   names of metrics evaluated later in batches (e.g. PESQ, see pesq_stage)
+        """
+        self.ref_audio = ref_audio
+        self.gen_audio = gen_audio
+        self.alignment = alignment
+        self.deferred = deferred
+        self.values = dict()
+
+    def shared(self, name: str, compute):
+        """
+            Value shared by metrics, computed once
+
+            Params:
+                name:       name of the value
+                compute:    function computing the value
+        """
+        if name not in self.values:
+            self.values[name] = compute()
+        return self.values[name]
+
+    def signals(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Reference and generated signals at 16 kHz
+        """
+        return self.ref_audio.signal(16000), self.gen_audio.signal(16000)
+
+    def aligned(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Reference and generated signals at 16 kHz aligned by dynamic time warping,
+            either on features or raw audios
+        """
+        def compute():
+            with stage("align"):
+                ref_signal, gen_signal = self.signals()
+                ref_features = self.ref_audio.feature(f"alignment_{self.alignment}",
+                                                      lambda: alignment_features(ref_signal, 16000, self.alignment))
+                return align(ref_signal, gen_signal, 16000, mode=self.alignment, ref_features=ref_features)
+        return self.shared("aligned", compute)
+
+def eval_mos(audio: Audio) -> dict:
+    """
+    Evaluates audio using DNSMOS, memory-mapped audios are resampled
+    and scored window by window
+
+    Params:
+        audio           : generated audio
+
+    Returns:
+        MOS values
+    """
+    if audio.lazy:
+        # windows are read and resampled while they are scored
+        with stage("dnsmos"):
+            return eval_dnsmos_stream(audio.iter_windows(16000))
+    signal = audio.signal(16000)
+    with stage("dnsmos"):
+        return eval_dnsmos(signal)
+
+def mcd(inputs: Inputs) -> float:
+    # MCD is evaluated on the same decoded 16 kHz signals, aligned internally
+    ref_signal, gen_signal = inputs.signals()
+    with stage("mcd"):
+        return eval_mcd(ref=ref_signal, gen=gen_signal, rate=16000,
+                        ref_spectrogram=inputs.ref_audio.feature("mcd", lambda: mcd_spectrogram(ref_signal, 16000)))
+
+def pesq(inputs: Inputs):
+    ref_1d, gen_1d = inputs.aligned()
+    if "Pesq" in inputs.deferred:
+        return PesqPair(ref_1d, gen_1d, 16000)
+    with stage("pesq"):
+        return eval_pesq(ref_audio=ref_1d, gen_audio=gen_1d, rate=16000)
+
+def intelligibility(inputs: Inputs) -> tuple:
+    """STOI and ESTOI share their front end, both are evaluated at once"""
+    def compute():
+        ref_1d, gen_1d = inputs.aligned()
+        try:
+            # aligned audios are resampled to 16 kHz
+            with stage("stoi"):
+                return eval_intelligibility(ref_audio=ref_1d, gen_audio=gen_1d, rate=16000)
+        except StoiEvaluationError:
+            return "NaN", "NaN"
+    return inputs.shared("intelligibility", compute)
+
+# Registered metrics, in order of results
+METRICS = {metric.name: metric for metric in [
+    Metric("Mcd", SIGNALS, 10.0, mcd),
+    Metric("Pesq", ALIGNED, 4.0, pesq, errors=(PesqEvaluationError,)),
+    Metric("Stoi", ALIGNED, 0.3, lambda inputs: intelligibility(inputs)[0], errors=(StoiEvaluationError,)),
+    Metric("Estoi", ALIGNED, 0.3, lambda inputs: intelligibility(inputs)[1], errors=(StoiEvaluationError,)),
+    Metric("Mos", GENERATED, 75.0, lambda inputs: eval_mos(inputs.gen_audio)),
+]}
+
+def select_metrics(names: list[str] | None, intrusive: bool) -> list[str]:
+    """
+        Metrics to be evaluated, names are case insensitive. Metrics needing
+        reference audio aren't evaluated in non-intrusive evaluation.
+
+        Params:
+            names:          names of selected metrics, None for all metrics of the evaluation mode
+            intrusive:      whether the evaluation is intrusive
+
+        Returns:
+            names of metrics in order of METRICS
+    """
+    available = [name for name, metric in METRICS.items() if intrusive or metric.inputs == GENERATED]
+    if names is None:
+        return available
+    known = {name.lower(): name for name in METRICS}
+    unknown = [name for name in names if name.strip().lower() not in known]
+    if unknown:
+        raise MetricSelectionError(f"Unknown metrics {', '.join(unknown)}, available metrics are {', '.join(METRICS)}.")
+    selected = {known[name.strip().lower()] for name in names}
+    metrics = [name for name in available if name in selected]
+    if not metrics:
+        raise MetricSelectionError(f"None of selected metrics can be evaluated in {'intrusive' if intrusive else 'non-intrusive'} "
+                                   f"evaluation, available metrics are {', '.join(available)}.")
+    return metrics
+
+def plan_cost(metrics: list[str]) -> float:
+    """
+        Estimated cost of evaluation of selected metrics including their shared stages
+
+        Params:
+            metrics:        names of metrics
+
+        Returns:
+            approximate seconds of one core per minute of audio
+    """
+    inputs = {METRICS[name].inputs for name in metrics}
+    if ALIGNED in inputs:
+        # aligned signals are resampled as well
+        inputs.add(SIGNALS)
+    return sum(METRICS[name].cost for name in metrics) + sum(INPUT_COSTS[name] for name in inputs)
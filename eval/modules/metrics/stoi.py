@@ -1,14 +1,178 @@
 """
 Implementation of STOI and ESTOI evaluation metrics
 https://github.com/mpariente/pystoi
+
+Both metrics share their front end (resampling to 10 kHz, removal of silent frames,
+STFT and third-octave band decomposition), eval_intelligibility computes it once
+and returns both scores. Constants and steps follow pystoi.
 """
-from pystoi import stoi
+import warnings
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from pystoi import utils
+from pystoi.stoi import FS, N_FRAME, NFFT, OBM, N, BETA, DYN_RANGE
+
+# Score of pairs with too few frames (same as pystoi)
+SHORT_SCORE = 1e-5
 
 class StoiEvaluationError(Exception):
     """An error has occured during STOI/ESTOI evaluation"""
     pass
 
+def frames(x: np.ndarray, size: int, hop: int) -> np.ndarray:
+    """
+    Hann windowed frames of a signal, framed as in pystoi (the last complete frame is left out)
+
+    Params:
+    x               : signal
+    size            : frame length
+    hop             : hop between frames
+
+    Returns:
+        frames x size array
+    """
+    count = max(0, -(-(len(x) - size) // hop))
+    if count == 0:
+        return np.empty((0, size))
+    return sliding_window_view(x, size)[::hop][:count] * np.hanning(size + 2)[1:-1]
+
+def remove_silent_frames(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Removes frames which are more than DYN_RANGE dB quieter than the loudest frame of
+    the reference, remaining frames are overlapped and added (frames overlap by half)
+
+    Params:
+    x               : reference signal
+    y               : generated/degraded signal
+
+    Returns:
+        both signals without silent frames
+    """
+    hop = N_FRAME // 2
+    x_frames, y_frames = frames(x, N_FRAME, hop), frames(y, N_FRAME, hop)
+    if len(x_frames) == 0:
+        raise StoiEvaluationError("Audios are shorter than one frame.")
+    energies = 20 * np.log10(np.linalg.norm(x_frames, axis=1) + utils.EPS)
+    mask = energies > np.max(energies) - DYN_RANGE
+    signals = list()
+    for kept in (x_frames[mask], y_frames[mask]):
+        signal = np.zeros((len(kept) + 1) * hop)
+        signal[:-hop] += kept[:, :hop].ravel()
+        signal[hop:] += kept[:, hop:].ravel()
+        signals.append(signal)
+    return signals[0], signals[1]
+
+def band_segments(ref_audio: np.ndarray, gen_audio: np.ndarray, rate: int):
+    """
+    Shared front end of STOI and ESTOI - third-octave band envelopes
+    of both signals split into overlapping segments of N frames
+
+    Params:
+    ref_audio       : reference audio
+    gen_audio       : generated/degraded audio
+    rate            : sample rate of both audios
+
+    Returns:
+        reference and generated segments (segments x bands x N), None if there are less than N frames
+    """
+    if ref_audio.shape != gen_audio.shape:
+        raise StoiEvaluationError(f"Audios have different lengths, {ref_audio.shape} and {gen_audio.shape}.")
+    x, y = np.asarray(ref_audio, dtype=np.float64), np.asarray(gen_audio, dtype=np.float64)
+    if rate != FS:
+        x, y = utils.resample_oct(x, FS, rate), utils.resample_oct(y, FS, rate)
+    x, y = remove_silent_frames(x, y)
+    segments = list()
+    for signal in (x, y):
+        spectrum = np.fft.rfft(frames(signal, N_FRAME, N_FRAME // 2), n=NFFT, axis=1)
+        if len(spectrum) < N:
+            return None
+        # third-octave bands x frames
+        bands = np.sqrt(OBM @ np.square(np.abs(spectrum)).T)
+        segments.append(sliding_window_view(bands, N, axis=1).transpose(1, 0, 2))
+    return segments[0], segments[1]
+
+def normalize(x: np.ndarray, axis: int) -> np.ndarray:
+    """
+    Subtracts mean and divides by norm along an axis
+    """
+    x = x - np.mean(x, axis=axis, keepdims=True)
+    return x / (np.linalg.norm(x, axis=axis, keepdims=True) + utils.EPS)
+
+def segment_scores(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    STOI and ESTOI of each segment, scores of a pair are means over its segments
+
+    Params:
+    x               : reference segments (segments x bands x N)
+    y               : generated segments (segments x bands x N)
+
+    Returns:
+        STOI and ESTOI values of segments
+    """
+    # STOI - generated envelopes are scaled to the reference and clipped (lower SDR bound)
+    scaled = y * (np.linalg.norm(x, axis=2, keepdims=True) / (np.linalg.norm(y, axis=2, keepdims=True) + utils.EPS))
+    clipped = np.minimum(scaled, x * (1 + 10 ** (-BETA / 20)))
+    stoi = np.sum(normalize(clipped, 2) * normalize(x, 2), axis=(1, 2)) / x.shape[1]
+    # ESTOI - row and column normalized segments
+    estoi = np.sum(normalize(normalize(x, 2), 1) * normalize(normalize(y, 2), 1), axis=(1, 2)) / N
+    return stoi, estoi
+
+def eval_intelligibility_batch(pairs: list[tuple[np.ndarray, np.ndarray, int]]) -> list:
+    """
+    Evaluates a batch of pairs using STOI and ESTOI methods, segments of all pairs
+    are scored together. Errors are returned per pair.
+
+    Params:
+    pairs           : list of (reference, generated, sample rate)
+
+    Returns:
+        list of (STOI, ESTOI), StoiEvaluationError for pairs which couldn't be evaluated
+    """
+    scores = [None] * len(pairs)
+    indices, x_segments, y_segments = list(), list(), list()
+    for index, (ref_audio, gen_audio, rate) in enumerate(pairs):
+        try:
+            segments = band_segments(ref_audio, gen_audio, rate)
+        except StoiEvaluationError as e:
+            scores[index] = e
+            continue
+        except Exception as e:
+            scores[index] = StoiEvaluationError(f"{type(e).__name__}: {e}")
+            continue
+        if segments is None:
+            warnings.warn("Not enough STFT frames to compute intermediate intelligibility measure after "
+                          f"removing silent frames. Returning {SHORT_SCORE}.", RuntimeWarning)
+            scores[index] = (SHORT_SCORE, SHORT_SCORE)
+            continue
+        indices.append(index)
+        x_segments.append(segments[0])
+        y_segments.append(segments[1])
+    if indices:
+        counts = np.array([len(segments) for segments in x_segments])
+        stoi, estoi = segment_scores(np.concatenate(x_segments), np.concatenate(y_segments))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        stoi, estoi = np.add.reduceat(stoi, starts) / counts, np.add.reduceat(estoi, starts) / counts
+        for position, index in enumerate(indices):
+            scores[index] = (stoi[position].item(), estoi[position].item())
+    return scores
+
+def eval_intelligibility(ref_audio: np.ndarray, gen_audio: np.ndarray, rate: int) -> tuple[float, float]:
+    """
+    Evaluates audios using STOI and ESTOI methods, their front end is computed once
+
+    Params:
+    ref_audio       : reference audio
+    gen_audio       : generated/degraded audio
+    rate            : sample rate of both audios
+
+    Returns:
+        STOI and ESTOI
+    """
+    scores = eval_intelligibility_batch([(ref_audio, gen_audio, rate)])[0]
+    if isinstance(scores, StoiEvaluationError):
+        raise scores
+    return scores
+
 def eval_stoi(ref_audio: np.ndarray, gen_audio: np.ndarray, rate: int) -> float:
     """
     Evaluates audios using STOI method.
@@ -18,11 +182,8 @@ def eval_stoi(ref_audio: np.ndarray, gen_audio: np.ndarray, rate: int) -> float:
     gen_audio       : generated/degraded audio
     rate            : sample rate of both audios
     """
-    try:
-        return stoi(ref_audio, gen_audio, rate, extended = False)
-    except Exception as e:
-        raise StoiEvaluationError
-    
+    return eval_intelligibility(ref_audio, gen_audio, rate)[0]
+
 def eval_estoi(ref_audio: np.ndarray, gen_audio: np.ndarray, rate: int) -> float:
     """
     Evaluates audios using ESTOI method
@@ -32,7 +193,4 @@ def eval_estoi(ref_audio: np.ndarray, gen_audio: np.ndarray, rate: int) -> float
     gen_audio       : generated/degraded audio
     rate            : sample rate of both audios
     """
-    try:
-        return stoi(ref_audio, gen_audio, rate, extended = True)
-    except Exception as e:
-        raise StoiEvaluationError
\ No newline at end of file
+    return eval_intelligibility(ref_audio, gen_audio, rate)[1]
@@ -1,14 +1,51 @@
 """
     This script contains logic for graphs generation and table value calcultion.
+    Results are flattened once into a dataframe of numeric columns (MOS dicts
+    are split into their sub-scores) and statistics of all columns are computed
+    together on a single numpy array.
 """
 
 __author__      = "Roman Machala"
 __date__        = "09.03.2025"
 __version__     = "0.1"
 
+import warnings
+import numpy as np
 import seaborn as sns
 import pandas as pd
 import matplotlib.pyplot as plt
+from scipy import stats as sp_stats
+from modules.handlers.columnar_handler import results_columns, MOS_COLUMNS
+
+# Statistics shown in tables, in order of table columns
+TABLE_STATS = ["mean", "median", "min", "max", "std", "ci_low", "ci_high", "p5", "p95"]
+PERCENTILES = [5, 25, 50, 75, 95]
+CONFIDENCE  = 0.95
+
+def results_frame(results: list[dict]) -> tuple[pd.DataFrame, list[str]]:
+    """
+        Flattens evaluated results into a dataframe (see results_columns)
+
+        Params:
+            results:        list of results ({"file", "metrics"})
+
+        Returns:
+            dataframe with file column and float column for each value, names of metrics
+    """
+    columns, metrics = results_columns(results)
+    return pd.DataFrame(columns), metrics
+
+def metric_columns(metric: str) -> list[str]:
+    """
+        Dataframe columns of a metric
+
+        Params:
+            metric:         name of the metric
+
+        Returns:
+            list of columns
+    """
+    return MOS_COLUMNS if metric == "Mos" else [metric]
 
 def is_valid(data: pd.DataFrame, metric: str):
     """
@@ -21,17 +58,11 @@ def is_valid(data: pd.DataFrame, metric: str):
         Returns:
             true if dataframe is valid else false
     """
-    if metric == "Mos" and data[metric].apply(lambda x: pd.isna(x) or (isinstance(x, dict) and not x)).all():
-        return False
-    else:
-        if data[metric].isna().all():
-            return False
-        
-    return True
+    return bool(data[metric_columns(metric)].notna().to_numpy().any())
 
 def analysis(data: pd.DataFrame, metric: str, save_path: str, filename: str):
     """
-        Function for graph generation. 
+        Function for graph generation.
 
         Params:
             data:       pandas dataframe, containing data
@@ -40,41 +71,61 @@ def analysis(data: pd.DataFrame, metric: str, save_path: str, filename: str):
             filename:   name of the filename (used for title of the graph)
     """
 
-    sns.histplot(data[metric] if metric != 'Mos' else data[metric].apply(pd.Series), kde=True, bins=40 if metric == 'Mos' else 20)
+    sns.histplot(data[metric] if metric != 'Mos' else data[MOS_COLUMNS], kde=True, bins=40 if metric == 'Mos' else 20)
     plt.title(f'{filename}')
     plt.xlabel(f'{metric} score')
     plt.ylabel("Frequency")
     plt.savefig(save_path)
     plt.close()
 
-def mos_handler(data: pd.DataFrame, column: str, metric: str) -> list[int]:
+def statistics(data: pd.DataFrame, columns: list[str]) -> dict[str, dict]:
     """
-        Helper function for value calculation.
+        Statistics of selected columns, all of them are computed at once, NaNs are ignored
 
         Params:
             data:       pandas dataframe containing data
-            column:     which column to calculate from
-            metric:     name of the metric
+            columns:    columns to be described
 
         Returns:
-            calculated values as a list of integers (4)
+            dict of column to its statistics (count, mean, median, min, max, std,
+            confidence interval of the mean and percentiles)
     """
-    return [data[metric].apply(pd.Series).loc[:, column].mean(), data[metric].apply(pd.Series).loc[:, column].median(),
-                data[metric].apply(pd.Series).loc[:, column].min(), data[metric].apply(pd.Series).loc[:, column].max()]
+    values = data[columns].to_numpy(dtype=np.float64)
+    count = np.count_nonzero(~np.isnan(values), axis=0)
+    with warnings.catch_warnings():
+        # columns without values (or a single one for std) give NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(values, axis=0)
+        std = np.nanstd(values, axis=0, ddof=1)
+        percentiles = np.nanpercentile(values, PERCENTILES, axis=0)
+        low, high = np.nanmin(values, axis=0), np.nanmax(values, axis=0)
+        # confidence interval of the mean using Student's t-distribution
+        half_width = sp_stats.t.ppf(0.5 + CONFIDENCE / 2, count - 1) * std / np.sqrt(count)
+    described = {
+        "count": count,
+        "mean": mean,
+        "median": percentiles[PERCENTILES.index(50)],
+        "min": low,
+        "max": high,
+        "std": std,
+        "ci_low": mean - half_width,
+        "ci_high": mean + half_width,
+        **{f"p{p}": percentiles[i] for i, p in enumerate(PERCENTILES) if p != 50},
+    }
+    return {column: {name: value[i].item() for name, value in described.items()} for i, column in enumerate(columns)}
 
-def table(data: pd.DataFrame, metric: str) -> list[int]:
+def table(stats: dict[str, dict], metric: str) -> list:
     """
         Function to calculate values for table.
 
         Params:
-            data:       pandas dataframe containing data
+            stats:      statistics of dataframe columns (see statistics)
             metric:     name of the metric
 
         Returns:
-            calculated values as a list of integers or a list of lists for MOS
+            calculated values (TABLE_STATS) as a list or a list of lists for MOS
     """
     if metric == 'Mos':
-        return [mos_handler(data, 'ovrl_mos', metric), mos_handler(data, 'sig_mos', metric),
-                mos_handler(data, 'bak_mos', metric), mos_handler(data, 'p808_mos', metric)]
+        return [[stats[column][name] for name in TABLE_STATS] for column in MOS_COLUMNS]
     else:
-        return [data.loc[:, metric].mean(), data.loc[:, metric].median(), data.loc[:, metric].min(), data.loc[:, metric].max()]
\ No newline at end of file
+        return [stats[metric][name] for name in TABLE_STATS]
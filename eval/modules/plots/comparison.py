@@ -0,0 +1,300 @@
+"""
+    This script contains comparison of evaluation runs stored in results files.
+    Runs are joined on the utterance (reference file name) or the generated file and compared
+    to a baseline run with paired statistics - mean difference with t-interval
+    and bootstrap interval, p-value and per-utterance win rates. All runs and
+    metrics share one resampling matrix, so bootstrap is a single matrix product.
+    Comparisons are cached until any of the compared results files changes.
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import hashlib
+import json
+import os
+import threading
+import warnings
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy import stats as sp_stats
+from modules.plots.analysis import results_frame, CONFIDENCE
+from modules.plots.summary import file_key
+from modules.handlers.columnar_handler import ColumnarResults, is_columnar
+from modules.handlers.results_handler import read_results
+from modules.handlers.log_handler import convert, finite
+from modules.constants import (COMPARISONS_PATH, COMPARISON_VERSION, COMPARISON_RESAMPLES, COMPARISON_CHUNK,
+                               COMPARISON_FRAMES, COMPARISON_KEY, LOWER_IS_BETTER)
+
+# keys runs are joined on - utterance ID (file name of the reference audio without extension, of the generated
+# audio in non-intrusive results), whole meta file line, path or file name of the generated audio, reference audio
+JOIN_KEYS = ["utterance", "line", "generated", "name", "reference"]
+
+class ComparisonError(Exception):
+    """Runs couldn't be compared"""
+    pass
+
+# recently loaded runs (dataframes indexed by join key), shared by requests
+frames = OrderedDict()
+frames_lock = threading.Lock()
+
+def join_keys(lines: pd.Series, key: str, intrusive: bool) -> pd.Series:
+    """
+        Join keys of results
+
+        Params:
+            lines:          meta file lines of results
+            key:            join key (see JOIN_KEYS)
+            intrusive:      whether lines contain reference and generated audio
+
+        Returns:
+            series of keys, missing keys (reference of non-intrusive results) are NaN
+    """
+    lines = lines.astype(str).str.strip()
+    if key == "line":
+        return lines
+    # intrusive lines are "ref gen", non-intrusive lines start with the generated audio
+    parts = lines.str.split(" ")
+    if key == "reference":
+        return parts.str[0] if intrusive else pd.Series(np.nan, index=lines.index)
+    generated = parts.str[1 if intrusive else 0]
+    if key == "utterance":
+        # systems are evaluated against the same references, their generated audios have their own paths
+        names = (parts.str[0] if intrusive else generated).str.replace("\\", "/", regex=False).str.split("/").str[-1]
+        return names.str.rsplit(".", n=1).str[0]
+    # runs of different systems usually have the same file names in different folders
+    return generated.str.replace("\\", "/", regex=False).str.split("/").str[-1] if key == "name" else generated
+
+def load_run(results_file: str, key: str) -> pd.DataFrame:
+    """
+        Values of a run indexed by join key, duplicate keys keep the last result
+
+        Params:
+            results_file:   path of the results file
+            key:            join key (see JOIN_KEYS)
+
+        Returns:
+            dataframe of float columns
+    """
+    cache_key = (os.path.abspath(results_file), key)
+    stat = file_key(results_file)
+    with frames_lock:
+        cached = frames.get(cache_key)
+        if cached is not None and cached[0] == stat:
+            frames.move_to_end(cache_key)
+            return cached[1]
+
+    if is_columnar(results_file):
+        with ColumnarResults(results_file) as results:
+            data = results.frame()
+            intrusive = results.header.get("intrusive", False)
+    else:
+        raw_data = read_results(results_file)
+        data, _ = results_frame(raw_data["results"])
+        intrusive = raw_data.get("intrusive", False)
+    data.index = join_keys(data.pop("file"), key, intrusive)
+    data = data[data.index.notna() & ~data.index.duplicated(keep="last")]
+
+    with frames_lock:
+        frames[cache_key] = (stat, data)
+        frames.move_to_end(cache_key)
+        while len(frames) > COMPARISON_FRAMES:
+            frames.popitem(last=False)
+    return data
+
+def bootstrap_means(diffs: np.ndarray, valid: np.ndarray, resamples: int, rng: np.random.Generator,
+                    chunk_size: int = COMPARISON_CHUNK) -> np.ndarray:
+    """
+        Bootstrap distribution of mean differences of all columns at once, each resample
+        is a row of counts (how many times an utterance was drawn), so means of a chunk
+        of resamples are one matrix product. Missing values don't contribute.
+
+        Params:
+            diffs:          paired differences (utterances x columns), NaN where missing
+            valid:          mask of present differences
+            resamples:      number of bootstrap resamples
+            rng:            random generator
+            chunk_size:     number of resamples drawn at once
+
+        Returns:
+            means of resamples (resamples x columns)
+    """
+    n, columns = diffs.shape
+    means = np.full((resamples, columns), np.nan)
+    if n == 0:
+        return means
+    filled = np.where(valid, diffs, 0.0)
+    weights = valid.astype(np.float64)
+    for start in range(0, resamples, chunk_size):
+        size = min(chunk_size, resamples - start)
+        drawn = rng.integers(0, n, size=(size, n), dtype=np.int32)
+        # counts of drawn utterances, one row per resample
+        counts = np.bincount((drawn + (np.arange(size, dtype=np.int64) * n)[:, None]).ravel(),
+                             minlength=size * n).reshape(size, n).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[start:start + size] = (counts @ filled) / (counts @ weights)
+    return means
+
+def paired_statistics(diffs: np.ndarray, lower_better: np.ndarray, resamples: int, confidence: float,
+                      rng: np.random.Generator) -> dict[str, np.ndarray]:
+    """
+        Paired statistics of differences (run - baseline) of all columns
+
+        Params:
+            diffs:          paired differences (utterances x columns), NaN where missing
+            lower_better:   mask of columns where a lower value is better
+            resamples:      number of bootstrap resamples
+            confidence:     confidence level of intervals
+            rng:            random generator
+
+        Returns:
+            dict of statistic name to values of columns
+    """
+    valid = ~np.isnan(diffs)
+    count = valid.sum(axis=0)
+    # positive differences are improvements
+    improvement = np.where(lower_better, -diffs, diffs)
+    with warnings.catch_warnings():
+        # columns without (enough) pairs give NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(diffs, axis=0)
+        std = np.nanstd(diffs, axis=0, ddof=1)
+        sem = std / np.sqrt(count)
+        half_width = sp_stats.t.ppf(0.5 + confidence / 2, count - 1) * sem
+        p_value = 2 * sp_stats.t.sf(np.abs(mean / sem), count - 1)
+        means = bootstrap_means(diffs, valid, resamples, rng)
+        boot_low, boot_high = np.nanpercentile(means, [50 * (1 - confidence), 50 * (1 + confidence)], axis=0)
+        wins = (improvement > 0).sum(axis=0)
+        losses = (improvement < 0).sum(axis=0)
+        win_rate = wins / count
+    return {
+        "count": count,
+        "diff_mean": mean,
+        "diff_std": std,
+        "ci_low": mean - half_width,
+        "ci_high": mean + half_width,
+        "bootstrap_low": boot_low,
+        "bootstrap_high": boot_high,
+        "p_value": p_value,
+        "wins": wins,
+        "losses": losses,
+        "ties": count - wins - losses,
+        "win_rate": win_rate,
+    }
+
+def compare_runs(results_files: list[str], baseline: str = None, key: str = COMPARISON_KEY,
+                 resamples: int = COMPARISON_RESAMPLES, confidence: float = CONFIDENCE, seed: int = 0) -> dict:
+    """
+        Compares runs to a baseline run on utterances present in both of them
+
+        Params:
+            results_files:  paths of results files
+            baseline:       path of the baseline results file, first file by default
+            key:            join key (see JOIN_KEYS)
+            resamples:      number of bootstrap resamples
+            confidence:     confidence level of intervals
+            seed:           seed of bootstrap resampling
+
+        Returns:
+            dict with baseline, runs and statistics of each run and value column
+    """
+    if key not in JOIN_KEYS:
+        raise ComparisonError(f"Unknown join key {key}, use one of {JOIN_KEYS}.")
+    baseline = baseline or results_files[0]
+    runs = [results_file for results_file in results_files if results_file != baseline]
+    if not runs:
+        raise ComparisonError("At least two runs are needed for a comparison.")
+
+    base = load_run(baseline, key)
+    # all runs are aligned to utterances of the baseline, so they share resamples
+    blocks, layout = list(), list()
+    for results_file in runs:
+        data = load_run(results_file, key)
+        columns = [column for column in base.columns if column in data.columns]
+        aligned = data[columns].reindex(base.index)
+        blocks.append(aligned.to_numpy(dtype=np.float64) - base[columns].to_numpy(dtype=np.float64))
+        matched = int(base.index.isin(data.index).sum())
+        unmatched = {"baseline": len(base) - matched, "run": int((~data.index.isin(base.index)).sum())}
+        layout.append((results_file, columns, matched, unmatched, aligned.mean()))
+    if not any(matched for _, _, matched, _, _ in layout):
+        raise ComparisonError(f"No utterances of the runs match the baseline on join key {key} "
+                              f"({len(base)} baseline rows unmatched), use another join key.")
+    diffs = np.hstack(blocks) if blocks else np.empty((len(base), 0))
+    names = [column for _, columns, _, _, _ in layout for column in columns]
+    lower_better = np.array([column in LOWER_IS_BETTER for column in names], dtype=bool)
+    stats = paired_statistics(diffs, lower_better, resamples, confidence, np.random.default_rng(seed))
+
+    comparison = {
+        "key": key,
+        "baseline": os.path.basename(baseline),
+        "resamples": resamples,
+        "confidence": confidence,
+        "runs": dict(),
+    }
+    position = 0
+    for results_file, columns, matched, unmatched, means in layout:
+        values = dict()
+        for column in columns:
+            values[column] = {name: value[position].item() for name, value in stats.items()}
+            values[column]["baseline_mean"] = base[column].mean()
+            values[column]["mean"] = means[column]
+            values[column]["lower_is_better"] = column in LOWER_IS_BETTER
+            position += 1
+        comparison["runs"][os.path.basename(results_file)] = {"matched": matched, "unmatched": unmatched, "metrics": values}
+    return comparison
+
+def comparison_path(results_files: list[str], **params) -> str:
+    """
+        Path of a cached comparison, it depends on content of results files and parameters
+
+        Params:
+            results_files:  paths of results files
+            params:         parameters of the comparison
+
+        Returns:
+            path of the cached comparison
+    """
+    identity = {
+        "version": COMPARISON_VERSION,
+        "files": [[os.path.abspath(results_file), file_key(results_file)] for results_file in results_files],
+        "params": params,
+    }
+    digest = hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+    return os.path.join(COMPARISONS_PATH, f"{digest}.json")
+
+def get_comparison(results_files: list[str], baseline: str = None, key: str = COMPARISON_KEY,
+                   resamples: int = COMPARISON_RESAMPLES, confidence: float = CONFIDENCE) -> dict:
+    """
+        Comparison of runs, computed only if it isn't cached or any of the results files has changed
+
+        Params:
+            results_files:  paths of results files
+            baseline:       path of the baseline results file, first file by default
+            key:            join key (see JOIN_KEYS)
+            resamples:      number of bootstrap resamples
+            confidence:     confidence level of intervals
+
+        Returns:
+            comparison (see compare_runs)
+    """
+    for results_file in results_files + ([baseline] if baseline else []):
+        if not os.path.isfile(results_file):
+            raise ComparisonError(f"Results file {os.path.basename(results_file)} doesn't exist.")
+    path = comparison_path(results_files, baseline=baseline and os.path.abspath(baseline), key=key,
+                           resamples=resamples, confidence=confidence)
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass # damaged cache is computed again
+
+    # undefined statistics (e.g. a single pair) aren't valid JSON
+    comparison = finite(convert(compare_runs(results_files, baseline, key, resamples, confidence)))
+    os.makedirs(COMPARISONS_PATH, exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(comparison, f, default=convert)
+    os.replace(path + ".tmp", path)
+    return comparison
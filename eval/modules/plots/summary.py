@@ -0,0 +1,203 @@
+"""
+    This script contains cached summaries of results files used by the analysis.
+    Table values and graphs of a results file are computed once and stored
+    in a summary next to the results file. The summary is valid as long as
+    the results file doesn't change (size and modification time, or its hash
+    when only the modification time has changed).
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import copy
+import json
+import os
+import threading
+from modules.plots.analysis import analysis, table, is_valid, results_frame, statistics, metric_columns, TABLE_STATS
+from modules.handlers.results_handler import read_results, results_files
+from modules.handlers.columnar_handler import ColumnarResults, is_columnar
+from modules.handlers.upload_handler import file_sha256
+from modules.handlers.log_handler import convert, finite
+from modules.metrics.registry import METRICS
+from modules.constants import GRAPHS_PATH, PLOTS_RESULT, SUMMARY_SUFFIX, SUMMARY_VERSION
+
+# matplotlib isn't thread safe, summaries are built one at a time
+summary_lock = threading.Lock()
+
+def summary_path(results_file: str) -> str:
+    """
+        Path of the summary of a results file
+
+        Params:
+            results_file:   path of the results file
+
+        Returns:
+            path of the summary
+    """
+    # full file name, results.json and results.jsonl have their own summaries
+    return results_file + SUMMARY_SUFFIX
+
+def file_key(results_file: str) -> dict:
+    """
+        Identification of the results file content without reading it
+
+        Params:
+            results_file:   path of the results file
+
+        Returns:
+            dict with size and mtime
+    """
+    stat = os.stat(results_file)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+def save_summary(results_file: str, summary: dict):
+    """
+        Saves summary next to the results file atomically
+
+        Params:
+            results_file:   path of the results file
+            summary:        summary to be saved
+    """
+    path = summary_path(results_file)
+    with open(path + ".tmp", "w") as f:
+        json.dump(summary, f, default=convert)
+    os.replace(path + ".tmp", path)
+
+def load_summary(results_file: str) -> dict | None:
+    """
+        Loads summary of a results file if it is still valid
+
+        Params:
+            results_file:   path of the results file
+
+        Returns:
+            summary or None if it doesn't exist or the results file has changed
+    """
+    path = summary_path(results_file)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            summary = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if summary.get("version") != SUMMARY_VERSION:
+        return None
+    key = file_key(results_file)
+    if summary["key"] != key:
+        # only touched or copied, content is compared by hash
+        if summary["key"]["size"] != key["size"] or summary["sha256"] != file_sha256(results_file):
+            return None
+        summary["key"] = key
+        save_summary(results_file, summary)
+    # graphs may have been removed (e.g. cleared cache)
+    for values in summary["metrics"].values():
+        if values["plot"] is not None and not os.path.exists(values["plot"]):
+            return None
+    return summary
+
+def build_summary(results_file: str) -> dict:
+    """
+        Computes table values and graphs of a results file and stores them as its summary
+
+        Params:
+            results_file:   path of the results file
+
+        Returns:
+            summary
+    """
+    key = file_key(results_file)
+    sha256 = file_sha256(results_file)
+    if is_columnar(results_file):
+        # only value columns are read from the archive
+        with ColumnarResults(results_file) as results:
+            data = results.frame([column for column in results.columns if column != 'file'])
+            metrics = results.metrics
+    else:
+        raw_data = read_results(results_file)
+        # Creates dataframe, MOS values are split into columns
+        data, metrics = results_frame(raw_data['results'])
+    file_name = os.path.splitext(os.path.basename(results_file))[0]
+    # statistics of all values are computed at once
+    stats = statistics(data, [column for column in data.columns if column != 'file'])
+
+    summary = {"version": SUMMARY_VERSION, "key": key, "sha256": sha256, "file_name": file_name, "metrics": dict()}
+    # For each metric creates a graph and table values
+    for metric in metrics:
+        if is_valid(data, metric):
+            plot_path = os.path.join(GRAPHS_PATH, f'{os.path.basename(results_file)}_{metric}.png')
+            analysis(data, metric, plot_path, file_name)
+            summary["metrics"][metric] = {"plot": plot_path, "values": table(stats, metric),
+                                          "stats": {column: stats[column] for column in metric_columns(metric)}}
+        else:
+            summary["metrics"][metric] = {"plot": None, "values": None, "stats": None}
+    save_summary(results_file, summary)
+    return summary
+
+def get_summary(results_file: str) -> dict:
+    """
+        Summary of a results file, computed only if the results file is new or has changed
+
+        Params:
+            results_file:   path of the results file
+
+        Returns:
+            summary
+    """
+    with summary_lock:
+        summary = load_summary(results_file)
+        if summary is None:
+            summary = build_summary(results_file)
+        return summary
+
+def web_path(plot_path: str) -> str:
+    """
+        Path of a graph used by the web page
+
+        Params:
+            plot_path:      path of the graph on disk
+
+        Returns:
+            path of the graph in web
+    """
+    return plot_path.replace("static" + os.sep, "/static/").replace("\\", "/")
+
+def collect_plots(upload_path: str) -> dict:
+    """
+        Graphs and table values of all results files in a folder
+
+        Params:
+            upload_path:    folder containing results files
+
+        Returns:
+            dict in PLOTS_RESULT structure
+    """
+    os.makedirs(exist_ok=True, name=GRAPHS_PATH)
+    generated_plots = copy.deepcopy(PLOTS_RESULT)
+    summaries = list()
+    for filename in results_files(upload_path):
+        try:
+            summaries.append(get_summary(os.path.join(upload_path, filename)))
+        except Exception:
+            #TODO better handling, if and exception occurs skips it
+            continue
+    # files may contain different metrics (see --metrics), registered metrics go first
+    found = dict.fromkeys(metric for summary in summaries for metric in summary["metrics"])
+    metrics = [metric for metric in METRICS if metric in found] + [metric for metric in found if metric not in METRICS]
+    for summary in summaries:
+        generated_plots['tables']['Files'].append(summary["file_name"])
+        for metric in metrics:
+            values = summary["metrics"].get(metric) or {"plot": None, "values": None}
+            columns = metric_columns(metric)
+            for index, column in enumerate(columns):
+                if values["values"] is None:
+                    row = [None] * len(TABLE_STATS)
+                else:
+                    # MOS has a row of each of its columns
+                    row = values["values"][index] if len(columns) > 1 else values["values"]
+                generated_plots['tables']['Values'].setdefault(column, list()).append(row)
+            # adds generated graph path to corresponding metric in dict
+            generated_plots['plots'].setdefault(metric, list()).append(web_path(values["plot"]) if values["plot"] else None)
+    # undefined statistics (e.g. std of a single value) aren't valid JSON
+    return finite(generated_plots)
@@ -0,0 +1,293 @@
+"""
+    This file contains instrumentation of evaluation stages.
+    Wall and CPU time of stages (loading, resampling, alignment and metrics) is recorded
+    into the profile of the evaluated line, time of nested stages is excluded from their
+    parent stage, so times of all stages add up. Profiles are stored with results,
+    aggregated per run and into process-wide metrics exposed in Prometheus text format.
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from modules.constants import PROFILE_BUCKETS
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, RSS isn't reported
+    resource = None
+
+# Instrumented stages, in order of evaluation
+STAGES = ["load", "resample", "align", "mcd", "pesq", "stoi", "dnsmos"]
+
+# profile of the line evaluated by current thread
+local = threading.local()
+
+def max_rss() -> int | None:
+    """
+        Peak resident set size of current process
+
+        Returns:
+            size in bytes, None if it isn't available
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+class Profile:
+    """
+        Wall and CPU time of stages of one evaluated line
+    """
+    def __init__(self):
+        self.wall = dict()
+        self.cpu = dict()
+        # time of nested stages of running stages
+        self.nested = list()
+
+    def add(self, name: str, wall: float, cpu: float):
+        """
+            Adds time to a stage
+
+            Params:
+                name:       name of the stage
+                wall:       wall time in seconds
+                cpu:        CPU time in seconds
+        """
+        self.wall[name] = self.wall.get(name, 0.0) + wall
+        self.cpu[name] = self.cpu.get(name, 0.0) + cpu
+
+    def to_dict(self) -> dict:
+        """
+            Profile stored in the result record
+
+            Returns:
+                dict with wall and CPU time of stages and peak RSS of the process
+        """
+        return {
+            "wall": {name: round(value, 6) for name, value in self.wall.items()},
+            "cpu": {name: round(value, 6) for name, value in self.cpu.items()},
+            "max_rss": max_rss(),
+        }
+
+@contextmanager
+def profiled(profile: Profile = None):
+    """
+        Records stages of current thread into a profile
+
+        Params:
+            profile:        profile to be extended, a new one when not given
+
+        Returns:
+            context manager yielding the profile
+    """
+    previous = getattr(local, "profile", None)
+    local.profile = profile = profile if profile is not None else Profile()
+    try:
+        yield profile
+    finally:
+        local.profile = previous
+
+@contextmanager
+def stage(name: str):
+    """
+        Measures a stage, nothing is recorded outside of profiled()
+
+        Params:
+            name:           name of the stage (see STAGES)
+    """
+    profile = getattr(local, "profile", None)
+    if profile is None:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.process_time()
+    profile.nested.append([0.0, 0.0])
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        nested_wall, nested_cpu = profile.nested.pop()
+        profile.add(name, wall - nested_wall, cpu - nested_cpu)
+        if profile.nested:
+            profile.nested[-1][0] += wall
+            profile.nested[-1][1] += cpu
+
+def merge_profiles(profiles: list[dict], weight: float = 1.0) -> dict:
+    """
+        Sums profiles of result records (e.g. segments of one line)
+
+        Params:
+            profiles:       profiles (see Profile.to_dict)
+            weight:         factor of summed times (share of a batch)
+
+        Returns:
+            merged profile
+    """
+    merged = {"wall": dict(), "cpu": dict(), "max_rss": None}
+    for profile in profiles:
+        for kind in ("wall", "cpu"):
+            for name, value in profile.get(kind, dict()).items():
+                merged[kind][name] = merged[kind].get(name, 0.0) + value * weight
+        if profile.get("max_rss") is not None:
+            merged["max_rss"] = max(merged["max_rss"] or 0, profile["max_rss"])
+    for kind in ("wall", "cpu"):
+        merged[kind] = {name: round(value, 6) for name, value in merged[kind].items()}
+    return merged
+
+class RunProfile:
+    """
+        Stage times of all results of one run (job)
+    """
+    def __init__(self):
+        self.lines = 0
+        self.failed = 0
+        self.wall = dict()
+        self.cpu = dict()
+        self.max_rss = None
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def add(self, result):
+        """
+            Adds a result of the run
+
+            Params:
+                result:     result record or an exception of a line which couldn't be evaluated
+        """
+        with self.lock:
+            if isinstance(result, Exception):
+                self.failed += 1
+                return
+            self.lines += 1
+            profile = result.get("profile") or dict()
+            for kind, totals in (("wall", self.wall), ("cpu", self.cpu)):
+                for name, value in profile.get(kind, dict()).items():
+                    totals[name] = totals.get(name, 0.0) + value
+            if profile.get("max_rss") is not None:
+                self.max_rss = max(self.max_rss or 0, profile["max_rss"])
+
+    def summary(self) -> dict:
+        """
+            Aggregated profile of the run
+
+            Returns:
+                dict with numbers of lines, total/mean wall and CPU time of stages,
+                their share of the total wall time and peak RSS of workers
+        """
+        with self.lock:
+            total = sum(self.wall.values())
+            stages = dict()
+            for name in [name for name in STAGES if name in self.wall] + [name for name in self.wall if name not in STAGES]:
+                stages[name] = {
+                    "wall": self.wall[name],
+                    "cpu": self.cpu.get(name, 0.0),
+                    "mean": self.wall[name] / self.lines if self.lines else None,
+                    "share": self.wall[name] / total if total else None,
+                }
+            return {"lines": self.lines, "failed": self.failed, "elapsed": time.time() - self.started,
+                    "stages": stages, "max_rss": self.max_rss}
+
+    def format(self) -> str:
+        """
+            Profile summary printed at the end of a CLI run
+
+            Returns:
+                table of stages
+        """
+        summary = self.summary()
+        rows = [f"Profile of {summary['lines']} evaluated, {summary['failed']} failed lines in {summary['elapsed']:.1f} s:",
+                f"  {'stage':<10}{'wall [s]':>10}{'cpu [s]':>10}{'mean [ms]':>11}{'share':>8}"]
+        for name, values in summary["stages"].items():
+            rows.append(f"  {name:<10}{values['wall']:>10.2f}{values['cpu']:>10.2f}"
+                        f"{(values['mean'] or 0) * 1000:>11.1f}{(values['share'] or 0) * 100:>7.1f}%")
+        if summary["max_rss"] is not None:
+            rows.append(f"  peak worker RSS: {summary['max_rss'] / 2 ** 20:.0f} MiB")
+        return "\n".join(rows)
+
+class MetricsRegistry:
+    """
+        Process-wide counters and histograms of evaluated results
+    """
+    def __init__(self, buckets: list[float] = PROFILE_BUCKETS):
+        """
+            Params:
+                buckets:        upper bounds (seconds) of histogram buckets
+        """
+        self.buckets = sorted(buckets)
+        self.lines = {"evaluated": 0, "failed": 0}
+        # stage -> [bucket counts, sum of wall time, count]
+        self.histograms = dict()
+        self.cpu = dict()
+        self.max_rss = None
+        self.lock = threading.Lock()
+
+    def observe(self, result):
+        """
+            Adds a result into the metrics
+
+            Params:
+                result:     result record or an exception of a line which couldn't be evaluated
+        """
+        with self.lock:
+            if isinstance(result, Exception):
+                self.lines["failed"] += 1
+                return
+            self.lines["evaluated"] += 1
+            profile = result.get("profile") or dict()
+            for name, value in profile.get("wall", dict()).items():
+                histogram = self.histograms.setdefault(name, [[0] * len(self.buckets), 0.0, 0])
+                for i, bound in enumerate(self.buckets):
+                    if value <= bound:
+                        histogram[0][i] += 1
+                histogram[1] += value
+                histogram[2] += 1
+            for name, value in profile.get("cpu", dict()).items():
+                self.cpu[name] = self.cpu.get(name, 0.0) + value
+            if profile.get("max_rss") is not None:
+                self.max_rss = max(self.max_rss or 0, profile["max_rss"])
+
+    def render(self, extra: list[tuple[str, str, str, float]] = ()) -> str:
+        """
+            Metrics in Prometheus text exposition format
+
+            Params:
+                extra:      additional metrics (name, type, description, value), e.g. queue depth
+
+            Returns:
+                text of the metrics
+        """
+        lines = list()
+        def metric(name: str, kind: str, description: str, samples: list[tuple[str, float]]):
+            lines.extend([f"# HELP {name} {description}", f"# TYPE {name} {kind}"])
+            lines.extend(f"{name}{labels} {value:g}" if isinstance(value, float) else f"{name}{labels} {value}"
+                         for labels, value in samples)
+
+        with self.lock:
+            metric("audioeval_lines_total", "counter", "Evaluated meta file lines by result",
+                   [(f'{{result="{name}"}}', value) for name, value in self.lines.items()])
+            lines.extend(["# HELP audioeval_stage_seconds Wall time of evaluation stages per line",
+                          "# TYPE audioeval_stage_seconds histogram"])
+            for name, (counts, total, count) in self.histograms.items():
+                for bound, value in zip(self.buckets, counts):
+                    lines.append(f'audioeval_stage_seconds_bucket{{stage="{name}",le="{bound:g}"}} {value}')
+                lines.append(f'audioeval_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+                lines.append(f'audioeval_stage_seconds_sum{{stage="{name}"}} {total:g}')
+                lines.append(f'audioeval_stage_seconds_count{{stage="{name}"}} {count}')
+            metric("audioeval_stage_cpu_seconds_total", "counter", "CPU time of evaluation stages",
+                   [(f'{{stage="{name}"}}', value) for name, value in self.cpu.items()])
+            if self.max_rss is not None:
+                metric("audioeval_worker_max_rss_bytes", "gauge", "Peak resident set size of evaluation workers",
+                       [("", self.max_rss)])
+        for name, kind, description, value in extra:
+            if value is not None:
+                metric(name, kind, description, [("", value)])
+        return "\n".join(lines) + "\n"
+
+# Metrics of current process (web application)
+metrics = MetricsRegistry()
@@ -0,0 +1,173 @@
+"""
+    This file contains resampling of signals used by the audio loading layer.
+    Signals are resampled in float32 by one of quality tiers. Rational ratios
+    (e.g. 48 kHz -> 16 kHz) of the fast and medium tier are resampled by polyphase
+    filtering, filters are designed once per ratio and kept by the process.
+    Clips with the same sample rate can be resampled at once.
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import math
+from functools import lru_cache
+import numpy as np
+import soxr
+from scipy.signal import firwin, upfirdn
+from modules.constants import RESAMPLE_QUALITY, POLYPHASE_MAX_FACTOR, RESAMPLE_FILTERS
+
+# Polyphase filters of tiers - (zero crossings of windowed sinc on each side, beta of Kaiser window),
+# the medium tier is the filter of scipy.signal.resample_poly
+POLYPHASE_FILTERS = {"fast": (4, 5.0), "medium": (10, 5.0)}
+# soxr quality of tiers, used by the high tier, streams and ratios without a polyphase filter
+SOXR_QUALITIES = {"fast": "LQ", "medium": "MQ", "high": "HQ"}
+
+class ResamplingError(Exception):
+    """Signal can't be resampled with given parameters"""
+    pass
+
+def ratio(orig_rate: int, rate: int, quality: str) -> tuple[int, int]:
+    """
+        Upsampling and downsampling factors of a conversion
+
+        Params:
+            orig_rate:      sample rate of the signal
+            rate:           target sample rate
+            quality:        quality tier
+
+        Returns:
+            up and down factors
+    """
+    if quality not in SOXR_QUALITIES:
+        raise ResamplingError(f"Unknown quality {quality}, available qualities are {', '.join(SOXR_QUALITIES)}.")
+    if int(orig_rate) != orig_rate or int(rate) != rate or orig_rate <= 0 or rate <= 0:
+        raise ResamplingError(f"Sample rates must be positive integers, got {orig_rate} and {rate}.")
+    gcd = math.gcd(int(orig_rate), int(rate))
+    return int(rate) // gcd, int(orig_rate) // gcd
+
+def output_length(length: int, orig_rate: int, rate: int) -> int:
+    """Number of samples of a resampled signal (same as librosa.resample)"""
+    return -(-length * int(rate) // int(orig_rate))
+
+@lru_cache(maxsize=RESAMPLE_FILTERS)
+def polyphase_filter(up: int, down: int, quality: str) -> tuple[np.ndarray, int]:
+    """
+        Low-pass filter of polyphase resampling, designed once per ratio and tier
+
+        Params:
+            up:             upsampling factor
+            down:           downsampling factor
+            quality:        tier of POLYPHASE_FILTERS
+
+        Returns:
+            float32 filter delayed so that output samples are centered,
+            number of output samples of the delay
+    """
+    zeros, beta = POLYPHASE_FILTERS[quality]
+    factor = max(up, down)
+    half = zeros * factor
+    taps = firwin(2 * half + 1, 1.0 / factor, window=("kaiser", beta)) * up
+    delay = down - half % down
+    taps = np.concatenate((np.zeros(delay), taps)).astype(np.float32)
+    # shared by all calls
+    taps.flags.writeable = False
+    return taps, (half + delay) // down
+
+def is_polyphase(up: int, down: int, quality: str) -> bool:
+    """Whether a conversion is resampled by a polyphase filter, otherwise by soxr"""
+    return quality in POLYPHASE_FILTERS and max(up, down) <= POLYPHASE_MAX_FACTOR
+
+def fix_length(signals: np.ndarray, length: int) -> np.ndarray:
+    """Trims or zero pads the last axis to the length"""
+    if signals.shape[-1] >= length:
+        return signals[..., :length]
+    padding = np.zeros(signals.shape[:-1] + (length - signals.shape[-1],), dtype=signals.dtype)
+    return np.concatenate((signals, padding), axis=-1)
+
+def resample_signals(signals: np.ndarray, orig_rate: int, rate: int, quality: str) -> np.ndarray:
+    """
+        Resamples a signal or rows of a matrix of signals with the same sample rate in one call
+
+        Params:
+            signals:        signal or clips x samples matrix
+            orig_rate:      sample rate of the signals
+            rate:           target sample rate
+            quality:        quality tier
+
+        Returns:
+            float32 resampled signals
+    """
+    up, down = ratio(orig_rate, rate, quality)
+    signals = np.asarray(signals, dtype=np.float32)
+    length = output_length(signals.shape[-1], orig_rate, rate)
+    if up == down or signals.shape[-1] == 0:
+        return fix_length(signals, length)
+    if is_polyphase(up, down, quality):
+        taps, delay = polyphase_filter(up, down, quality)
+        resampled = upfirdn(taps, signals, up, down, axis=-1)[..., delay:delay + length]
+    else:
+        # rows are resampled as channels of one stream (samples x channels)
+        resampled = soxr.resample(np.ascontiguousarray(signals.T), orig_rate, rate, SOXR_QUALITIES[quality]).T
+    return fix_length(np.asarray(resampled, dtype=np.float32), length)
+
+def resample(signal: np.ndarray, orig_rate: int, rate: int, quality: str = RESAMPLE_QUALITY) -> np.ndarray:
+    """
+        Resamples a signal
+
+        Params:
+            signal:         signal
+            orig_rate:      sample rate of the signal
+            rate:           target sample rate
+            quality:        quality tier ("fast", "medium" or "high")
+
+        Returns:
+            float32 signal at target sample rate
+    """
+    return resample_signals(signal, orig_rate, rate, quality)
+
+def resample_batch(signals: list[np.ndarray], orig_rate: int, rate: int, quality: str = RESAMPLE_QUALITY) -> list[np.ndarray]:
+    """
+        Resamples clips with the same sample rate in one call, shorter clips
+        are zero padded (same result as resampling them one by one)
+
+        Params:
+            signals:        signals
+            orig_rate:      sample rate of the signals
+            rate:           target sample rate
+            quality:        quality tier ("fast", "medium" or "high")
+
+        Returns:
+            float32 signals at target sample rate
+    """
+    if not signals:
+        return list()
+    matrix = np.zeros((len(signals), max(len(signal) for signal in signals)), dtype=np.float32)
+    for row, signal in zip(matrix, signals):
+        row[:len(signal)] = signal
+    resampled = resample_signals(matrix, orig_rate, rate, quality)
+    up, down = ratio(orig_rate, rate, quality)
+    clips = list()
+    for row, signal in zip(resampled, signals):
+        # copies, so clips don't keep the whole matrix
+        clip = row[:output_length(len(signal), orig_rate, rate)].copy()
+        if not is_polyphase(up, down, quality):
+            # soxr output of a single clip is rounded and zero padded
+            clip[round(len(signal) * rate / orig_rate):] = 0
+        clips.append(clip)
+    return clips
+
+def resample_stream(orig_rate: int, rate: int, quality: str = RESAMPLE_QUALITY) -> soxr.ResampleStream:
+    """
+        Stream resampling consecutive windows of a mono signal
+
+        Params:
+            orig_rate:      sample rate of the signal
+            rate:           target sample rate
+            quality:        quality tier, windows are resampled by soxr of this tier
+
+        Returns:
+            soxr stream
+    """
+    ratio(orig_rate, rate, quality)
+    return soxr.ResampleStream(orig_rate, rate, 1, dtype="float32", quality=SOXR_QUALITIES[quality])
@@ -0,0 +1,125 @@
+"""
+    This file contains work scheduling for evaluation.
+    Meta file is read lazily and sent to the workers in chunks, only
+    a bounded number of chunks is in flight at any time.
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import os
+import concurrent.futures
+from typing import Callable, Iterable, Iterator
+from modules.constants import MAX_WORKERS, IN_FLIGHT_PER_WORKER
+
+def worker_count(max_workers: int = MAX_WORKERS) -> int:
+    """
+        Number of worker processes
+
+        Params:
+            max_workers:    requested number of workers, None for half of cpu count
+
+        Returns:
+            number of workers
+    """
+    if max_workers:
+        return max(1, int(max_workers))
+    #Max workers is set to half of cpu count by default
+    return max(1, (os.cpu_count() or 2) // 2)
+
+def read_chunks(meta: str, chunk_size: int, skip: Callable[[str], bool] = None,
+                expand: Callable[[str], list[str]] = None) -> Iterator[list[str]]:
+    """
+        Reads meta file lazily in chunks of lines
+
+        Params:
+            meta:           meta file path
+            chunk_size:     number of lines in one chunk
+            skip:           function returning True for lines which shouldn't be evaluated
+            expand:         function splitting one meta file line into several lines
+
+        Returns:
+            generator of chunks
+    """
+    chunk = list()
+    with open(meta, "r") as f:
+        for raw_line in f:
+            # expanded lines are kept in the same chunk
+            for line in expand(raw_line) if expand else [raw_line]:
+                if line.strip() and not (skip and skip(line)):
+                    chunk.append(line)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = list()
+    if chunk:
+        yield chunk
+
+def count_lines(meta: str, skip: Callable[[str], bool] = None, expand: Callable[[str], list[str]] = None) -> int:
+    """
+        Counts lines of meta file which will be evaluated
+
+        Params:
+            meta:           meta file path
+            skip:           function returning True for lines which shouldn't be evaluated
+            expand:         function splitting one meta file line into several lines
+
+        Returns:
+            number of lines
+    """
+    return sum(len(chunk) for chunk in read_chunks(meta, 1, skip, expand))
+
+def in_flight(executor: concurrent.futures.Executor) -> int:
+    """
+        Maximum number of pending tasks of an executor
+
+        Params:
+            executor:       executor running the work
+
+        Returns:
+            number of tasks
+    """
+    # executors with their own bound (e.g. queue of distributed evaluation) keep it
+    if getattr(executor, "max_pending", None):
+        return executor.max_pending
+    return IN_FLIGHT_PER_WORKER * getattr(executor, "_max_workers", 1)
+
+def run_bounded(executor: concurrent.futures.Executor, fn: Callable, chunks: Iterable, args: tuple = (),
+                max_in_flight: int = None) -> Iterator:
+    """
+        Submits chunks to the executor keeping at most max_in_flight
+        of them pending, results are yielded as soon as they are completed
+
+        Params:
+            executor:       executor running the work
+            fn:             function called as fn(chunk, *args)
+            chunks:         iterable of chunks
+            args:           additional arguments of fn
+            max_in_flight:  maximum number of pending chunks
+
+        Returns:
+            generator of results, an exception is yielded for a failed chunk
+    """
+    if not max_in_flight:
+        max_in_flight = in_flight(executor)
+    chunks = iter(chunks)
+    pending = set()
+    try:
+        while True:
+            # Fill the window
+            for chunk in chunks:
+                pending.add(executor.submit(fn, chunk, *args))
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                return
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield e
+    finally:
+        # Stopped early (e.g. cancelled evaluation), chunks not started yet are dropped
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,95 @@
+"""
+    This file contains splitting of long reference and generated audios
+    into aligned segments. Cut points are placed into pauses of the reference
+    (lowest frame energy near the target length) and mapped to the generated
+    audio using coarse feature alignment, segments can be then scored independently.
+"""
+
+__author__      = "Roman Machala"
+__date__        = "18.10.2026"
+__version__     = "0.1"
+
+import numpy as np
+import librosa
+from modules.alignment import logmel_features, banded_dtw
+from modules.constants import SEGMENT_SEARCH, SEGMENT_HOP
+
+class SegmentationError(Exception):
+    """Selected audios couldn't be split into segments"""
+    pass
+
+def frame_energy(signal: np.ndarray, hop: int) -> np.ndarray:
+    """
+        RMS energy of signal frames
+
+        Params:
+            signal:         audio signal
+            hop:            hop length in samples
+
+        Returns:
+            energy of each frame
+    """
+    return librosa.feature.rms(y=signal, frame_length=4 * hop, hop_length=hop)[0]
+
+def cut_points(energy: np.ndarray, segment_frames: int, search_frames: int) -> list[int]:
+    """
+        Frames where the audio is cut, each cut is placed to the quietest
+        frame around a multiple of the segment length
+
+        Params:
+            energy:         energy of frames
+            segment_frames: target segment length in frames
+            search_frames:  maximum distance of a cut from its target
+
+        Returns:
+            increasing list of cut frames
+    """
+    cuts = list()
+    target = segment_frames
+    # the last segment is not shorter than half of the target length
+    while target < len(energy) - segment_frames // 2:
+        lo = max(target - search_frames, cuts[-1] + 1 if cuts else 1)
+        hi = min(target + search_frames + 1, len(energy) - 1)
+        if lo >= hi:
+            break
+        cuts.append(lo + int(np.argmin(energy[lo:hi])))
+        target = cuts[-1] + segment_frames
+    return cuts
+
+def split(ref: np.ndarray, gen: np.ndarray, rate: int, segment_length: float) -> list[tuple[int, int, int, int]]:
+    """
+        Splits reference and generated signal into aligned segments
+
+        Params:
+            ref:            reference signal
+            gen:            generated signal
+            rate:           sample rate of both signals
+            segment_length: target segment length in seconds
+
+        Returns:
+            list of (ref_start, ref_stop, gen_start, gen_stop) sample ranges
+    """
+    if len(ref) == 0 or len(gen) == 0:
+        raise SegmentationError("Couldn't split an empty audio.")
+    whole = [(0, len(ref), 0, len(gen))]
+    # audios not much longer than one segment are kept whole
+    if not segment_length or len(ref) < 1.5 * segment_length * rate:
+        return whole
+
+    hop = int(rate * SEGMENT_HOP)
+    cuts = cut_points(frame_energy(ref, hop), int(segment_length / SEGMENT_HOP), int(SEGMENT_SEARCH / SEGMENT_HOP))
+    if not cuts:
+        return whole
+    # coarse alignment, the first generated frame matched with a cut frame is its counterpart
+    path = banded_dtw(logmel_features(ref, rate, hop), logmel_features(gen, rate, hop))
+    gen_cuts = path[np.searchsorted(path[:, 0], cuts), 1]
+
+    ref_bounds, gen_bounds = [0], [0]
+    for ref_cut, gen_cut in zip(cuts, gen_cuts):
+        # both cuts have to move forward, otherwise the segment is merged with the next one
+        if ref_cut * hop > ref_bounds[-1] and gen_cut * hop > gen_bounds[-1] and gen_cut * hop < len(gen):
+            ref_bounds.append(int(ref_cut * hop))
+            gen_bounds.append(int(gen_cut * hop))
+    ref_bounds.append(len(ref))
+    gen_bounds.append(len(gen))
+    return [(ref_bounds[i], ref_bounds[i + 1], gen_bounds[i], gen_bounds[i + 1]) for i in range(len(ref_bounds) - 1)]
@@ -7,6 +7,15 @@ INTRUSIVE_EVAL=true
 DATASET_PATH='none'
 META_FILE=''
 SAVE_PATH='result.json'
+ALIGNMENT='mfcc'
+RUN_ID=''
+CACHE=true
+WORKERS=''
+CHUNK_SIZE=''
+SEGMENT_LENGTH=''
+COLUMNAR=false
+PESQ_WORKERS=''
+METRICS=''
 
 # Prints usage
 usage(){
@@ -25,6 +34,26 @@ usage(){
     echo "          Path to meta file" 
     echo "      -sp | --save_path path/to/result.json [optional]"
     echo "          Specifies path to the result file, default is result.json"
+    echo "      -al | --alignment sample/mfcc/logmel [optional]"
+    echo "          Alignment mode for intrusive metrics, default is mfcc (sample is the original, slower FastDTW)"
+    echo "      -ri | --run_id ID [optional]"
+    echo "          ID of the run, an interrupted run with the same ID is resumed and evaluated lines are skipped"
+    echo "      -ca | --cache true/false [optional]"
+    echo "          Whether to reuse cached scores of unchanged audio files, default is true"
+    echo "      -w | --workers N [optional]"
+    echo "          Number of worker processes, default is half of cpu count"
+    echo "      -cs | --chunk_size N [optional]"
+    echo "          Number of meta file lines sent to a worker at once"
+    echo "      -sl | --segment_length SECONDS [optional]"
+    echo "          Long audios are split into aligned segments of about this length, segments are evaluated"
+    echo "          in parallel and aggregated per file (intrusive evaluation only)"
+    echo "      -pw | --pesq_workers N [optional]"
+    echo "          PESQ is scored in batches by a separate pool of N processes, default is 0 (scored by evaluation workers)"
+    echo "      -me | --metrics Mcd,Pesq,Stoi,Estoi,Mos [optional]"
+    echo "          Comma separated metrics to be evaluated, default is all metrics of the evaluation mode"
+    echo "          (metrics needing reference samples are skipped in non-intrusive evaluation)"
+    echo "      -co | --columnar true/false [optional]"
+    echo "          Whether to convert results into a columnar archive (.npz) used by analysis, default is false"
     echo ""
     echo "Examples:"
     echo "      ./start_eval.sh --web_mode true"
@@ -87,6 +116,51 @@ while [[ $# -gt 0 ]]; do
             shift
             shift
             ;;
+        -al|--alignment)
+            ALIGNMENT=$2
+            shift
+            shift
+            ;;
+        -ri|--run_id)
+            RUN_ID=$2
+            shift
+            shift
+            ;;
+        -ca|--cache)
+            CACHE=$2
+            shift
+            shift
+            ;;
+        -w|--workers)
+            WORKERS=$2
+            shift
+            shift
+            ;;
+        -cs|--chunk_size)
+            CHUNK_SIZE=$2
+            shift
+            shift
+            ;;
+        -sl|--segment_length)
+            SEGMENT_LENGTH=$2
+            shift
+            shift
+            ;;
+        -pw|--pesq_workers)
+            PESQ_WORKERS=$2
+            shift
+            shift
+            ;;
+        -me|--metrics)
+            METRICS=$2
+            shift
+            shift
+            ;;
+        -co|--columnar)
+            COLUMNAR=$2
+            shift
+            shift
+            ;;
         -h|--help)
             help
             exit 0
@@ -108,7 +182,7 @@ else
         exit 1
     fi
     current_setup "$WEB_MODE" "$INTRUSIVE_EVAL" "$META_FILE" "$SAVE_PATH" "$DATASET_PATH"
-    python3 audioEval.py "--meta_file $META_FILE --dataset_path $DATASET_PATH --save_path $SAVE_PATH --intrusive_eval $INTRUSIVE_EVAL"
+    python3 audioEval.py "--meta_file $META_FILE --dataset_path $DATASET_PATH --save_path $SAVE_PATH --intrusive_eval $INTRUSIVE_EVAL --alignment $ALIGNMENT${RUN_ID:+ --run_id $RUN_ID} --cache $CACHE${WORKERS:+ --workers $WORKERS}${CHUNK_SIZE:+ --chunk_size $CHUNK_SIZE}${SEGMENT_LENGTH:+ --segment_length $SEGMENT_LENGTH} --columnar $COLUMNAR${PESQ_WORKERS:+ --pesq_workers $PESQ_WORKERS}${METRICS:+ --metrics $METRICS}"
 fi
 
 
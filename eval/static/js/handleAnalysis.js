@@ -331,7 +331,7 @@ function createTable(files, values) {
 
     //Header of the table
     let headerRow = document.createElement("tr");
-    headerRow.innerHTML = `<th>File</th><th>Mean</th><th>Median</th><th>Min</th><th>Max</th>`;
+    headerRow.innerHTML = `<th>File</th><th>Mean</th><th>Median</th><th>Min</th><th>Max</th><th>Std</th><th>95% CI</th><th>P5</th><th>P95</th>`;
     thead.appendChild(headerRow);
 
     //Values filling
@@ -343,6 +343,10 @@ function createTable(files, values) {
             <td>${formatValue(fileValues[1])}</td>
             <td>${formatValue(fileValues[2])}</td>
             <td>${formatValue(fileValues[3])}</td>
+            <td>${formatValue(fileValues[4])}</td>
+            <td>${formatValue(fileValues[5])} – ${formatValue(fileValues[6])}</td>
+            <td>${formatValue(fileValues[7])}</td>
+            <td>${formatValue(fileValues[8])}</td>
         `;
         tbody.appendChild(row);
     });
@@ -9,6 +9,9 @@
  * 
  */
 
+/* ID of the running evaluation job */
+let currentJob = null;
+
 /**
  * 
  * @brief function responsible for evaluation starting
@@ -20,6 +23,8 @@ export function startEvaluation(rootFolderName) {
     const metaFile = document.getElementById("meta-file").value;
     const intrusive = document.getElementById("intrusive").checked;
     const filename = document.getElementById("save-name").value;
+    /* Selected metrics, intrusive metrics are skipped in non-intrusive evaluation */
+    const metrics = Array.from(document.querySelectorAll('input[name="metric"]:checked')).map(input => input.value);
     /* Form values, presented file, dataset path and whether to use intrusive evaluation aswell */
 
     /* If there were no values presented */
@@ -31,7 +36,7 @@ export function startEvaluation(rootFolderName) {
     fetch("/start-evaluation/", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ meta_file: metaFile, root_folder: rootFolderName, intrusive: intrusive, save_name: filename })
+        body: JSON.stringify({ meta_file: metaFile, root_folder: rootFolderName, intrusive: intrusive, save_name: filename, metrics: metrics })
     })
     .then(response => response.json())
     .then(data => {
@@ -40,8 +45,9 @@ export function startEvaluation(rootFolderName) {
             /* Hide select container and show evaluation progress */
             document.getElementById("evaluation").style.display = "block";
             document.getElementById("container").style.display = "none";
+            currentJob = data.job_id;
             disableButtonEvaluation();
-            startLogStream(); /* Streaming of logs */
+            startLogStream(currentJob); /* Streaming of job events */
         } else {
             /* If eval hasn't started correctly atleast let know */
             alert(data.message);
@@ -50,67 +56,109 @@ export function startEvaluation(rootFolderName) {
     .catch(error => console.error("Error:", error));
 }
 
+/* Final states of a job, event stream is closed after them */
+const FINAL_STATES = ["completed", "cancelled", "failed"];
+
 /**
  * 
- * @brief function responsible for handling streaming form server
+ * @param jobId ID of the evaluation job
+ * 
+ * @brief function responsible for handling event streaming from server,
+ *          browser reconnects automatically and receives missed events
  * 
  */
-function startLogStream() {
+function startLogStream(jobId) {
     const logOutput = document.getElementById("log-output");
+    const progress = document.getElementById("progress");
     logOutput.textContent = ""; /* Delete previous logs */
+    progress.textContent = "";
 
-    /* Wait for incoming log messages */
-    const eventSource = new EventSource("/log-stream/");
-    /* On new incoming message */
-    eventSource.onmessage = function(event) {
-        
-        handleLog(event.data, logOutput);
-        if (event.data === "Evaluation completed.") {
+    /* Wait for incoming events of the job */
+    const eventSource = new EventSource(`/jobs/${jobId}/events/`);
+    /* Plain log messages */
+    eventSource.addEventListener("log", function(event) {
+        appendLog(JSON.parse(event.data), logOutput);
+    });
+    /* Progress of the evaluation together with the last evaluated result */
+    eventSource.addEventListener("progress", function(event) {
+        const data = JSON.parse(event.data);
+        handleProgress(data, progress);
+        if (data.result) {
+            handleResult(data.result, logOutput);
+        }
+    });
+    /* Job state changes, stream is closed once the job has finished */
+    eventSource.addEventListener("status", function(event) {
+        const data = JSON.parse(event.data);
+        if (FINAL_STATES.includes(data.status)) {
+            if (data.status === "failed") {
+                appendLog("Evaluation failed - " + data.error, logOutput);
+            }
             enableButtonEvaluation();
             eventSource.close();
         }
-        /* Append message to the "console" and scroll to last message */
-    };
-    /* In case an error occures print to console */
+    });
+    /* In case an error occures print to console, browser reconnects by itself */
     eventSource.onerror = function() {
         console.error("Log stream disconnected.");
-        eventSource.close();
-        /* Close streaming source */
     };
 }
 
+/**
+ * 
+ * @param data progress event
+ * @param section section to display the progress
+ * 
+ * @brief displays number of evaluated lines, throughput and remaining time
+ * 
+ */
+function handleProgress(data, section){
+    let text = "Evaluated: " + data.done + (data.total !== null ? " / " + data.total : "");
+    if (data.throughput) {
+        text += " (" + data.throughput.toFixed(2) + " lines/s)";
+    }
+    if (data.eta !== null) {
+        text += ", remaining: " + Math.round(data.eta) + " s";
+    }
+    section.textContent = text;
+}
+
 /**
  * 
  * @param message received message
  * @param section section to display the message
  * 
- * @brief handles incoming messages and displays them in more structured way
+ * @brief appends a message to the "console" and scrolls to it
  * 
  */
-function handleLog(message, section){
-    try {
-        const fixedMessage = message
-            .replace(/'/g, '"')
-            .replace(/\bNone\b/g, 'null');
-        const data = JSON.parse(fixedMessage);
-        section.textContent += "Files: " + data.file + "\n";
-        Object.entries(data.metrics).forEach(([metricName, values]) => {
-            if(metricName === "Mos"){
-                section.textContent += "Mos:\n";
-                Object.entries(data.metrics.Mos).forEach(([subMetric, value]) => {
-                    section.textContent += "\t" + subMetric + ": " + value + "\n";
-                });
-            }
-            else{
-                section.textContent += metricName + ": " + values + "\n";
-            }
-        });
-        section.textContent += "\n";
-        section.scrollTop = section.scrollHeight;
-    } catch (error) {
-        section.textContent += message + "\n";
-        section.scrollTop = section.scrollHeight;
-    }
+function appendLog(message, section){
+    section.textContent += message + "\n";
+    section.scrollTop = section.scrollHeight;
+}
+
+/**
+ * 
+ * @param data evaluated result
+ * @param section section to display the result
+ * 
+ * @brief displays evaluated result in more structured way
+ * 
+ */
+function handleResult(data, section){
+    section.textContent += "Files: " + data.file + "\n";
+    Object.entries(data.metrics || {}).forEach(([metricName, values]) => {
+        if(metricName === "Mos" && values !== null && typeof values === "object"){
+            section.textContent += "Mos:\n";
+            Object.entries(values).forEach(([subMetric, value]) => {
+                section.textContent += "\t" + subMetric + ": " + value + "\n";
+            });
+        }
+        else{
+            section.textContent += metricName + ": " + values + "\n";
+        }
+    });
+    section.textContent += "\n";
+    section.scrollTop = section.scrollHeight;
 }
 
 /**
@@ -132,6 +180,7 @@ function clearInputs(){
  */
 function enableButtonEvaluation(){
     document.getElementById("evaluation-done").disabled = false;
+    document.getElementById("evaluation-cancel").disabled = true;
 }
 
 /**
@@ -141,8 +190,30 @@ function enableButtonEvaluation(){
  */
 function disableButtonEvaluation(){
     document.getElementById("evaluation-done").disabled = true;
+    document.getElementById("evaluation-cancel").disabled = false;
 }
 
+/**
+ * 
+ * @brief handles cancel button during evaluation, results evaluated so far are kept
+ * 
+ */
+document.getElementById("evaluation-cancel").addEventListener("click", function (event){
+    event.preventDefault();
+    if (!currentJob) {
+        return;
+    }
+    fetch(`/jobs/${currentJob}/cancel/`, { method: "POST" })
+    .then(response => response.json())
+    .then(data => {
+        if (data.message) {
+            alert(data.message);
+        }
+        document.getElementById("evaluation-cancel").disabled = true;
+    })
+    .catch(error => console.error("Error:", error));
+});
+
 /**
  * 
  * @brief handles continue button after finishing evalaution
@@ -8,6 +8,7 @@
 
 import { startEvaluation } from "./handleEval.js";
 import { showModal, updateModalText, hideModal } from "./handleAnalysis.js";
+import { Sha256 } from "./sha256.js";
 
 /**
  * 
@@ -19,43 +20,139 @@ document.getElementById("upload-form-audios").addEventListener("submit", functio
   uploadAudios();
 });
 
+/* Size of one uploaded chunk in bytes */
+const CHUNK_SIZE = 8 * 1024 * 1024;
+
 /**
  * 
- * @brief simple function for dataset uploading
+ * @brief simple function for dataset uploading, files already present
+ *          on the server are skipped, interrupted uploads continue
  * 
  */
 async function uploadAudios(){
   const input = document.getElementById('folderInput');
-  const formData = new FormData();
-  const files = input.files;
+  const files = Array.from(input.files);
 
   const rootFolderName = files[0].webkitRelativePath.split('/')[0];
   // uses relative paths
 
-  for (const file of files) {
-    formData.append(file.webkitRelativePath, file);
-  }
   showModal("Uploading files.");
   try{
-    // uploads files to the application
-    fetch('/upload-files', {
-      method: 'POST',
-      body: formData
-    })
-    .then(response => {
-      if (response.ok) {
-        updateModalText("Starting evaluation");
-        console.log("Files were uploaded.");
-        startEvaluation(rootFolderName);
-      } else {
-        updateModalText("Files couldn't be uploaded.");
-        console.error("Files couldn't be uploaded.");
-      }
-    });
+    // hashes are available only in secure context (https, localhost)
+    if (window.crypto && window.crypto.subtle) {
+      await uploadChunked(files);
+    } else {
+      await uploadForm(files);
+    }
+    updateModalText("Starting evaluation");
+    console.log("Files were uploaded.");
+    startEvaluation(rootFolderName);
   }catch (e){
     updateModalText("An error occured while trying to upload files");
-    console.log("An error occured while trying to upload audios");
+    console.error("An error occured while trying to upload audios", e);
+    alert("Files couldn't be uploaded.");
   }finally{
     hideModal();
   }
 }
+
+/**
+ * 
+ * @param files files to be uploaded
+ * 
+ * @brief uploads all files at once as a form
+ * 
+ */
+async function uploadForm(files){
+  const formData = new FormData();
+  for (const file of files) {
+    formData.append(file.webkitRelativePath, file);
+  }
+  const response = await fetch('/upload-files', {
+    method: 'POST',
+    body: formData
+  });
+  if (!response.ok) {
+    throw new Error("Files couldn't be uploaded.");
+  }
+}
+
+/**
+ * 
+ * @param files files to be uploaded
+ * 
+ * @brief uploads files in chunks, server is asked first which files it already has
+ * 
+ */
+async function uploadChunked(files){
+  const infos = [];
+  for (const [i, file] of files.entries()) {
+    updateModalText(`Checking files (${i + 1}/${files.length}).`);
+    infos.push({ path: file.webkitRelativePath, size: file.size, sha256: await sha256(file) });
+  }
+  const response = await fetch('/upload-check/', {
+    method: 'POST',
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ files: infos })
+  });
+  if (!response.ok) {
+    throw new Error("Files couldn't be checked.");
+  }
+  const checked = (await response.json()).files;
+
+  for (const [i, result] of checked.entries()) {
+    if (result.status === "exists" || result.status === "deduplicated") {
+      continue; // already on the server
+    }
+    updateModalText(`Uploading files (${i + 1}/${files.length}).`);
+    await uploadFile(files[i], result.offset);
+    const completed = await fetch('/upload-complete/', {
+      method: 'POST',
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ path: infos[i].path, sha256: infos[i].sha256 })
+    });
+    if (!completed.ok) {
+      throw new Error(`File ${infos[i].path} couldn't be uploaded.`);
+    }
+  }
+}
+
+/**
+ * 
+ * @param file file to be uploaded
+ * @param offset number of bytes already uploaded
+ * 
+ * @brief sends file in chunks starting at offset
+ * 
+ */
+async function uploadFile(file, offset){
+  let start = offset;
+  do {
+    const end = Math.min(start + CHUNK_SIZE, file.size);
+    const params = new URLSearchParams({ path: file.webkitRelativePath, offset: start });
+    const response = await fetch(`/upload-chunk/?${params}`, {
+      method: 'PUT',
+      body: file.slice(start, end)
+    });
+    if (!response.ok) {
+      throw new Error(`File ${file.webkitRelativePath} couldn't be uploaded.`);
+    }
+    start = (await response.json()).offset;
+  } while (start < file.size);
+}
+
+/**
+ * 
+ * @param file file to be hashed
+ * 
+ * @brief SHA-256 hash of a file as hex string, the file is read
+ *          in chunks, so large files aren't held in memory
+ * 
+ */
+async function sha256(file){
+  const hash = new Sha256();
+  for (let start = 0; start < file.size; start += CHUNK_SIZE){
+    hash.update(new Uint8Array(await file.slice(start, start + CHUNK_SIZE).arrayBuffer()));
+  }
+  return hash.hex();
+}